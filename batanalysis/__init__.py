@@ -1,4 +1,7 @@
 import os
+import re
+import importlib
+from pathlib import Path
 
 __all__ = ["batobservation", "bat_survey", "bat_tte", "batlib", "plotting", "mosaic"]
 
@@ -18,10 +21,63 @@ if caldb is None:
 
 from ._version import __version__
 
-from .batobservation import *
-from .bat_survey import *
-from .bat_tte import *
-from .batlib import *
-from .plotting import *
-from .mosaic import *
-from . import parallel
+# the submodules are only imported the first time that one of their attributes is accessed, since importing them
+# pulls in astroquery, swifttools, matplotlib, heasoftpy, scipy, etc. The order of the modules is the order that they
+# used to be star-imported in so names that are in multiple modules resolve to the same object as before.
+_star_modules = ["batobservation", "bat_survey", "bat_tte", "batlib", "plotting", "mosaic"]
+_submodules = _star_modules + ["parallel", "projection"]
+
+# maps the public functions/classes to the module that defines them, this is created from the module source files the
+# first time that it is needed so the modules do not have to be imported
+_definitions = None
+
+
+def _defining_modules():
+    """
+    Finds the module that defines each of the public top level functions and classes of the star-imported modules,
+    without importing the modules. When a name is defined in multiple modules, the last module that is star-imported is
+    used.
+
+    :return: dict of the names of the functions/classes and the module that defines them
+    """
+    global _definitions
+
+    if _definitions is None:
+        _definitions = {}
+        for module in _star_modules:
+            source = Path(__file__).parent.joinpath(f"{module}.py").read_text()
+            for name in re.findall(r"^(?:def|class)\s+([A-Za-z]\w*)", source, re.MULTILINE):
+                _definitions[name] = module
+
+    return _definitions
+
+
+def __getattr__(name):
+    if name in _submodules:
+        return importlib.import_module(f".{name}", __name__)
+
+    if name.startswith("_"):
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+    # first see if the name is a function/class that is defined in one of the modules
+    definitions = _defining_modules()
+    if name in definitions:
+        module = importlib.import_module(f".{definitions[name]}", __name__)
+        if hasattr(module, name):
+            value = getattr(module, name)
+            globals()[name] = value
+            return value
+
+    # otherwise go through the modules in the reverse order that they would have been star-imported
+    for module_name in _star_modules[::-1]:
+        module = importlib.import_module(f".{module_name}", __name__)
+        if hasattr(module, name):
+            value = getattr(module, name)
+            globals()[name] = value
+            return value
+
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+def __dir__():
+    return sorted(set(globals()) | set(_submodules) | set(_defining_modules()))
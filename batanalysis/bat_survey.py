@@ -1567,13 +1567,16 @@ class MosaicBatSurvey(BatSurvey):
         Can be access as pointing_info[pointing_id]["key"]. These values are not necessarily equal to the user defined
         parameters for the creation of the mosaic image.
     channel : list
-        List of the channel number for the survey data energy channels
+        List of the channel number for the survey data energy channels that are in the mosaic images
     emin : list
-        List of the energy lower limits for the survey data energy channels
+        List of the energy lower limits for the survey data energy channels that are in the mosaic images
     emax : list
-        List of the energy upper limits for the survey data energy channels
+        List of the energy upper limits for the survey data energy channels that are in the mosaic images
     syserr : list
-        List of the systematic errors associated with each energy channel
+        List of the systematic errors associated with each energy channel that is in the mosaic images
+    total_energy_bin : bool
+        Denotes if the mosaic images have the total 14-195 keV energy bin, which is the last image of the sky flux
+        and variance images when it is included
 
     Methods
     ---------------
@@ -1627,6 +1630,7 @@ class MosaicBatSurvey(BatSurvey):
         self.emin = [14.0, 20.0, 24.0, 35.0, 50.0, 75.0, 100.0, 150.0]
         self.emax = [20.0, 24.0, 35.0, 50.0, 75.0, 100.0, 150.0, 195.0]
         self.syserr = [0.6, 0.3, 0.15, 0.15, 0.15, 0.15, 0.15, 0.6]
+        self.total_energy_bin = True
 
         # initalize the pha filename list attribute
         self.pha_file_names_list = []
@@ -1652,12 +1656,16 @@ class MosaicBatSurvey(BatSurvey):
             if not self.result_dir.joinpath("swiftbat_exposure_c0.img").exists():
                 raise ValueError("This mosaic time bin is invalid.")
 
-            # get the number of mosaic facets
-            # self.nfacets=len(glob.glob(os.path.join(os.path.split(__file__)[0], "data",'ra_*.img')))
+            # get the number of mosaic facets from the mosaic images since the skygrids may be saved outside of the
+            # package data directory
             self.nfacets = len(
-                sorted(Path(__file__).parent.joinpath("data").glob("ra_*.img"))
+                sorted(self.result_dir.glob("swiftbat_exposure_c*.img"))
             )
 
+            # the mosaic images may only have a subset of the energy bins (see create_mosaics) so get the energy bins
+            # from the E_MIN/E_MAX values of the sky flux image headers
+            self._set_energy_bins()
+
             # need to set the mosaic pointing ID
             self.pointing_ids = ["mosaic"]
 
@@ -1668,7 +1676,8 @@ class MosaicBatSurvey(BatSurvey):
                 file = fits.open(
                     str(self.result_dir.joinpath("swiftbat_exposure_c0.img"))
                 )  # os.path.join(mosaic_dir, 'swiftbat_exposure_c0.img'))
-                file_header = file[0].header
+                # if the mosaic images are tile compressed the primary HDU is empty and the image is in the 1st extension
+                file_header = file[0].header if file[0].header.get("NAXIS", 0) > 0 else file[1].header
 
                 time_array = file_header[
                     "TSTART"
@@ -1722,6 +1731,26 @@ class MosaicBatSurvey(BatSurvey):
         else:
             self.load(load_file)
 
+    def _set_energy_bins(self):
+        """
+        Sets the channel, emin, emax, syserr, and total_energy_bin attributes to the energy bins that are in the sky
+        flux image of the first sky facet, based on the E_MIN/E_MAX values of its headers.
+
+        :return: None
+        """
+        with fits.open(str(self.result_dir.joinpath("swiftbat_flux_c0.img"))) as file:
+            edges = [
+                (i.header.get("E_MIN"), i.header.get("E_MAX")) for i in file if i.header.get("NAXIS", 0) > 0
+            ]
+
+        idx = [k for k, i in enumerate(zip(self.emin, self.emax)) if i in edges]
+
+        self.channel = [self.channel[k] for k in idx]
+        self.emin = [self.emin[k] for k in idx]
+        self.emax = [self.emax[k] for k in idx]
+        self.syserr = [self.syserr[k] for k in idx]
+        self.total_energy_bin = (14.0, 195.0) in edges
+
     def _call_batcelldetect(self, input_dict):
         """
         Call heasoftpy batcelldetect.
@@ -1890,6 +1919,17 @@ class MosaicBatSurvey(BatSurvey):
         :return: None
         """
 
+        # the PHA files use the response of all 8 survey energy channels and the rates of the detected sources are
+        # expected to have the total 14-195 keV energy bin last
+        if len(self.channel) != 8 or not self.total_energy_bin:
+            energy_bins = [f"{i}-{j}" for i, j in zip(self.emin, self.emax)]
+            if self.total_energy_bin:
+                energy_bins.append("14.0-195.0")
+            raise ValueError(
+                "PHA files can only be created for mosaics that have all of the energy bins. This mosaic only has the "
+                f"{', '.join(energy_bins)} keV energy bins."
+            )
+
         if calc_upper_lim and bkg_nsigma is None:
             raise ValueError(
                 "A value for bkg_nsigma has not been passed to the function to calculate upper limits."
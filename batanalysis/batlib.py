@@ -18,6 +18,7 @@ import dpath
 from concurrent.futures import ThreadPoolExecutor
 import functools
 import swiftbat.swutil as sbu
+from swiftbat.clockinfo import clockErrData
 
 # for python>3.6
 try:
@@ -28,6 +29,9 @@ except ModuleNotFoundError as err:
 
 _orig_pdir = os.getenv("PFILES")
 
+# the swift clock correction table, this is loaded the first time that it is needed
+_clock_data = None
+
 
 def dirtest(directory, clean_dir=True):
     """
@@ -1267,19 +1271,85 @@ def met2utc(met_time, mjd_time=None):
     MJD, which either uses the swiftbat code base which is quicker or the heasoftpy swifttime function which is slower,
     and then converts it to UTC. The user can also supply a MJD time to save on computational time.
 
-    :param met_time: a number that is the Swift MET time that will be converted
+    :param met_time: a number, or a numpy array of numbers which are all converted at once, that is the Swift MET time
+        that will be converted
     :param mjd_time: default to None, which means that the code will first calculate the MJD time and then convert it to
         UTC time. If the user already has the MJD time, they can specify it here and the function will directly
         convert it.
     :return: a numpy datetime64 object of the MET time with the Swift clock correction applied
     """
     if mjd_time is None:
+        if np.ndim(met_time) > 0:
+            # convert all the values of an array at once
+            met_time = np.asarray(met_time, dtype=np.float64)
+            met_time = met_time + _utcf(met_time)
+            return np.datetime64(sbu.swiftepoch, "us") + np.round(met_time * 1e6).astype("timedelta64[us]")
+
         mjd_time = met2mjd(met_time)
 
     atime = Time(mjd_time, format="mjd", scale="utc")
     return atime.datetime64
 
 
+def _utcf(met_time):
+    """
+    Calculates the Swift clock correction that is added to MET times to get UTC times for an array of MET times at once.
+    This is the same correction that the swiftbat code base applies to single values.
+
+    :param met_time: numpy array of Swift MET times
+    :return: numpy array of the clock corrections in seconds
+    """
+    global _clock_data
+
+    met_time = np.asarray(met_time, dtype=np.float64)
+    try:
+        if _clock_data is None:
+            _clock_data = clockErrData()
+        tstart = _clock_data._tstart
+        toffset, c0, c1, c2 = _clock_data._toffset, _clock_data._c0, _clock_data._c1, _clock_data._c2
+    except AttributeError:
+        # the clock table is not accessible so fall back to the swiftbat calculation for each value
+        return np.array([sbu.utcf(i, False, False) for i in met_time.ravel()]).reshape(met_time.shape)
+
+    if len(tstart) == 0:
+        return np.zeros_like(met_time)
+
+    # the clock table is sorted by time so get the last row that starts before each time
+    row = np.clip(np.searchsorted(tstart, met_time, side="right") - 1, 0, None)
+    ddays = (met_time - tstart[row]) / 86400.0
+    tcorr = toffset[row] + 1e-6 * (c0[row] + ddays * (c1[row] + ddays * c2[row]))
+
+    return -tcorr
+
+
+def utc2met(utc_time, correct=True):
+    """
+    A convenience function that calculates the Swift MET time from UTC times. This converts all the times of an array at
+    once and produces the same values as calling the swiftbat datetime2met function for each time.
+
+    :param utc_time: an astropy Time object, which can be an array of times, that will be converted
+    :param correct: Boolean to denote if the Swift clock correction should be applied. The default is True.
+    :return: a float or numpy array of the MET times
+    """
+    utc_time = Time(utc_time)
+
+    # calculate the time since the swift epoch split into days, seconds and microseconds to match the swiftbat
+    # calculation
+    dt = (np.atleast_1d(utc_time.utc.datetime64).astype("datetime64[us]") - np.datetime64(sbu.swiftepoch, "us")).astype(
+        np.int64
+    )
+    days, remainder = np.divmod(dt, 86400 * 1000000)
+    seconds, microseconds = np.divmod(remainder, 1000000)
+    met_time = days * 86400.0 + (seconds * 1.0 + microseconds * 1e-6)
+
+    if correct:
+        met_time -= _utcf(met_time)
+
+    if utc_time.isscalar:
+        return met_time[0]
+    return met_time.reshape(utc_time.shape)
+
+
 def save_progress(obs_list):
     """
     Convience function to save progress for a list of BatSurvey observations
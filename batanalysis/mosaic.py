@@ -1,21 +1,35 @@
 """
 This file is meant to hold the functions that allow users to create mosaic-ed images for survey data
 """
-from .batlib import dirtest, met2utc
+from .batlib import dirtest, met2utc, utc2met
 from .bat_survey import MosaicBatSurvey
+from .projection import Projection
 import numpy as np
 from astropy.time import Time
 from astropy.io import fits
+from astropy.io.fits.hdu.compressed import DITHER_SEED_CHECKSUM, SUBTRACTIVE_DITHER_2
+from astropy.table import Table
 from astropy.coordinates import SkyCoord
 from astropy import units as u
 from astropy.wcs import WCS
 from scipy.interpolate import griddata
 import pkg_resources
 import scipy.spatial.qhull as qhull
+from scipy import sparse
 from scipy.spatial import Delaunay
 from scipy.interpolate import LinearNDInterpolator
 from pathlib import Path
-import shutil
+from joblib import Parallel, delayed
+import hashlib
+import json
+from concurrent.futures import ThreadPoolExecutor
+from collections import deque
+from itertools import islice
+import os
+import sys
+import tempfile
+import time
+import zipfile
 
 # for python>3.6
 try:
@@ -36,7 +50,18 @@ _pcodethresh = 0.15  # Minimum image partial coding
 _minexpo = 150  # Minimum image exposure
 _nskyimg = 6  # Number of facets to sky image
 _nebands = 8  # Number of energy bands to process
+_emin = [14.0, 20.0, 24.0, 35.0, 50.0, 75.0, 100.0, 150.0, 14.0]  # lower edges of the mosaic energy bins (keV)
+_emax = [20.0, 24.0, 35.0, 50.0, 75.0, 100.0, 150.0, 195.0, 195.0]  # upper edges of the mosaic energy bins (keV)
 _proj = "ZEA"  # projection from idl code that is used
+_ledger_file = "mosaic_ledger.fits"  # file with the pointings that have been summed into a time bin's mosaic
+_facet_manifest_file = "mosaic_facet_manifest.fits"  # file with the sky facets of a time bin that have no pointings
+_checkpoint_file = "mosaic_checkpoint.npz"  # file with the partial sums of a time bin that is being computed
+_reproject_block_size = 4  # number of pointing images that are reprojected onto the skygrid at once
+
+# tile compression types that the mosaic images can be saved with (see _write_mosaic_hdulist). The intermediate
+# images are the accumulators of the mosaics so they are always compressed losslessly, with GZIP_2. RICE_1 can only
+# compress floating point images after they are quantized so it is only used for the final images.
+_compression_types = {"rice": "RICE_1", "gzip": "GZIP_2"}
 
 # also information to create the skygrids if the user wants
 _gcenters = np.array(
@@ -51,6 +76,13 @@ _gcenters = np.array(
     dtype="float64",
 )
 
+# the named sets of skygrids that can be used to make the mosaic images, the standard set has the resolution of the BAT
+# survey and the quicklook set can be used to make low resolution mosaics quickly
+_skygrid_sets = {
+    "standard": dict(center_resolution=2.8, galactic_boundaries=[48, 48]),
+    "quicklook": dict(center_resolution=11.2, galactic_boundaries=[48, 48]),
+}
+
 # Sco X-1 ra and dec
 _scox1_ra = 245.100
 _scox1_dec = -15.600
@@ -76,6 +108,80 @@ def interp_weights(xyz, uvw, d=2):
     return vertices, np.hstack((bary, 1 - bary.sum(axis=1, keepdims=True)))
 
 
+def regular_grid_interp_weights(grid_shape, uvw, method="barycentric"):
+    """
+    This is a function to calculate the weights for each vertex on a regular grid that will be interpolated over. This
+    returns the same vertices/weights that can be passed to the interpolate function as the interp_weights function but
+    it uses the fact that the grid being interpolated over is the regular pixel lattice of an image, ie the points
+    given by np.mgrid[0:grid_shape[0], 0:grid_shape[1]], so the cell that each point falls in can be found directly
+    instead of having to construct a Delaunay triangulation of the grid.
+
+    The Delaunay triangulation of a regular lattice is degenerate (the 4 corners of each cell are on a circle) so the
+    diagonal that qhull uses to split each cell is arbitrary. The barycentric method always splits the cell along the
+    diagonal going from pixel (i,j) to (i+1,j+1). This produces the same interpolated values as interp_weights for cells
+    where qhull choose the same diagonal and for values that vary linearly within a cell.
+
+    :param grid_shape: tuple of the (n,m) shape of the image whose pixels will be interpolated over
+    :param uvw: The (N,2) array of points, in pixel coordinates of the image, where the interpolation will be conducted
+    :param method: string denoting the type of interpolation. "barycentric" (the default) uses the 3 vertices of the
+        triangle that each point falls in, "bilinear" uses the 4 corners of the cell that each point falls in
+    :return: returns the vertices of the interpolation function (indices of the flattened image) and the weights at
+        each vertex. Points outside of the image have negative weights so they will be set to the fill value by the
+        interpolate function.
+    """
+    if method not in ["barycentric", "bilinear"]:
+        raise ValueError('The method parameter needs to be set to "barycentric" or "bilinear".')
+
+    uvw = np.asarray(uvw, dtype=np.float64)
+    nrows, ncols = grid_shape[0], grid_shape[1]
+
+    # get the cell that each point falls in, points that fall on the last row/column of pixels are placed in the last
+    # cell of the grid
+    row = uvw[:, 0]
+    col = uvw[:, 1]
+    outside = ~((row >= 0) & (row <= nrows - 1) & (col >= 0) & (col <= ncols - 1))
+    row0 = np.clip(np.floor(row), 0, nrows - 2).astype(np.int64)
+    col0 = np.clip(np.floor(col), 0, ncols - 2).astype(np.int64)
+    frac_row = row - row0
+    frac_col = col - col0
+
+    # indices of the corners of the cell in the flattened image
+    v00 = row0 * ncols + col0
+    v01 = v00 + 1
+    v10 = v00 + ncols
+    v11 = v10 + 1
+
+    if method == "bilinear":
+        vertices = np.stack((v00, v01, v10, v11), axis=1)
+        weights = np.stack(
+            (
+                (1 - frac_row) * (1 - frac_col),
+                (1 - frac_row) * frac_col,
+                frac_row * (1 - frac_col),
+                frac_row * frac_col,
+            ),
+            axis=1,
+        )
+    else:
+        # the lower triangle contains the (i+1,j) corner and the upper triangle contains the (i,j+1) corner
+        lower = frac_row >= frac_col
+        vertices = np.stack((v00, np.where(lower, v10, v01), v11), axis=1)
+        weights = np.stack(
+            (
+                1 - np.where(lower, frac_row, frac_col),
+                np.abs(frac_row - frac_col),
+                np.where(lower, frac_col, frac_row),
+            ),
+            axis=1,
+        )
+
+    # points outside of the grid get a negative weight (and a valid vertex) to be consistent with interp_weights
+    vertices[outside] = 0
+    weights[outside] = -1
+
+    return vertices, weights
+
+
 def interpolate(values, vtx, wts, fill_value=np.nan):
     """
     Function that conducts the interpolation for a set of values at points x,y,z and interpolates their corresponding
@@ -93,6 +199,63 @@ def interpolate(values, vtx, wts, fill_value=np.nan):
     return ret
 
 
+def reprojection_operator(vtx, wts, n_values):
+    """
+    Creates a sparse matrix that conducts the same interpolation as the interpolate function (with a fill value of 0)
+    when it is multiplied by the values that are interpolated over. The values can be a 2D array of shape
+    (n_values, n_images) so many images can be interpolated with a single matrix multiplication.
+
+    :param vtx: The verticies obtained from the interp_weights or regular_grid_interp_weights functions
+    :param wts: The weights obtained from the interp_weights or regular_grid_interp_weights functions
+    :param n_values: The number of points in the grid that are interpolated over (ie the size of the flattened image)
+    :return: scipy sparse CSR matrix of shape (N, n_values) where N is the number of points that are interpolated to
+    """
+    # the points outside the grid have negative weights and are given a value of zero by having no entries in the row
+    good_rows = ~np.any(wts < 0, axis=1)
+    nvertices = vtx.shape[1]
+
+    # construct the CSR arrays directly, keeping the order of the vertices so the sums are done in the same order as
+    # the interpolate function
+    indptr = np.zeros(vtx.shape[0] + 1, dtype=np.int64)
+    np.cumsum(good_rows * nvertices, out=indptr[1:])
+
+    return sparse.csr_matrix(
+        (wts[good_rows].ravel(), vtx[good_rows].ravel(), indptr),
+        shape=(vtx.shape[0], n_values),
+    )
+
+
+def _skygrid_facet_shape(center_resolution, galactic_boundaries):
+    """
+    Calculates the number of pixels along each axis of the skygrid facets with a given resolution and size.
+
+    :param center_resolution: The angular resolution of the central pixel of the sky facets in arcminutes
+    :param galactic_boundaries: The maximum size of each facet for the galactic latitude and longitude coordinates in
+        degrees
+    :return: tuple of ints of the NAXIS1 and NAXIS2 values of the facets
+    """
+    deg_resolution = center_resolution / 60  # pixel spacing
+    thxmax = galactic_boundaries[0]
+    thymax = galactic_boundaries[1]
+
+    if "ZEA" in _proj:
+        p_dth = 2 * np.rad2deg(
+            np.sin(np.deg2rad(deg_resolution / 2))
+        )  # projected pixel spacing, includes 360/pi factor in front
+        p_thxmax = 2 * np.rad2deg(
+            np.sin(np.deg2rad(thxmax / 2))
+        )  # Projected X boundary
+        p_thymax = 2 * np.rad2deg(
+            np.sin(np.deg2rad(thymax / 2))
+        )  # Projected Y boundary
+    elif "TAN" in _proj:
+        p_dth = np.tan(np.deg2rad(deg_resolution))
+        p_thxmax = np.tan(np.deg2rad(thxmax))
+        p_thymax = np.tan(np.deg2rad(thymax))
+
+    return int(np.ceil(2 * p_thxmax / p_dth)), int(np.ceil(2 * p_thymax / p_dth))
+
+
 def make_skygrids(
     center_resolution=2.8, galactic_boundaries=[48, 48], savedirectory=None
 ):
@@ -117,39 +280,23 @@ def make_skygrids(
     :param galactic_boundaries: The maximum size of each facet for the galactic latitude and longitude coordinates.
         The units for this parameter is in degrees
     :param savedirectory: Default None or Pathlib object that points to a directory that the skygrids will be saved to.
-        Default of None uses the default BATAnalysis data directory with the package.
+        Default of None uses the default skygrid directory, which is the BatAnalysis user cache directory
+        (~/.cache/batanalysis/skygrids) unless skygrids already exist in the data directory of the package.
     :return: None
     """
 
     deg_resolution = center_resolution / 60  # pixel spacing
     nimages = len(_gcenters)  # number of sky facets to make
-    thxmax = galactic_boundaries[0]
-    thymax = galactic_boundaries[1]
 
     # set up the save directory
     if savedirectory is None:
-        savedirectory = Path(__file__).parent.joinpath("data")
+        savedirectory = _skygrid_cache_dir().joinpath(_skygrid_key(center_resolution, galactic_boundaries))
     else:
         savedirectory = Path(savedirectory)
-
-    if "ZEA" in _proj:
-        p_dth = 2 * np.rad2deg(
-            np.sin(np.deg2rad(deg_resolution / 2))
-        )  # projected pixel spacing, includes 360/pi factor in front
-        p_thxmax = 2 * np.rad2deg(
-            np.sin(np.deg2rad(thxmax / 2))
-        )  # Projected X boundary
-        p_thymax = 2 * np.rad2deg(
-            np.sin(np.deg2rad(thymax / 2))
-        )  # Projected Y boundary
-    elif "TAN" in _proj:
-        p_dth = np.tan(np.deg2rad(deg_resolution))
-        p_thxmax = np.tan(np.deg2rad(thxmax))
-        p_thymax = np.tan(np.deg2rad(thymax))
+    savedirectory.mkdir(parents=True, exist_ok=True)
 
     # get the size of the x,y grid
-    naxis1 = int(np.ceil(2 * p_thxmax / p_dth))
-    naxis2 = int(np.ceil(2 * p_thymax / p_dth))
+    naxis1, naxis2 = _skygrid_facet_shape(center_resolution, galactic_boundaries)
 
     for i in range(nimages):
         # get the facet corresponding to the galactic coordinates of interest being at the center
@@ -186,17 +333,34 @@ def make_skygrids(
         header["CDELT2"] = (cdelt2, " Pixel spacing in physical units")
         header["LONPOLE"] = (180.0, " Longitude of native pole")
 
-        # convert coordinates to glat/glon and then to ra/dec
+        # convert coordinates to glat/glon and then to ra/dec, the facets are projected directly with the rotation
+        # matrices of the Projection class
         ra, dec = convert_xy2radec(xx, yy, header)
 
         for coord, val in zip(["ra", "dec"], [ra, dec]):
             file = f"{coord}_c{i}_{_proj}.img"
             save_file = savedirectory.joinpath(file)
-            fits.writeto(save_file, val, header)
+            fits.writeto(save_file, val, header, overwrite=True)
+
+    # make sure that the new skygrids are loaded the next time that they are needed
+    _skygrid_stores.pop(savedirectory.expanduser().resolve(), None)
 
     return 0
 
 
+def _read_stats_point(stats_point_file):
+    """
+    Reads the stats_point.fits file of a BAT survey observation into memory.
+
+    :param stats_point_file: Path object of the stats_point.fits file
+    :return: the primary header and the table HDU of the file
+    """
+    with fits.open(str(stats_point_file), memmap=False) as file:
+        # make sure that the table data is read before the file is closed
+        file[1].data
+        return file[0].header, file[1]
+
+
 def merge_outventory(survey_list, savedir=None):
     """
     Creates a merged outventory file in the savedir parameter which lists all the BAT surveys that will be
@@ -271,24 +435,26 @@ def merge_outventory(survey_list, savedir=None):
         "outventory_all.fits"
     )
 
-    shutil.copy(survey_list[0].result_dir.joinpath("stats_point.fits"), output_file)
-    for i in survey_list[1:]:
-        with fits.open(output_file) as hdul1:
-            with fits.open(i.result_dir.joinpath("stats_point.fits")) as hdul2:
-                nrows1 = hdul1[1].data.shape[0]
-                nrows2 = hdul2[1].data.shape[0]
-                nrows = nrows1 + nrows2
-                hdu = fits.BinTableHDU.from_columns(hdul1[1].columns, nrows=nrows)
-                for colname in hdul1[1].columns.names:
-                    hdu.data[colname][nrows1:] = hdul2[1].data[colname]
-                hdu.writeto(output_file, overwrite=True)
-
-    # now sort the file by time
-    with fits.open(output_file, mode="update") as hdul:
-        hdu = hdul[1]
-        idx = np.argsort(hdu.data['TSTART'])
-        hdu.data = hdu.data[idx]
-        hdul.flush()
+    # read all the stats_point files once, this is mostly I/O so it can be done with threads
+    with ThreadPoolExecutor() as executor:
+        stats_point_hdus = list(
+            executor.map(
+                _read_stats_point, [i.result_dir.joinpath("stats_point.fits") for i in survey_list]
+            )
+        )
+
+    # concatenate all the columns, sort them by time, and write the file once. The columns and headers of the first
+    # file are used for the merged file
+    primary_header, table_hdu = stats_point_hdus[0]
+    stats_point_data = [i[1].data for i in stats_point_hdus]
+    nrows = np.sum([len(i) for i in stats_point_data])
+    idx = np.argsort(np.concatenate([i["TSTART"] for i in stats_point_data]), kind="stable")
+
+    hdu = fits.BinTableHDU.from_columns(table_hdu.columns, header=table_hdu.header, nrows=nrows)
+    for colname in table_hdu.columns.names:
+        hdu.data[colname][:] = np.concatenate([i[colname] for i in stats_point_data])[idx]
+
+    fits.HDUList([fits.PrimaryHDU(header=primary_header), hdu]).writeto(output_file, overwrite=True)
 
     return Path(output_file)
 
@@ -308,16 +474,106 @@ def select_outventory(outventory_file, start_met, end_met):
 
     # replace the ftselect with astropy fits operations
     output_file = str(outventory_file).replace(".fits", "_sel.fits")
-    with fits.open(outventory_file) as f:
-        # identify the lines with the times of interest/images that are good and have the comparison be broadcastable
-        idx = np.where(
-            (f[1].data["TSTART"][..., None] >= start_met) & (f[1].data["TSTART"][..., None] < end_met) &
-            (f[1].data["IMAGE_STATUS"][..., None] == True))
+    outventory_index = OutventoryIndex(outventory_file)
+    outventory_index.write(outventory_index.select(start_met, end_met), output_file)
+
+
+class OutventoryIndex(object):
+    """
+    An in memory index of an outventory file. The outventory file is read once and its rows are sorted by TSTART so the
+    observations within any time bin can be found with a binary search, without reading the outventory file again or
+    writing a grouped outventory file for each time bin.
+
+    Attributes
+    ---------------
+    outventory_file : Path
+        The outventory file that is indexed
+    header : astropy Header
+        The header of the outventory table
+    data : astropy FITS_rec
+        The rows of the outventory table sorted by TSTART
+    tstart : numpy array
+        The sorted TSTART values of the rows in MET
+
+    Methods
+    ---------------
+    select(start_met, end_met):
+        Returns the good rows with TSTART values within the time bin edges in MET
+    time_bin(start, end):
+        Returns the good rows with TSTART values within the time bin edges given as astropy Time objects
+    write(rows, output_file, start_met=None, end_met=None):
+        Saves rows of the outventory to a fits file, such as a grouped outventory file of a time bin
+    """
+
+    def __init__(self, outventory_file):
+        """
+        Initializer method for the OutventoryIndex object.
+
+        :param outventory_file: Path object of the outventory file that will be indexed
+        """
+        self.outventory_file = Path(outventory_file)
+
+        with fits.open(str(self.outventory_file), memmap=False) as file:
+            self.header = file[1].header
+            data = file[1].data
+
+        # the outventory should already be sorted by merge_outventory but make sure
+        self.data = data[np.argsort(data["TSTART"], kind="stable")]
+        self.tstart = np.asarray(self.data["TSTART"])
+
+    def select(self, start_met, end_met):
+        """
+        Returns the rows of the outventory with TSTART values in the time bin(s) [start_met, end_met) and a good
+        IMAGE_STATUS.
+
+        :param start_met: float or array of the start time bin edges in MET
+        :param end_met: float or array of the end time bin edges in MET
+        :return: astropy FITS_rec of the selected rows, sorted by TSTART
+        """
+        start_met = np.atleast_1d(start_met)
+        end_met = np.atleast_1d(end_met)
+
+        lower = np.searchsorted(self.tstart, start_met, side="left")
+        upper = np.searchsorted(self.tstart, end_met, side="left")
+
+        # rows that fall in multiple time bins are included multiple times, the same as select_outventory did before
+        idx = np.sort(np.concatenate([np.arange(i, j) for i, j in zip(lower, upper)]).astype(int))
+        idx = idx[self.data["IMAGE_STATUS"][idx] == True]
 
-        # save the headers of the original outventory file and then copy them to the new output file
-        hdu = f[1]
-        hdu.data = hdu.data[idx[0]]
-        hdu.writeto(output_file)
+        return self.data[idx]
+
+    def time_bin(self, start, end):
+        """
+        Returns the rows of the outventory with TSTART values in the time bin(s) between start and end and a good
+        IMAGE_STATUS.
+
+        :param start: astropy Time of the start time bin edge(s)
+        :param end: astropy Time of the end time bin edge(s)
+        :return: astropy FITS_rec of the selected rows, sorted by TSTART
+        """
+        start_met = utc2met(start)
+        end_met = utc2met(end)
+
+        return self.select(start_met, end_met)
+
+    def write(self, rows, output_file, start_met=None, end_met=None):
+        """
+        Saves rows of the outventory to a fits file with the same headers as the outventory table.
+
+        :param rows: astropy FITS_rec of the rows that will be saved, from the select or time_bin methods
+        :param output_file: Path object of the file that will be created
+        :param start_met: None or a float of the start of the time bin in MET that is saved in the S_TBIN keyword
+        :param end_met: None or a float of the end of the time bin in MET that is saved in the E_TBIN keyword
+        :return: None
+        """
+        hdu = fits.BinTableHDU(data=rows, header=self.header)
+
+        if start_met is not None:
+            hdu.header["S_TBIN"] = (float(start_met), "Mosaicing Start of Time Bin (MET)")
+        if end_met is not None:
+            hdu.header["E_TBIN"] = (float(end_met), "Mosaicing End of Time Bin (MET)")
+
+        hdu.writeto(str(output_file))
 
 
 def group_outventory(
@@ -328,7 +584,8 @@ def group_outventory(
     recalc=False,
     mjd_savedir=False,
     custom_timebins=None,
-    save_group_outventory=True
+    save_group_outventory=True,
+    write_grouped_files=True,
 ):
     """
     This function groups the observations listed in an outventory file together based on time bins that each observation
@@ -365,6 +622,10 @@ def group_outventory(
     :param save_group_outventory: a Boolean that denotes whether the grouped outventory files for each time bin and the
         associated directories to hold the mosaic results for the time bins will be created. If this is set to False,
         these will not be created but the calculated time_bins will be returned
+    :param write_grouped_files: a Boolean that denotes whether the grouped outventory files for each time bin are
+        written when save_group_outventory is True. If this is set to False, only the directories to hold the mosaic
+        results for the time bins are created and the observations of each time bin should be obtained from an
+        OutventoryIndex object that is passed to create_mosaics or batmosaic_analysis.
     :return: astropy Time array of the time bin edges that are created based on the user specification. This can be
         passed directly to the create_mosaic function.
     """
@@ -426,11 +687,12 @@ def group_outventory(
             # use the swift launch date
             # launch_time = Time("2004-12-01")
             # start_datetime=launch_time
+            # parse all the dates at once
             with fits.open(str(outventory_file)) as file:
-                t = [Time(i, format="isot", scale="utc") for i in file[1].data["DATE_OBS"]]
+                t = Time(np.asarray(file[1].data["DATE_OBS"]), format="isot", scale="utc")
 
             # get the min date and get the ymdhms to modify
-            t = Time(t).min()
+            t = t.min()
             tholder = t.min().ymdhms
 
             # get the date to start at the beginning of the day
@@ -525,6 +787,16 @@ def group_outventory(
                 # this accounts for having the list of just the starting bin edges or the end bin edges
                 loop_iters = len(time_bins)
 
+            # read the outventory file once and use it to select the outventory enteries of each time bin
+            if write_grouped_files:
+                outventory_index = OutventoryIndex(outventory_file)
+
+            # convert all the time bin edges from utc times to MET at once
+            if not time_bins_is_list:
+                time_bins_met = utc2met(time_bins)
+            else:
+                time_bins_met = [utc2met(i) for i in time_bins]
+
             # loop over time bins to select the appropriate outventory enteries
             for i in range(loop_iters):
                 # print(i)
@@ -532,55 +804,44 @@ def group_outventory(
                     start = time_bins[i]
                     end = time_bins[i + 1]
 
-                    # convert from utc times to mjd and then from mjd to MET
-                    start_met = sbu.datetime2met(start.datetime, correct=True)
+                    # get the MET of the time bin edges
+                    start_met = time_bins_met[i]
 
-                    end_met = sbu.datetime2met(end.datetime, correct=True)
+                    end_met = time_bins_met[i + 1]
                 else:
                     start = time_bins[i][0,0]
                     end = time_bins[i][1,0]
 
-                    # convert the start time bins edges to met times
-                    start_met = [sbu.datetime2met(j.datetime, correct=True) for j in time_bins[i][0,:]]
+                    # get the MET of the start time bins edges
+                    start_met = time_bins_met[i][0, :]
 
-                    # convert the end time bins edges to met times
-                    end_met = [sbu.datetime2met(j.datetime, correct=True) for j in time_bins[i][1,:]]
+                    # get the MET of the end time bins edges
+                    end_met = time_bins_met[i][1, :]
 
-                select_outventory(outventory_file, start_met, end_met)
+                if write_grouped_files:
+                    rows = outventory_index.select(start_met, end_met)
 
-                if time_bins_is_list:
-                    # after selecting the array of times for the grouped outventory when we have a list passed in
-                    # we need to set start_met and end_met to a single value for updating the header values
-                    start_met = start_met[0]
-                    end_met = end_met[0]
+                    if time_bins_is_list:
+                        # after selecting the array of times for the grouped outventory when we have a list passed in
+                        # we need to set start_met and end_met to a single value for updating the header values
+                        start_met = start_met[0]
+                        end_met = end_met[0]
 
-                # move the outventory file to the folder where we will keep them
-                output_file = Path(str(outventory_file).replace(".fits", "_sel.fits"))
-                if not mjd_savedir:
-                    savefile = savedir.joinpath(
-                        output_file.name.replace(
-                            "_sel.fits", f"_{start.datetime64.astype('datetime64[D]')}.fits"
+                    # save the outventory enteries in the folder where we will keep them
+                    if not mjd_savedir:
+                        savefile = savedir.joinpath(
+                            outventory_file.name.replace(
+                                ".fits", f"_{start.datetime64.astype('datetime64[D]')}.fits"
+                            )
                         )
-                    )
-                else:
-                    savefile = savedir.joinpath(
-                        output_file.name.replace(
-                            "_sel.fits", f"_{start.mjd}.fits"
+                    else:
+                        savefile = savedir.joinpath(
+                            outventory_file.name.replace(
+                                ".fits", f"_{start.mjd}.fits"
+                            )
                         )
-                    )
 
-                output_file.rename(savefile)
-
-                with fits.open(str(savefile), mode="update") as file:
-                    file[1].header["S_TBIN"] = (
-                        float(start_met),
-                        "Mosaicing Start of Time Bin (MET)",
-                    )
-                    file[1].header["E_TBIN"] = (
-                        float(end_met),
-                        "Mosaicing End of Time Bin (MET)",
-                    )
-                    file.flush()
+                    outventory_index.write(rows, savefile, start_met=start_met, end_met=end_met)
 
                 # create the directories that will hold all the mosaiced images within a given time bin
                 if not mjd_savedir:
@@ -597,58 +858,333 @@ def group_outventory(
     return time_bins
 
 
-def read_skygrids(savedirectory=None):
+def _memmap_cache(name, source_files, read_func, cache_dir):
+    """
+    Returns a read-only memory mapped version of a constant array (such as the skygrids or the corrections map) that is
+    backed by a .npy file. The .npy file is created from the array returned by read_func the first time that this is
+    called and whenever one of the source files is newer than it. Since the memory mapped array is backed by a file,
+    joblib workers attach to the file instead of receiving a copy of the array.
+
+    :param name: string of the name of the .npy file, without the extension
+    :param source_files: list of Path objects of the files that the array is read from
+    :param read_func: function with no arguments that reads the array from the source files
+    :param cache_dir: Path object of the directory where the .npy file is saved. If the directory cannot be written to,
+        the system's temporary directory is used instead.
+    :return: read-only numpy memmap array
     """
-    Reads the skygrids that the user may have made using the make_skygrids function.
+    source_mtime = max(i.stat().st_mtime for i in source_files)
 
-    :param savedirectory: Default None or a Path object to the location of the directory that contains all the skygrids
-        that will be read in
-    :return: numpy arrays of the ra/dec coordinates in degrees of the skygrid facets that are read in. the shape is (n,m,n_facets),
-        where nxm is the size of each facet and n_facet corresponds to the number of facets that has been created.
+    for directory in [Path(cache_dir), Path(tempfile.gettempdir()).joinpath("batanalysis_shared_cache")]:
+        cache_file = directory.joinpath(f"{name}.npy")
+        if cache_file.exists() and cache_file.stat().st_mtime >= source_mtime:
+            return np.load(cache_file, mmap_mode="r")
+
+        try:
+            directory.mkdir(parents=True, exist_ok=True)
+            # write to a temporary file first so other processes never see a partially written file
+            tmp_file = directory.joinpath(f"{name}.{os.getpid()}.tmp.npy")
+            np.save(tmp_file, read_func())
+            os.replace(tmp_file, cache_file)
+        except OSError:
+            continue
+
+        return np.load(cache_file, mmap_mode="r")
+
+    raise OSError(f"The memory mapped {name} array could not be saved to {cache_dir} or the temporary directory.")
+
+
+class SkygridStore(object):
+    """
+    Holds the skygrid facets that are saved in a directory. The first time that the skygrids are loaded, the RA/DEC
+    values of the facets are converted from the FITS files into .npy files, and the headers of the facets are saved as
+    text, in a "shared_cache" directory. After that, the skygrids are loaded as read-only memory mapped arrays so
+    processes that load the same skygrids share the same memory. Use _get_skygrid_store to get the SkygridStore object
+    of a directory that is kept for the whole python session.
+
+    Attributes
+    ---------------
+    directory : Path
+        The directory with the ra_c*_ZEA.img/dec_c*_ZEA.img skygrid files
+    cache_dir : Path
+        The directory where the .npy files and headers are saved
+    ra_skygrid : numpy memmap
+        The RA values in degrees of the skygrid facets with a shape of (n,m,n_facets)
+    dec_skygrid : numpy memmap
+        The DEC values in degrees of the skygrid facets with a shape of (n,m,n_facets)
+    headers : list of astropy Header
+        The headers of the skygrid facets
+    shape : tuple
+        The shape of the skygrid (n,m,n_facets)
+
+    Methods
+    ---------------
+    load():
+        Loads the skygrids and the headers of the facets if they have not been loaded yet
     """
-    # reads the skygrids and output numpy array that contains all the data
 
-    # get the directory that the data directory is located in
-    if savedirectory is None:
-        dir = Path(__file__).parent
+    def __init__(self, directory):
+        """
+        Initializer method for the SkygridStore object.
+
+        :param directory: Path object of the directory with the skygrid files
+        """
+        self.directory = Path(directory)
+        self.cache_dir = self.directory.joinpath("shared_cache")
+
+        self._ra_skygrid = None
+        self._dec_skygrid = None
+        self._headers = None
+
+    @property
+    def source_files(self):
+        return [
+            self.directory.joinpath(f"{coord}_c{i}_{_proj}.img")
+            for coord in ["ra", "dec"]
+            for i in range(_nskyimg)
+        ]
+
+    @property
+    def ra_skygrid(self):
+        self.load()
+        return self._ra_skygrid
+
+    @property
+    def dec_skygrid(self):
+        self.load()
+        return self._dec_skygrid
+
+    @property
+    def headers(self):
+        self.load()
+        return self._headers
+
+    @property
+    def shape(self):
+        return self.ra_skygrid.shape
+
+    def _read_fits(self):
+        """
+        Reads the skygrids and the headers of the facets from the FITS files.
+
+        :return: numpy arrays of the ra/dec coordinates of the skygrid facets and a list of the facet headers
+        """
+        ra_skygrid = None
+        headers = []
+
+        # create the filenames and read in the data
+        for i in range(_nskyimg):
+            string = "c%d_%s" % (i, _proj)
+
+            with fits.open(str(self.directory.joinpath(f"ra_{string}.img"))) as file:
+                if ra_skygrid is None:
+                    # allocate arrays to hold data based on the size of the first facet
+                    ra_skygrid = np.zeros(file[0].data.shape + (_nskyimg,))
+                    dec_skygrid = np.zeros_like(ra_skygrid)
+                ra_skygrid[:, :, i] = file[0].data
+                headers.append(file[0].header)
+
+            with fits.open(str(self.directory.joinpath(f"dec_{string}.img"))) as file:
+                dec_skygrid[:, :, i] = file[0].data
+
+        return ra_skygrid, dec_skygrid, headers
+
+    def load(self):
+        """
+        Loads the skygrids and the headers of the facets if they have not been loaded yet. The FITS files are only read
+        if the cached files do not exist or if they are older than the FITS files.
+
+        :return: None
+        """
+        if self._headers is not None:
+            return
+
+        source_files = self.source_files
+        missing_files = [i for i in source_files if not i.exists()]
+        if len(missing_files) > 0:
+            raise FileNotFoundError(f"The skygrid files {missing_files} do not exist. Use make_skygrids to create them.")
+
+        # only read the fits files once, if any of the cached files need to be created
+        fits_data = []
+
+        def read_fits(index):
+            if len(fits_data) == 0:
+                fits_data.extend(self._read_fits())
+            return fits_data[index]
+
+        self._ra_skygrid = _memmap_cache(f"ra_skygrid_{_proj}", source_files, lambda: read_fits(0), self.cache_dir)
+        self._dec_skygrid = _memmap_cache(f"dec_skygrid_{_proj}", source_files, lambda: read_fits(1), self.cache_dir)
+
+        # the headers are saved as a list of the header strings
+        header_file = self.cache_dir.joinpath(f"skygrid_headers_{_proj}.json")
+        source_mtime = max(i.stat().st_mtime for i in source_files)
+        if header_file.exists() and header_file.stat().st_mtime >= source_mtime:
+            with open(header_file) as file:
+                self._headers = [fits.Header.fromstring(i) for i in json.load(file)]
+        else:
+            headers = read_fits(2)
+            try:
+                self.cache_dir.mkdir(parents=True, exist_ok=True)
+                tmp_file = self.cache_dir.joinpath(f"{header_file.name}.{os.getpid()}.tmp")
+                with open(tmp_file, "w") as file:
+                    json.dump([i.tostring() for i in headers], file)
+                os.replace(tmp_file, header_file)
+            except OSError:
+                pass
+            self._headers = headers
+
+
+# the SkygridStore objects that have been loaded during the python session, the keys are the skygrid directories
+_skygrid_stores = {}
+
+
+def _user_cache_dir():
+    """
+    Gets the BatAnalysis user cache directory. This is $BATANALYSIS_CACHE_DIR if the environment variable is set,
+    otherwise it is $XDG_CACHE_HOME/batanalysis (where XDG_CACHE_HOME defaults to ~/.cache).
+
+    :return: Path object of the user cache directory
+    """
+    if "BATANALYSIS_CACHE_DIR" in os.environ:
+        cache_dir = Path(os.environ["BATANALYSIS_CACHE_DIR"])
     else:
-        dir = Path(savedirectory)
+        cache_dir = Path(os.environ.get("XDG_CACHE_HOME", Path("~").joinpath(".cache"))).joinpath("batanalysis")
 
-    nimages = len(_gcenters)  # number of sky facets
+    return cache_dir.expanduser().resolve()
 
-    # get the size of the first one for us to allocate an array for
-    string = "c%d_%s" % (0, _proj)
-    ra_string = "ra_" + string + ".img"
-    ra_file = dir.joinpath("data").joinpath(ra_string)
-    with fits.open(str(ra_file)) as file:
-        grid_shape = file[0].data.shape
 
-    # allocate arrays to hold data, already know sizes of the skygrids from lookng at them before
-    ra_skygrid = np.zeros((grid_shape[0], grid_shape[1], nimages))
-    dec_skygrid = np.zeros_like(ra_skygrid)
+def _skygrid_cache_dir():
+    """
+    Gets the user cache directory where the default skygrids are saved, which is the skygrids directory within the
+    BatAnalysis user cache directory (see _user_cache_dir).
 
-    # create the filenames and read in the data
-    for i in range(_nskyimg):
-        string = "c%d_%s" % (i, _proj)
-        ra_string = "ra_" + string + ".img"
-        dec_string = "dec_" + string + ".img"
+    :return: Path object of the skygrid cache directory
+    """
+    return _user_cache_dir().joinpath("skygrids")
 
-        ra_file = dir.joinpath("data").joinpath(
-            ra_string
-        )
-        dec_file = dir.joinpath("data").joinpath(
-            dec_string
+
+def _skygrid_key(center_resolution, galactic_boundaries):
+    """
+    Creates the name of the directory in the skygrid cache directory where the skygrids with a given resolution and size
+    are saved.
+
+    :param center_resolution: The angular resolution of the central pixel of the sky facets in arcminutes
+    :param galactic_boundaries: The maximum size of each facet for the galactic latitude and longitude coordinates in
+        degrees
+    :return: string of the directory name
+    """
+    return f"{_proj}_{center_resolution:g}arcmin_{galactic_boundaries[0]:g}x{galactic_boundaries[1]:g}deg"
+
+
+def _skygrids_match(directory, center_resolution, galactic_boundaries):
+    """
+    Checks if a directory has all the skygrid files and if the facets have the shape and pixel spacing of the skygrids
+    with a given resolution and size, so skygrids with a different resolution are not used in their place.
+
+    :param directory: Path object of the directory with the skygrid files
+    :param center_resolution: The angular resolution of the central pixel of the sky facets in arcminutes
+    :param galactic_boundaries: The maximum size of each facet for the galactic latitude and longitude coordinates in
+        degrees
+    :return: Boolean of if the skygrids in the directory match
+    """
+    naxis1, naxis2 = _skygrid_facet_shape(center_resolution, galactic_boundaries)
+
+    for filename in SkygridStore(directory).source_files:
+        try:
+            header = fits.getheader(str(filename))
+        except (FileNotFoundError, OSError):
+            return False
+
+        if (
+            header.get("NAXIS1") != naxis1
+            or header.get("NAXIS2") != naxis2
+            or not np.isclose(abs(header.get("CDELT1", 0)), center_resolution / 60)
+            or not np.isclose(abs(header.get("CDELT2", 0)), center_resolution / 60)
+        ):
+            return False
+
+    return True
+
+
+def _skygrid_set_dir(grid_set="standard"):
+    """
+    Gets the directory of a named set of skygrids (see _skygrid_sets). The skygrids of each set are saved in the user
+    cache directory under a key with their resolution and size. For the standard set, skygrids that were created in
+    the package data directory by older versions of BatAnalysis are still used if they have the standard resolution
+    and size.
+
+    :param grid_set: string of the name of the set of skygrids
+    :return: Path object of the directory of the set of skygrids
+    """
+    if grid_set not in _skygrid_sets:
+        raise ValueError(
+            f"The grid_set {grid_set} is not one of the skygrid sets: {', '.join(_skygrid_sets.keys())}"
         )
 
-        file = fits.open(str(ra_file))
-        ra_skygrid[:, :, i] = file[0].data
-        file.close()
+    if grid_set == "standard":
+        package_data_dir = Path(__file__).parent.joinpath("data")
+        if _skygrids_match(package_data_dir, **_skygrid_sets[grid_set]):
+            return package_data_dir.resolve()
+
+    return _skygrid_cache_dir().joinpath(_skygrid_key(**_skygrid_sets[grid_set]))
+
+
+def _get_skygrid_store(directory=None, grid_set="standard"):
+    """
+    Gets the SkygridStore object of a directory with skygrid files. The same object is returned each time that this is
+    called with the same directory during a python session, so the skygrids are only loaded once. If the skygrids of a
+    named set are requested and they do not exist yet, they are created with make_skygrids.
+
+    :param directory: Default None or a Path object of the directory with the skygrid files. The default is the
+        directory of the set of skygrids given by grid_set.
+    :param grid_set: string, default "standard", of the name of the set of skygrids (see _skygrid_sets) that is used
+        when directory is None
+    :return: SkygridStore object
+    """
+    if directory is None:
+        directory = _skygrid_set_dir(grid_set)
+
+        # the skygrids of a set are only created the first time that they are needed
+        if not all(i.exists() for i in SkygridStore(directory).source_files):
+            print(f"Creating the {grid_set} skygrids in {directory}")
+            make_skygrids(**_skygrid_sets[grid_set], savedirectory=directory)
+            print(f"Completed creating the {grid_set} skygrids")
+
+    directory = Path(directory).expanduser().resolve()
+
+    if directory not in _skygrid_stores:
+        _skygrid_stores[directory] = SkygridStore(directory)
+
+    return _skygrid_stores[directory]
+
+
+def read_skygrids(savedirectory=None, mmap=False, grid_set="standard"):
+    """
+    Reads the skygrids that the user may have made using the make_skygrids function. The skygrids are loaded once per
+    python session (see the SkygridStore class).
+
+    :param savedirectory: Default None or a Path object to the location of the directory that contains all the skygrids
+        that will be read in
+    :param mmap: Boolean False by default. If True, the read-only memory mapped arrays of the SkygridStore are returned
+        which are backed by .npy files saved in a "shared_cache" directory within the skygrid data directory. These
+        arrays can be passed to joblib workers without being copied to each process. Otherwise, copies of the arrays are
+        returned.
+    :param grid_set: string, default "standard", of the name of the set of skygrids (see _skygrid_sets) that is read
+        when savedirectory is None. The skygrids of the set are created the first time that they are needed.
+    :return: numpy arrays of the ra/dec coordinates in degrees of the skygrid facets that are read in. the shape is (n,m,n_facets),
+        where nxm is the size of each facet and n_facet corresponds to the number of facets that has been created.
+    """
+    # reads the skygrids and output numpy array that contains all the data
+
+    # get the directory that the skygrids are located in
+    if savedirectory is None:
+        store = _get_skygrid_store(grid_set=grid_set)
+    else:
+        store = _get_skygrid_store(Path(savedirectory).joinpath("data"))
 
-        file = fits.open(str(dec_file))
-        dec_skygrid[:, :, i] = file[0].data
-        file.close()
+    if mmap:
+        return store.ra_skygrid, store.dec_skygrid
 
-    return ra_skygrid, dec_skygrid
+    return np.array(store.ra_skygrid), np.array(store.dec_skygrid)
 
 
 def convert_radec2xy(ra, dec, header):
@@ -660,7 +1196,12 @@ def convert_radec2xy(ra, dec, header):
     :param header: The header that will be used to extract astrometric keywords to convert RA/DEC to detector pixel coordinates
     :return: numpy arrays of x and y in detector pixel coordinates
     """
-    # use the astropy WCS object to convert from ra and dec to x,y
+    # the ZEA/TAN projections of the survey images and skygrids are calculated directly (see the Projection class),
+    # which gives the same results as the astropy WCS object
+    if Projection.supports(header):
+        return Projection(header).world2pix(ra, dec, origin=0)
+
+    # otherwise use the astropy WCS object to convert from ra and dec to x,y
 
     # make the WCS object
     w = WCS(header)
@@ -688,7 +1229,12 @@ def convert_xy2radec(x, y, header):
         coordinates
     :return: numpy arrays of RA/DEC in degrees
     """
-    # use the astropy WCS object to convert from x,y to ra and dec
+    # the ZEA/TAN projections of the survey images and skygrids are calculated directly (see the Projection class),
+    # galactic coordinates are converted to FK5 RA/DEC with the same rotation as astropy
+    if Projection.supports(header):
+        return Projection(header, fk5=True).pix2world(x, y, origin=0)
+
+    # otherwise use the astropy WCS object to convert from x,y to ra and dec
 
     # make the WCS object
     w = WCS(header)
@@ -709,11 +1255,669 @@ def convert_xy2radec(x, y, header):
 
     return ra, dec
 
-def read_correctionsmap():
+
+def _hash_pointing_files(hash_obj, data_directory, pointing_id, ncleaniter):
+    """
+    Adds the paths, sizes and modification times of the sky flux and variance images of a pointing to a hash, so the
+    hash changes if the pointing is analyzed again.
+
+    :param hash_obj: hashlib hash object that is updated
+    :param data_directory: Path object of the directory of the pointing
+    :param pointing_id: string of the pointing ID
+    :param ncleaniter: int of the number of cleaning iterations of the batsurvey analysis
+    :return: None
+    """
+    for suffix in ["img", "var"]:
+        filename = Path(data_directory).joinpath(f"{pointing_id}_{ncleaniter}.{suffix}").resolve()
+        try:
+            stat = filename.stat()
+            hash_obj.update(f"{filename}={stat.st_size},{stat.st_mtime_ns};".encode())
+        except FileNotFoundError:
+            hash_obj.update(f"{filename}=None;".encode())
+
+
+def _hash_mosaic_inputs(hash_obj, corrections_map, ra_skygrid, dec_skygrid, energy_bands=None):
+    """
+    Adds the mosaic constants, the energy bins and coarse samplings of the skygrid and the corrections map to a hash, so
+    values calculated for different skygrids or corrections maps are not mixed up.
+
+    :param hash_obj: hashlib hash object that is updated
+    :param corrections_map: numpy array with the energy dependent off-axis corrections map
+    :param ra_skygrid: numpy array of the skygrid facets' RA values in degrees
+    :param dec_skygrid: numpy array of the skygrid facets' DEC values in degrees
+    :param energy_bands: None or list of ints of the mosaic energy bins (see _energy_band_indices). Default is all
+        of them.
+    :return: None
+    """
+    hash_obj.update(
+        f"{_pcodethresh};{_minexpo};{_nebands};{ra_skygrid.shape};{corrections_map.shape};"
+        f"{_energy_band_indices(energy_bands)};".encode()
+    )
+
+    # sample the skygrid and corrections map to differentiate ones that have the same shape
+    stride = max(1, ra_skygrid.shape[0] // 16)
+    for grid in [ra_skygrid, dec_skygrid, corrections_map]:
+        hash_obj.update(
+            np.ascontiguousarray(grid[::stride, ::stride], dtype=np.float64).tobytes()
+        )
+
+
+class InterpWeightCache(object):
+    """
+    An on-disk cache of the skygrid pixels, interpolation vertices and interpolation weights that are used to project a
+    BAT survey pointing image onto the skygrid facets. These only depend on the astrometric header keywords of the
+    pointing image and on the skygrid so a pointing that has been mosaiced before does not need to be reprojected again
+    when it is included in a new mosaic (eg when the time binning is changed or when the mosaics are recalculated).
+
+    Each entry is saved as a .npz file named with the hash of the astrometric keywords. The total size of the cache is
+    bound by max_size and the least recently used entries are removed when the cache becomes larger than this. The
+    cache directory is only scanned the first time that an entry is saved and when the cache becomes too large, in
+    between the size of the cache is kept track of as entries are saved.
+
+    Attributes
+    ---------------
+    cache_dir : Path
+        The directory where the cached interpolation weights are saved
+    max_size : float
+        The maximum size of the cache in GB
+
+    Methods
+    ---------------
+    key(header, pointing_shape, ra_skygrid, dec_skygrid):
+        Returns the key of the cache entry for a pointing image
+    get(key):
+        Returns the cached skygrid pixels, vertices, and weights for the key or None if they have not been cached
+    put(key, pixel_idx, vtx, wts, skygrid_shape):
+        Saves the skygrid pixels, vertices, and weights for the key
+    """
+
+    # the header keywords that determine where a pointing image falls on the sky
+    _astrometric_keywords = [
+        "NAXIS1",
+        "NAXIS2",
+        "CTYPE1",
+        "CTYPE2",
+        "CUNIT1",
+        "CUNIT2",
+        "CRPIX1",
+        "CRPIX2",
+        "CRVAL1",
+        "CRVAL2",
+        "CDELT1",
+        "CDELT2",
+        "CROTA2",
+        "PC1_1",
+        "PC1_2",
+        "PC2_1",
+        "PC2_2",
+        "CD1_1",
+        "CD1_2",
+        "CD2_1",
+        "CD2_2",
+        "LONPOLE",
+        "LATPOLE",
+        "EQUINOX",
+        "RADESYS",
+        "RADECSYS",
+    ]
+
+    def __init__(self, cache_dir, max_size=20):
+        """
+        Initializer method for the InterpWeightCache object.
+
+        :param cache_dir: Path object of the directory that the cached interpolation weights will be saved to
+        :param max_size: float of the maximum size of the cache in GB
+        """
+        self.cache_dir = Path(cache_dir)
+        self.max_size = max_size
+
+        # the running total of the size of the cache in bytes, this is None until the cache directory is scanned
+        self._size = None
+
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+
+    def key(self, header, pointing_shape, ra_skygrid, dec_skygrid):
+        """
+        Creates the key for the cached interpolation weights of a pointing from the astrometric header keywords of the
+        pointing image. A coarse sampling of the skygrid is also included so weights calculated for different skygrids
+        are not mixed up.
+
+        :param header: The astropy header of the pointing image
+        :param pointing_shape: tuple of the shape of the pointing image
+        :param ra_skygrid: numpy array of the skygrid facets' RA values in degrees
+        :param dec_skygrid: numpy array of the skygrid facets' DEC values in degrees
+        :return: string of the hash that is the key for the cache entry
+        """
+        hash_obj = hashlib.sha1()
+        for keyword in self._astrometric_keywords:
+            hash_obj.update(f"{keyword}={header.get(keyword)!r};".encode())
+        hash_obj.update(f"shape={tuple(pointing_shape)};{ra_skygrid.shape};".encode())
+
+        # sample the skygrid to differentiate skygrids that have the same shape
+        stride = max(1, ra_skygrid.shape[0] // 16)
+        for grid in [ra_skygrid, dec_skygrid]:
+            hash_obj.update(
+                np.ascontiguousarray(grid[::stride, ::stride], dtype=np.float64).tobytes()
+            )
+
+        return hash_obj.hexdigest()
+
+    def _filename(self, key):
+        return self.cache_dir.joinpath(f"{key}.npz")
+
+    def get(self, key):
+        """
+        Reads the cached skygrid pixels, vertices, and weights for a pointing.
+
+        :param key: string of the key of the cache entry, see the key method
+        :return: None if the entry is not cached otherwise a tuple of the skygrid pixel indices (in the format returned
+            by np.where), the vertices, and the weights
+        """
+        filename = self._filename(key)
+        try:
+            with np.load(filename) as data:
+                pixel_idx = np.unravel_index(data["pixel_idx"], tuple(data["skygrid_shape"]))
+                vtx = data["vtx"].astype(np.int64)
+                wts = data["wts"]
+        except FileNotFoundError:
+            return None
+        except (OSError, KeyError, ValueError, zipfile.BadZipFile):
+            # the entry is truncated or corrupt, eg if the process that wrote it was killed, so it is treated as a miss
+            # and removed
+            self._remove(filename)
+            return None
+
+        # update the access time of the file so it is considered recently used
+        try:
+            os.utime(filename)
+        except OSError:
+            pass
+
+        return pixel_idx, vtx, wts
+
+    def put(self, key, pixel_idx, vtx, wts, skygrid_shape):
+        """
+        Saves the skygrid pixels, vertices, and weights for a pointing and removes the least recently used entries if
+        the cache is larger than max_size.
+
+        :param key: string of the key of the cache entry, see the key method
+        :param pixel_idx: tuple of arrays of the skygrid pixel indices (in the format returned by np.where)
+        :param vtx: numpy array of the interpolation vertices
+        :param wts: numpy array of the interpolation weights
+        :param skygrid_shape: the shape of the skygrid that pixel_idx indexes
+        :return: None
+        """
+        if self.max_size <= 0:
+            return
+
+        filename = self._filename(key)
+
+        # write to a temporary file and then move it so other processes never read a partially written file
+        tmp_filename = self.cache_dir.joinpath(f"{key}.{os.getpid()}.tmp.npz")
+        np.savez(
+            tmp_filename,
+            pixel_idx=np.ravel_multi_index(pixel_idx, skygrid_shape).astype(np.int32),
+            vtx=vtx.astype(np.int32),
+            wts=wts,
+            skygrid_shape=np.array(skygrid_shape),
+        )
+        self._replace(tmp_filename, filename)
+
+    def _replace(self, tmp_filename, filename):
+        """
+        Moves a newly written cache entry into place, updates the running size of the cache and removes the least
+        recently used entries if the cache is now larger than max_size.
+
+        :param tmp_filename: Path object of the temporary file that the entry was written to
+        :param filename: Path object of the cache entry
+        :return: None
+        """
+        if self._size is None:
+            self._size = sum([i[1] for i in self._entries()])
+
+        # an entry that is written again replaces the old file so its size is not counted twice
+        try:
+            self._size -= filename.stat().st_size
+        except FileNotFoundError:
+            pass
+
+        self._size += tmp_filename.stat().st_size
+        os.replace(tmp_filename, filename)
+
+        if self._size > self.max_size * 1024**3:
+            self._evict()
+
+    def _remove(self, filename):
+        """
+        Removes a cache entry and updates the running size of the cache.
+
+        :param filename: Path object of the cache entry
+        :return: None
+        """
+        try:
+            size = filename.stat().st_size
+            filename.unlink()
+        except FileNotFoundError:
+            return
+
+        if self._size is not None:
+            self._size -= size
+
+    def _entries(self):
+        """
+        Scans the cache directory for the cache entries.
+
+        :return: list of tuples with the modification time, size and Path object of each cache entry
+        """
+        entries = []
+        for filename in self.cache_dir.glob("*.npz"):
+            if ".tmp" in filename.name:
+                continue
+            try:
+                stat = filename.stat()
+            except FileNotFoundError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, filename))
+
+        return entries
+
+    def _evict(self):
+        """
+        Removes the least recently used cache entries until the cache is smaller than max_size. The cache directory is
+        scanned again since other processes may be saving entries to the same cache.
+
+        :return: None
+        """
+        entries = self._entries()
+
+        total_size = sum([i[1] for i in entries])
+        for mtime, size, filename in sorted(entries):
+            if total_size <= self.max_size * 1024**3:
+                break
+            try:
+                filename.unlink()
+            except FileNotFoundError:
+                pass
+            total_size -= size
+
+        self._size = total_size
+
+
+class ContributionCache(InterpWeightCache):
+    """
+    An on-disk cache of the reprojected contribution of each BAT survey pointing to the mosaic images: the exposure,
+    partial coding, variance weighted sky flux and inverse variance values of the skygrid pixels that the pointing falls
+    on, along with the exposure and times of the pointing. Once a pointing's contribution is cached, the mosaic images
+    of any time bin that includes it are created by summing the cached values, without reading the pointing's images
+    or interpolating them onto the skygrid. This makes it quick to create the mosaic images for new time bins, such as
+    with different binning_timedelta or custom_timebins values in group_outventory.
+
+    Each entry is saved as a .npz file named with the hash of the pointing's image files and the skygrid. Only the
+    skygrid pixels where the pointing has a nonzero contribution are saved. The size of the cache is bound by max_size
+    in the same way as the InterpWeightCache.
+
+    Attributes
+    ---------------
+    cache_dir : Path
+        The directory where the cached contributions are saved
+    max_size : float
+        The maximum size of the cache in GB
+
+    Methods
+    ---------------
+    key(data_directory, pointing_id, ncleaniter, corrections_map, ra_skygrid, dec_skygrid):
+        Returns the key of the cache entry for a pointing
+    contains(key):
+        Returns if there is a cache entry for the key
+    get(key):
+        Returns the cached contribution for the key or None if it has not been cached
+    put(key, contribution, skygrid_shape):
+        Saves the contribution for the key
+    """
+
+    # the pointing information that is saved along with the reprojected values
+    _info_keys = ["exposure", "tstart", "tstop", "dateobs_start", "dateobs_end"]
+
+    def key(self, data_directory, pointing_id, ncleaniter, corrections_map, ra_skygrid, dec_skygrid, energy_bands=None):
+        """
+        Creates the key for the cached contribution of a pointing from the paths, sizes and modification times of the
+        pointing's image files, so the cache entry is not used if the pointing is analyzed again. Coarse samplings of
+        the skygrid and the corrections map, and the energy bins of the contribution, are also included.
+
+        :param data_directory: Path object of the directory of the pointing
+        :param pointing_id: string of the pointing ID
+        :param ncleaniter: int of the number of cleaning iterations of the batsurvey analysis
+        :param corrections_map: numpy array with the energy dependent off-axis corrections map
+        :param ra_skygrid: numpy array of the skygrid facets' RA values in degrees
+        :param dec_skygrid: numpy array of the skygrid facets' DEC values in degrees
+        :param energy_bands: None or list of ints of the mosaic energy bins (see _energy_band_indices). Default is all
+            of them.
+        :return: string of the hash that is the key for the cache entry
+        """
+        hash_obj = hashlib.sha1()
+        _hash_pointing_files(hash_obj, data_directory, pointing_id, ncleaniter)
+        _hash_mosaic_inputs(hash_obj, corrections_map, ra_skygrid, dec_skygrid, energy_bands=energy_bands)
+
+        return hash_obj.hexdigest()
+
+    def contains(self, key):
+        """
+        Checks if there is a cache entry for a pointing, without reading it.
+
+        :param key: string of the key of the cache entry, see the key method
+        :return: Boolean of if the entry is cached
+        """
+        return self._filename(key).exists()
+
+    def get(self, key):
+        """
+        Reads the cached contribution of a pointing.
+
+        :param key: string of the key of the cache entry, see the key method
+        :return: None if the entry is not cached otherwise a dict with the pointing information and the skygrid pixel
+            indices (in the format returned by np.where) and the reprojected values (see _pointing_contribution)
+        """
+        filename = self._filename(key)
+        try:
+            with np.load(filename) as data:
+                contribution = {i: data[i].item() for i in self._info_keys}
+                if bool(data["included"]):
+                    contribution["pixel_idx"] = np.unravel_index(data["pixel_idx"], tuple(data["skygrid_shape"]))
+                    contribution["values"] = data["values"]
+                else:
+                    contribution["pixel_idx"] = None
+                    contribution["values"] = None
+        except FileNotFoundError:
+            return None
+        except (OSError, KeyError, ValueError, zipfile.BadZipFile):
+            # the entry is truncated or corrupt, eg if the process that wrote it was killed, so it is treated as a miss
+            # and removed
+            self._remove(filename)
+            return None
+
+        # update the access time of the file so it is considered recently used
+        try:
+            os.utime(filename)
+        except OSError:
+            pass
+
+        return contribution
+
+    def put(self, key, contribution, skygrid_shape):
+        """
+        Saves the contribution of a pointing and removes the least recently used entries if the cache is larger than
+        max_size.
+
+        :param key: string of the key of the cache entry, see the key method
+        :param contribution: dict with the pointing information and reprojected values (see _pointing_contribution)
+        :param skygrid_shape: the shape of the skygrid that the pixel indices of the contribution index
+        :return: None
+        """
+        if self.max_size <= 0:
+            return
+
+        filename = self._filename(key)
+        entry = {i: np.array(contribution[i]) for i in self._info_keys}
+
+        if contribution["pixel_idx"] is not None:
+            # the pixels that dont have any contribution dont change the sums so they are not saved
+            nonzero = np.any(contribution["values"] != 0, axis=1)
+            entry["pixel_idx"] = np.ravel_multi_index(
+                tuple(i[nonzero] for i in contribution["pixel_idx"]), skygrid_shape
+            ).astype(np.int32)
+            entry["values"] = contribution["values"][nonzero]
+
+        # write to a temporary file and then move it so other processes never read a partially written file
+        tmp_filename = self.cache_dir.joinpath(f"{key}.{os.getpid()}.tmp.npz")
+        np.savez(
+            tmp_filename,
+            included=np.array(contribution["pixel_idx"] is not None),
+            skygrid_shape=np.array(skygrid_shape),
+            **entry,
+        )
+        self._replace(tmp_filename, filename)
+
+
+def _radec2vec(ra, dec):
+    """
+    Converts RA/DEC coordinates to unit vectors.
+
+    :param ra: numpy array of ra coordinates in degrees
+    :param dec: numpy array of dec coordinates in degrees
+    :return: numpy array of the unit vectors with shape (ra.shape, 3)
+    """
+    ra = np.deg2rad(ra)
+    dec = np.deg2rad(dec)
+    cos_dec = np.cos(dec)
+
+    return np.stack((cos_dec * np.cos(ra), cos_dec * np.sin(ra), np.sin(dec)), axis=-1)
+
+
+class SkygridIndex(object):
+    """
+    A spatial index of the skygrid pixels that allows the skygrid pixels that fall within a circular region of the sky
+    to be found quickly. This is used to only project the skygrid pixels that can fall within a pointing image, instead
+    of all the pixels of all the skygrid facets.
+
+    The unit vectors of all the skygrid pixels are precomputed and each facet is split into square tiles. Each tile has
+    a bounding cap (the unit vector of the tile center and the angular radius that contains all the tile's pixels) so
+    the tiles that do not overlap the region of interest can be skipped without looking at their pixels.
+
+    Attributes
+    ---------------
+    shape : tuple
+        The shape of the skygrid arrays (n, m, n_facets)
+    tile_size : int
+        The number of pixels along each side of a tile
+    unit_vectors : numpy array
+        The float32 unit vectors of each skygrid pixel with shape (n, m, n_facets, 3)
+    tile_centers : numpy array
+        The unit vectors of the center of each tile with shape (n_tiles_x, n_tiles_y, n_facets, 3)
+    tile_radius : numpy array
+        The angular radius, in degrees, of each tile's bounding cap with shape (n_tiles_x, n_tiles_y, n_facets)
+
+    Methods
+    ---------------
+    query(center, radius):
+        Returns the skygrid pixel indices within radius of the unit vector center
+    """
+
+    def __init__(self, ra_skygrid, dec_skygrid, tile_size=64):
+        """
+        Initializer method for the SkygridIndex object.
+
+        :param ra_skygrid: numpy array of the skygrid facets' RA values in degrees
+        :param dec_skygrid: numpy array of the skygrid facets' DEC values in degrees
+        :param tile_size: int, default 64, of the number of pixels along each side of a tile
+        """
+        self.shape = ra_skygrid.shape
+        self.tile_size = tile_size
+
+        nx, ny, nz = self.shape
+        ntiles_x = int(np.ceil(nx / tile_size))
+        ntiles_y = int(np.ceil(ny / tile_size))
+
+        self.unit_vectors = np.zeros((nx, ny, nz, 3), dtype=np.float32)
+        self.tile_centers = np.zeros((ntiles_x, ntiles_y, nz, 3))
+        self.tile_radius = np.zeros((ntiles_x, ntiles_y, nz))
+
+        # go facet by facet to limit the size of the temporary arrays
+        for i in range(nz):
+            vec = _radec2vec(ra_skygrid[:, :, i], dec_skygrid[:, :, i])
+            self.unit_vectors[:, :, i] = vec
+
+            # pad the facet with copies of the edge pixels so it can be reshaped into tiles, the copies do not change
+            # the bounding cap of the tiles
+            vec = np.pad(
+                vec,
+                ((0, ntiles_x * tile_size - nx), (0, ntiles_y * tile_size - ny), (0, 0)),
+                mode="edge",
+            )
+            vec = vec.reshape(ntiles_x, tile_size, ntiles_y, tile_size, 3)
+
+            center = vec.mean(axis=(1, 3))
+            center /= np.linalg.norm(center, axis=-1, keepdims=True)
+            min_cos = np.einsum("aibjk,abk->aibj", vec, center).min(axis=(1, 3))
+
+            self.tile_centers[:, :, i] = center
+            self.tile_radius[:, :, i] = np.rad2deg(np.arccos(np.clip(min_cos, -1, 1)))
+
+    def query(self, center, radius):
+        """
+        Finds the skygrid pixels that are within some angular distance of a point on the sky.
+
+        :param center: numpy array of the unit vector of the center of the region of interest
+        :param radius: float of the angular radius of the region of interest in degrees
+        :return: tuple of the skygrid pixel indices (in the format returned by np.where) in the same order that np.where
+            would return them for the full skygrid
+        """
+        # a small margin accounts for the float32 precision of the pixel unit vectors
+        margin = 1e-3
+
+        # find the tiles whose bounding caps overlap the region of interest
+        tile_sep = np.rad2deg(
+            np.arccos(np.clip(np.einsum("abck,k->abc", self.tile_centers, center), -1, 1))
+        )
+        tile_idx = np.where(tile_sep <= radius + self.tile_radius + margin)
+
+        # mark the pixels of these tiles, this keeps the pixels in the same order as the full skygrid
+        candidates = np.zeros(self.shape, dtype=bool)
+        for tx, ty, tz in zip(*tile_idx):
+            candidates[
+                tx * self.tile_size : (tx + 1) * self.tile_size,
+                ty * self.tile_size : (ty + 1) * self.tile_size,
+                tz,
+            ] = True
+        candidate_idx = np.where(candidates)
+
+        # only keep the pixels that are actually within the region
+        cos_sep = self.unit_vectors[candidate_idx] @ np.asarray(center, dtype=np.float32)
+        good = cos_sep >= np.cos(np.deg2rad(min(radius + margin, 180)))
+
+        return tuple(i[good] for i in candidate_idx)
+
+
+def _pointing_footprint(pointing_header, pointing_shape, step=32):
+    """
+    Calculates a circular region on the sky that contains the full pointing image, including the 1 pixel border around
+    the image that is used when projecting the skygrid onto the pointing image (see _pointing_interp_weights).
+
+    :param pointing_header: The astropy header of the pointing image with the astrometric keywords
+    :param pointing_shape: tuple of the shape of the pointing image
+    :param step: int, default 32, of the spacing of the pixels, in the pointing image, that are used to find the region
+    :return: tuple of the unit vector of the center of the region and the angular radius of the region in degrees
+    """
+    # sample the pointing image, always including the edges
+    y = np.unique(np.append(np.arange(-1, pointing_shape[0] + 1, step), pointing_shape[0]))
+    x = np.unique(np.append(np.arange(-1, pointing_shape[1] + 1, step), pointing_shape[1]))
+    xx, yy = np.meshgrid(x.astype(np.float64), y.astype(np.float64))
+
+    ra, dec = convert_xy2radec(xx, yy, pointing_header)
+    vec = _radec2vec(ra, dec)
+
+    # use the center of the image as the center of the region
+    center_ra, center_dec = convert_xy2radec(
+        np.array([(pointing_shape[1] - 1) / 2]),
+        np.array([(pointing_shape[0] - 1) / 2]),
+        pointing_header,
+    )
+    center = _radec2vec(center_ra, center_dec)[0]
+
+    sep = np.rad2deg(np.arccos(np.clip(vec @ center, -1, 1)))
+
+    # the points in between the sampled points can be at most half of the distance between neighboring sampled points
+    # further away than the sampled points themselves, use the full distance to be conservative
+    neighbor_sep = max(
+        np.nanmax(np.rad2deg(np.arccos(np.clip(np.sum(vec[1:] * vec[:-1], axis=-1), -1, 1)))),
+        np.nanmax(np.rad2deg(np.arccos(np.clip(np.sum(vec[:, 1:] * vec[:, :-1], axis=-1), -1, 1)))),
+    )
+
+    return center, np.nanmax(sep) + neighbor_sep
+
+
+def _pointing_interp_weights(
+    ra_skygrid,
+    dec_skygrid,
+    pointing_header,
+    pointing_shape,
+    weight_cache=None,
+    skygrid_index=None,
+):
+    """
+    Calculates the skygrid pixels that a pointing image falls on and the vertices and weights needed to interpolate the
+    pointing image onto these skygrid pixels. If a cache is passed in, the cached values are used if this pointing has
+    been projected onto the skygrid before.
+
+    :param ra_skygrid: numpy array of the skygrid facets' RA values in degrees
+    :param dec_skygrid: numpy array of the skygrid facets' DEC values in degrees
+    :param pointing_header: The astropy header of the pointing image with the astrometric keywords
+    :param pointing_shape: tuple of the shape of the pointing image
+    :param weight_cache: None or an InterpWeightCache object
+    :param skygrid_index: None or a SkygridIndex object of the skygrid. If this is passed in, only the skygrid pixels
+        that are near the pointing image are projected onto the pointing image.
+    :return: tuple of the skygrid pixel indices (in the format returned by np.where), the vertices, and the weights
+    """
+
+    if weight_cache is not None:
+        key = weight_cache.key(pointing_header, pointing_shape, ra_skygrid, dec_skygrid)
+        cached = weight_cache.get(key)
+        if cached is not None:
+            return cached
+
+    # only the skygrid pixels that are close to the pointing can fall within the pointing image so if we can, select
+    # these pixels before projecting them
+    if skygrid_index is not None:
+        center, radius = _pointing_footprint(pointing_header, pointing_shape)
+        footprint_idx = skygrid_index.query(center, radius)
+        ra, dec = ra_skygrid[footprint_idx], dec_skygrid[footprint_idx]
+    else:
+        ra, dec = ra_skygrid, dec_skygrid
+
+    # need to compute the x/y position for each RA/DEC point in the sky map using the new
+    # file for the pointing of interest
+    pixel_x, pixel_y = convert_radec2xy(ra, dec, pointing_header)
+
+    # get the good values, in the idl file the shape of pointing_pimg is reversed, not sure if
+    # this is correct here.
+    good = (
+        (pixel_y <= pointing_shape[0])
+        & (pixel_x <= pointing_shape[1])
+        & (pixel_x >= -1)
+        & (pixel_y >= -1)
+        & np.isfinite(pixel_x)
+        & np.isfinite(pixel_y)
+    )
+    if skygrid_index is not None:
+        pixel_idx = tuple(i[good] for i in footprint_idx)
+    else:
+        pixel_idx = np.where(good)
+    chosen_pixel_x = pixel_x[good]
+    chosen_pixel_y = pixel_y[good]
+
+    # before had: #np.array([chosen_pixel_x, chosen_pixel_y]) for the below line but the results
+    # werent consistent with the idl code results. changing the x and y pixel coordinates here works
+    interp_at_points = np.array([chosen_pixel_y, chosen_pixel_x])
+
+    # see if thie other method works,
+    # https://stackoverflow.com/questions/20915502/speedup-scipy-griddata-for-multiple-interpolations-between-two-irregular-grids
+    # the survey image pixels are a regular grid so we can get the weights directly without the
+    # Delaunay triangulation that interp_weights needs
+    vtx, wts = regular_grid_interp_weights(pointing_shape, interp_at_points.T)
+
+    if weight_cache is not None:
+        weight_cache.put(key, pixel_idx, vtx, wts, ra_skygrid.shape)
+
+    return pixel_idx, vtx, wts
+
+def read_correctionsmap(mmap=False):
     """
     Reads the BAT coded mask energy-dependent off axis corrections mask which accounts for the fact that the mask has a
     finite width which affects the propagation of photons at some angle relative to the boresight.
 
+    :param mmap: Boolean False by default. If True, a read-only memory mapped array is returned which is backed by a .npy
+        file saved in a "shared_cache" directory within the BatAnalysis user cache directory (see _user_cache_dir), so
+        the package directory does not need to be writable. This array can be passed to joblib workers without being
+        copied to each process.
     :return: numpy array of (954, 1760, _nebands) where _nebands=8, which is the number of energy bands in the BAT survey
     """
     # reads the correction map for correcting off-axis effects
@@ -725,6 +1929,14 @@ def read_correctionsmap():
         _cimgfile
     )
 
+    if mmap:
+        return _memmap_cache(
+            Path(_cimgfile).stem,
+            [file_string],
+            read_correctionsmap,
+            _user_cache_dir().joinpath("shared_cache"),
+        )
+
     # create array to hold data, already know sizes of grids from looking at file
     corrections_map = np.zeros((954, 1760, _nebands))
 
@@ -814,34 +2026,625 @@ def compute_statistics_map(chi_sq, nbatdet, ra_pnt, dec_pnt, pa_pnt, tstart):
     return np.array(mask, dtype=np.int64)
 
 
-def write_mosaic(
-    img,
-    header,
-    filename_base,
-    emin=[14.0, 20.0, 24.0, 35.0, 50.0, 75.0, 100.0, 150.0, 14.0],
-    emax=[20.0, 24.0, 35.0, 50.0, 75.0, 100.0, 150.0, 195.0, 195.0],
-):
+def _energy_band_indices(energy_bands=None):
     """
-    Write out the intermediate mosaic images to fits files.
+    Checks the energy bands that a mosaic is created for and puts them in order.
 
-    :param img: numpy array of the image that will be saved.
-    :param header: The astropy header object that contains image specific information. This header will be appended to
-        the header of the associated skygrid facet, and additional standard keywords (see the add_header variable
-        within this function).
-    :param filename_base: Path object that denotes the directory where the images will be saved.
-    :param emin: The lower energy values for each survey energy bin that is created for each image. This should not need
-        to be modified.
+    :param energy_bands: None or a list of ints of the indexes of the mosaic energy bins in _emin/_emax, where 0-7 are
+        the survey energy bands and 8 is the total 14-195 keV band. None selects all of the energy bins.
+    :return: sorted list of the unique energy bin indexes
+    """
+    if energy_bands is None:
+        return list(range(_nebands + 1))
+
+    energy_bands = sorted(set(int(i) for i in np.atleast_1d(energy_bands)))
+    if len(energy_bands) == 0 or energy_bands[0] < 0 or energy_bands[-1] > _nebands:
+        raise ValueError(
+            f"The energy_bands parameter needs to be a list of the indexes (0-{_nebands}) of the mosaic energy bins."
+        )
+
+    return energy_bands
+
+
+def _pointing_energy_bands(energy_bands):
+    """
+    Finds the survey energy bands that need to be read from the images of a BAT survey pointing to create the requested
+    mosaic energy bins. The total 14-195 keV band needs all of the survey energy bands and the first survey energy band
+    is always read since its quality mask defines the exposure and partial coding maps.
+
+    :param energy_bands: sorted list of ints of the mosaic energy bins (see _energy_band_indices)
+    :return: sorted list of ints of the survey energy bands, which are also the HDU indexes of the .img/.var files
+    """
+    if _nebands in energy_bands:
+        return list(range(_nebands))
+
+    return sorted(set(energy_bands) | {0})
+
+
+def _energy_band_hdus(hdulist, energy_bands):
+    """
+    Finds the image HDUs of a mosaic file that hold the requested energy bins, based on the E_MIN/E_MAX values of their
+    headers. This allows a mosaic with a subset of the energy bins to be created from mosaics that have more of them.
+
+    :param hdulist: astropy HDUList of a mosaic file with one image HDU per energy bin
+    :param energy_bands: sorted list of ints of the mosaic energy bins (see _energy_band_indices)
+    :return: list of the HDUs in the same order as energy_bands
+    """
+    hdus = {(i.header.get("E_MIN"), i.header.get("E_MAX")): i for i in _image_hdus(hdulist)}
+
+    band_hdus = []
+    for band in energy_bands:
+        edges = (_emin[band], _emax[band])
+        if edges not in hdus:
+            raise ValueError(
+                f"The {_emin[band]}-{_emax[band]} keV energy bin is not in the mosaic file {hdulist.filename()}."
+            )
+        band_hdus.append(hdus[edges])
+
+    return band_hdus
+
+
+class TiledArray(object):
+    """
+    A zero filled array with the shape of a mosaic image, (n, m, n_facets) or (n, m, n_facets, n_energy), where the
+    memory of each square tile of a sky facet is only allocated when values are assigned to it. The time bins of short
+    mosaics only have a few pointings that cover a small part of the sky, so only the tiles within their footprints are
+    allocated instead of the full images of every sky facet.
+
+    The array supports the indexing that the mosaic images are summed with: the skygrid pixel indices in the format
+    returned by np.where (eg array[pixel_idx] += values) and the full images of a sky facet (eg array[:, :, j] or
+    array[:, :, j, k]), which are returned as numpy arrays with zeros where there are no tiles.
+
+    Attributes
+    ---------------
+    shape : tuple
+        The shape of the array
+    ndim : int
+        The number of dimensions of the array
+    dtype : numpy dtype
+        The type of the array
+    tile_size : int
+        The number of skygrid pixels along each side of the tiles
+    tiles : dict
+        The numpy arrays of the allocated tiles with keys of (row tile index, column tile index, facet)
+
+    Methods
+    ---------------
+    add(other):
+        Adds the tiles of another TiledArray object with the same shape
+    facet_tiles(facet):
+        Returns the number of tiles of a sky facet that have been allocated
+    """
+
+    def __init__(self, shape, tile_size=64, dtype=np.float64):
+        """
+        Initializer method for the TiledArray object.
+
+        :param shape: tuple of the shape of the array, the first 3 dimensions are the skygrid shape (n, m, n_facets)
+        :param tile_size: int, default 64, of the number of skygrid pixels along each side of the tiles
+        :param dtype: numpy dtype of the array, the default is float64
+        """
+        self.shape = tuple(shape)
+        self.ndim = len(self.shape)
+        self.dtype = np.dtype(dtype)
+        self.tile_size = int(tile_size)
+        self.tiles = {}
+
+        self._ntiles = (-(-self.shape[0] // self.tile_size), -(-self.shape[1] // self.tile_size))
+
+        # the tile groups of the last skygrid pixel indices, array[pixel_idx] += values uses them twice
+        self._last_pixel_idx = None
+        self._last_groups = None
+
+    @property
+    def nbytes(self):
+        return sum(i.nbytes for i in self.tiles.values())
+
+    def _tile(self, key, create=False):
+        """
+        Gets the array of a tile.
+
+        :param key: tuple of the (row tile index, column tile index, facet) of the tile
+        :param create: Boolean False by default. Set to True to allocate a zero filled tile if it does not exist.
+        :return: numpy array of the tile or None if it has not been allocated
+        """
+        tile = self.tiles.get(key)
+        if tile is None and create:
+            row_start, col_start = key[0] * self.tile_size, key[1] * self.tile_size
+            tile_shape = (
+                min(self.tile_size, self.shape[0] - row_start),
+                min(self.tile_size, self.shape[1] - col_start),
+            ) + self.shape[3:]
+            tile = np.zeros(tile_shape, dtype=self.dtype)
+            self.tiles[key] = tile
+
+        return tile
+
+    def _pixel_groups(self, pixel_idx):
+        """
+        Groups skygrid pixel indices by the tile that they fall in.
+
+        :param pixel_idx: tuple of arrays of the skygrid pixel indices (in the format returned by np.where)
+        :return: list of tuples of the tile key, the positions of the pixels in pixel_idx and the row and column
+            indices of the pixels within the tile
+        """
+        if pixel_idx is self._last_pixel_idx:
+            return self._last_groups
+
+        row, col, facet = [np.asarray(i) for i in pixel_idx]
+        row_tile, col_tile = row // self.tile_size, col // self.tile_size
+        tile_id = (row_tile * self._ntiles[1] + col_tile) * self.shape[2] + facet
+
+        order = np.argsort(tile_id, kind="stable")
+        groups = []
+        for positions in np.split(order, np.flatnonzero(np.diff(tile_id[order])) + 1):
+            if positions.size == 0:
+                continue
+            k = positions[0]
+            groups.append(
+                (
+                    (int(row_tile[k]), int(col_tile[k]), int(facet[k])),
+                    positions,
+                    row[positions] - row_tile[k] * self.tile_size,
+                    col[positions] - col_tile[k] * self.tile_size,
+                )
+            )
+
+        self._last_pixel_idx = pixel_idx
+        self._last_groups = groups
+
+        return groups
+
+    def _facet_key(self, key):
+        """
+        Parses the index of the full images of a sky facet, eg [:, :, j] or [:, :, j, k].
+
+        :param key: the index
+        :return: int of the facet and a tuple of any index of the energy dimension
+        """
+        if (
+            not isinstance(key, tuple)
+            or len(key) < 3
+            or len(key) > self.ndim
+            or key[0] != slice(None)
+            or key[1] != slice(None)
+        ):
+            raise IndexError(
+                "TiledArray objects can only be indexed by skygrid pixel indices or by the full images of a sky facet."
+            )
+
+        return int(key[2]), key[3:]
+
+    def __getitem__(self, key):
+        if isinstance(key, tuple) and len(key) == 3 and all(isinstance(i, np.ndarray) for i in key):
+            values = np.zeros((key[0].size,) + self.shape[3:], dtype=self.dtype)
+            for tile_key, positions, row, col in self._pixel_groups(key):
+                tile = self._tile(tile_key)
+                if tile is not None:
+                    values[positions] = tile[row, col]
+            return values
+
+        facet, band = self._facet_key(key)
+        image = np.zeros(self.shape[:2] + self.shape[3 + len(band) :], dtype=self.dtype)
+        for (row_tile, col_tile, tile_facet), tile in self.tiles.items():
+            if tile_facet == facet:
+                row_start, col_start = row_tile * self.tile_size, col_tile * self.tile_size
+                image[row_start : row_start + tile.shape[0], col_start : col_start + tile.shape[1]] = tile[
+                    (slice(None), slice(None)) + band
+                ]
+
+        return image
+
+    def __setitem__(self, key, value):
+        if isinstance(key, tuple) and len(key) == 3 and all(isinstance(i, np.ndarray) for i in key):
+            value = np.broadcast_to(value, (key[0].size,) + self.shape[3:])
+            for tile_key, positions, row, col in self._pixel_groups(key):
+                self._tile(tile_key, create=True)[row, col] = value[positions]
+            return
+
+        facet, band = self._facet_key(key)
+        value = np.broadcast_to(value, self.shape[:2] + self.shape[3 + len(band) :])
+        for row_tile in range(self._ntiles[0]):
+            for col_tile in range(self._ntiles[1]):
+                row_start, col_start = row_tile * self.tile_size, col_tile * self.tile_size
+                block = value[row_start : row_start + self.tile_size, col_start : col_start + self.tile_size]
+
+                # tiles are only allocated where there are nonzero values
+                tile = self._tile((row_tile, col_tile, facet), create=bool(np.any(block)))
+                if tile is not None:
+                    tile[(slice(None), slice(None)) + band] = block
+
+    def add(self, other):
+        """
+        Adds the tiles of another TiledArray object with the same shape and tile size.
+
+        :param other: TiledArray object
+        :return: None
+        """
+        for key, tile in other.tiles.items():
+            self._tile(key, create=True)[...] += tile
+
+    def facet_tiles(self, facet):
+        """
+        Counts the tiles of a sky facet that have been allocated.
+
+        :param facet: int of the sky facet
+        :return: int of the number of allocated tiles
+        """
+        return sum(1 for i in self.tiles if i[2] == facet)
+
+
+class MosaicAccumulator(object):
+    """
+    Holds the intermediate images that the BAT survey pointings are summed into to create a mosaic image. These are
+    the exposure map (eimg), the partial coding*exposure map (pimg), the inverse variance map for each energy (vimg), and
+    the inverse variance weighted sky flux for each energy (simg).
+
+    The vimg and simg arrays have a shape of (n, m, n_facets, n_energy) so they can need many GB of memory with the
+    default skygrid. The arrays can be held in memory as float64 (the default) or float32 arrays, they can be
+    memory mapped float64 arrays that are saved to disk, or they can be float64 TiledArray objects that only allocate
+    the tiles of the skygrid that pointings have been added to, which suits time bins with few pointings.
+
+    Attributes
+    ---------------
+    skygrid_shape : tuple
+        The shape of the skygrid (n, m, n_facets)
+    energy_bands : list
+        The indexes of the mosaic energy bins (see _emin/_emax) of the vimg and simg arrays
+    nbands : int
+        The number of energy bands of the vimg and simg arrays
+    backend : string
+        The type of arrays that are used: "float64", "float32", "memmap", or "tiled"
+    directory : None or Path
+        The directory where the memory mapped arrays are saved
+    eimg : numpy array
+        The exposure map
+    pimg : numpy array
+        The partial coding*exposure map
+    vimg : numpy array
+        The inverse variance map for each energy band
+    simg : numpy array
+        The inverse variance weighted sky flux map for each energy band
+
+    Methods
+    ---------------
+    add(other):
+        Adds the arrays of another MosaicAccumulator object to the arrays of this object
+    flush():
+        Writes any changes of memory mapped arrays to disk
+    close():
+        Removes any memory mapped files that were created by the object
+    empty_facets():
+        Returns the sky facets that no pointings have been added to, for the "tiled" backend
+    state():
+        Returns the arrays as a dict of numpy arrays that can be saved with np.savez
+    load_state(state):
+        Replaces the arrays with the ones returned by the state method
+    """
+
+    _backends = ["float64", "float32", "memmap", "tiled"]
+
+    def __init__(self, skygrid_shape, energy_bands=None, backend="float64", directory=None, mode="w+"):
+        """
+        Initializer method for the MosaicAccumulator object.
+
+        :param skygrid_shape: tuple of the shape of the skygrid (n, m, n_facets)
+        :param energy_bands: None or list of ints of the indexes of the mosaic energy bins in _emin/_emax that the vimg
+            and simg arrays hold. Default is all of the survey energy bands and the total 14-195 keV band.
+        :param backend: string of the type of arrays that are used: "float64" (the default), "float32", "memmap", or
+            "tiled"
+        :param directory: None or a Path object to the directory where the memory mapped arrays are saved. This is
+            required if the backend is "memmap"
+        :param mode: string of how the memory mapped arrays are opened. The default "w+" creates new zero filled
+            arrays and "r+" opens the arrays that were previously saved in directory.
+        """
+        if backend not in self._backends:
+            raise ValueError(f"The backend parameter needs to be one of {self._backends}.")
+
+        if backend == "memmap" and directory is None:
+            raise ValueError("A directory needs to be passed in to use memory mapped arrays.")
+
+        self.skygrid_shape = tuple(skygrid_shape)
+        self.energy_bands = _energy_band_indices(energy_bands)
+        self.nbands = len(self.energy_bands)
+        self.backend = backend
+        self.directory = None if directory is None else Path(directory)
+        self.mode = mode
+
+        self._files = []
+        self.eimg = self._allocate("eimg", self.skygrid_shape)
+        self.pimg = self._allocate("pimg", self.skygrid_shape)
+        self.vimg = self._allocate("vimg", self.skygrid_shape + (self.nbands,))
+        self.simg = self._allocate("simg", self.skygrid_shape + (self.nbands,))
+
+    def _allocate(self, name, shape):
+        """
+        Creates a zero filled array based on the backend.
+
+        :param name: string of the name of the array, used for the file name of memory mapped arrays
+        :param shape: tuple of the shape of the array
+        :return: numpy array
+        """
+        if self.backend == "memmap":
+            self.directory.mkdir(parents=True, exist_ok=True)
+            filename = self.directory.joinpath(f"{name}_accumulator.npy")
+            self._files.append(filename)
+            if self.mode == "r+":
+                return np.lib.format.open_memmap(filename, mode="r+")
+            # new files are filled with zeros
+            return np.lib.format.open_memmap(filename, mode="w+", dtype=np.float64, shape=shape)
+        elif self.backend == "tiled":
+            return TiledArray(shape)
+        else:
+            return np.zeros(shape, dtype=self.backend)
+
+    def add(self, other):
+        """
+        Adds the arrays of another MosaicAccumulator object to the arrays of this object.
+
+        :param other: MosaicAccumulator object with the same skygrid shape and number of energy bands
+        :return: None
+        """
+        for name in ["eimg", "pimg", "vimg", "simg"]:
+            array = getattr(self, name)
+            other_array = getattr(other, name)
+            if isinstance(array, TiledArray) and isinstance(other_array, TiledArray):
+                array.add(other_array)
+                continue
+            # go through each facet to limit the size of the temporary arrays when they are memory mapped
+            for i in range(array.shape[2]):
+                array[:, :, i] += other_array[:, :, i]
+
+    def flush(self):
+        """
+        Writes any changes of the memory mapped arrays to disk.
+
+        :return: None
+        """
+        if self.backend == "memmap":
+            for name in ["eimg", "pimg", "vimg", "simg"]:
+                getattr(self, name).flush()
+
+    def close(self):
+        """
+        Removes the memory mapped files that were created by the object. The arrays cannot be used after this.
+
+        :return: None
+        """
+        if self.backend == "memmap":
+            self.flush()
+            for name in ["eimg", "pimg", "vimg", "simg"]:
+                setattr(self, name, None)
+            for filename in self._files:
+                filename.unlink(missing_ok=True)
+            self._files = []
+            # only remove the directory if there is nothing else in it
+            if self.directory.exists() and not any(self.directory.iterdir()):
+                self.directory.rmdir()
+
+    def state(self):
+        """
+        Gets the arrays of the object as a dict of numpy arrays, which can be saved with np.savez and loaded back with
+        the load_state method. The tiles of TiledArray objects are saved individually so only the allocated tiles are
+        saved.
+
+        :return: dict of numpy arrays
+        """
+        state = dict()
+        for name in ["eimg", "pimg", "vimg", "simg"]:
+            array = getattr(self, name)
+            if isinstance(array, TiledArray):
+                for (row_tile, col_tile, facet), tile in array.tiles.items():
+                    state[f"{name}_tile_{row_tile}_{col_tile}_{facet}"] = tile
+            else:
+                state[name] = array
+
+        return state
+
+    def load_state(self, state):
+        """
+        Replaces the values of the arrays of the object with the ones that were saved from the state method of a
+        MosaicAccumulator object with the same skygrid shape and energy bins, which can have a different backend.
+
+        :param state: dict of numpy arrays, or the NpzFile object of the file they were saved in
+        :return: None
+        """
+        names = list(state.keys())
+        for name in ["eimg", "pimg", "vimg", "simg"]:
+            array = getattr(self, name)
+
+            # the state can have the full arrays or the tiles of TiledArray objects
+            if name in names:
+                values = np.asarray(state[name])
+            else:
+                values = TiledArray(array.shape, dtype=np.float64)
+                prefix = f"{name}_tile_"
+                for key in names:
+                    if key.startswith(prefix):
+                        values.tiles[tuple(int(i) for i in key[len(prefix) :].split("_"))] = np.array(state[key])
+
+            if isinstance(array, TiledArray):
+                if isinstance(values, TiledArray):
+                    array.tiles = {key: tile.astype(array.dtype) for key, tile in values.tiles.items()}
+                else:
+                    array.tiles = {}
+                    for i in range(array.shape[2]):
+                        array[:, :, i] = values[:, :, i]
+                array._last_pixel_idx = None
+                array._last_groups = None
+            else:
+                # go through each facet to limit the size of the temporary arrays when they are memory mapped
+                for i in range(array.shape[2]):
+                    array[:, :, i] = values[:, :, i]
+
+    def empty_facets(self):
+        """
+        Finds the sky facets that no pointings have been added to. This is only tracked for the "tiled" backend, where
+        these facets have no allocated tiles, the other backends hold the full images so none of their facets are
+        considered empty.
+
+        :return: list of the indices of the empty sky facets
+        """
+        if self.backend != "tiled":
+            return []
+
+        return [
+            i
+            for i in range(self.skygrid_shape[2])
+            if all(getattr(self, name).facet_tiles(i) == 0 for name in ["eimg", "pimg", "vimg", "simg"])
+        ]
+
+
+def _peak_memory_usage():
+    """
+    Returns the peak resident set size of the current process.
+
+    :return: float of the peak resident memory in GB, this is nan on platforms without the resource module (eg Windows)
+    """
+    # the resource module is only available on POSIX systems
+    try:
+        import resource
+    except ImportError:
+        return np.nan
+
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # linux reports this in kB while macOS reports this in bytes
+    if sys.platform == "darwin":
+        return peak / 1024**3
+    return peak / 1024**2
+
+
+def write_mosaic(
+    img,
+    header,
+    filename_base,
+    emin=_emin,
+    emax=_emax,
+    grid_set="standard",
+    compression=None,
+):
+    """
+    Write out the intermediate mosaic images to fits files.
+
+    :param img: numpy array of the image that will be saved.
+    :param header: The astropy header object that contains image specific information. This header will be appended to
+        the header of the associated skygrid facet, and additional standard keywords (see _mosaic_standard_header).
+    :param filename_base: Path object that denotes the directory where the images will be saved.
+    :param emin: The lower energy values for each survey energy bin that is created for each image. This should not need
+        to be modified.
     :param emax: The upper energy values for each survey energy bin that is created for each image. This should not need
         to be modified.
+    :param grid_set: string, default "standard", of the name of the set of skygrids (see _skygrid_sets) that the image
+        was made on.
+    :param compression: None (the default) or a string of the tile compression of the images, "rice" or "gzip" (see
+        _compression_types). The intermediate images are always compressed losslessly.
     :return: None
     """
     # actually writes out the files that we produced in create mosaics
+    # the images are always saved as float64 so the files are the same regardless of the type of array that was used
+    # to hold the mosaic images
 
     filename_base = Path(filename_base)
+    add_header = _mosaic_standard_header()
+
+    # get the type of image that we are saving to denote the name
+    hdu_comment = header.comments["HDUCLAS2"]
+    if "PCODE" in hdu_comment:
+        file_start = "pcode_"
+    elif "EXPMAP" in hdu_comment:
+        file_start = "expmap_"
+    elif "VARIANCE" in hdu_comment:
+        file_start = "var_"
+    elif "SKY_WT_FLUX" in hdu_comment:
+        file_start = "flux_"
+
+    # get the headers of the skygrid facets, these are only read from disk once per python session
+    skygrid_headers = _get_skygrid_store(grid_set=grid_set).headers
+
+    # each facet's file is built in memory and written once
+    for i in range(_nskyimg):
+        string = "c%d_%s" % (i, _proj)
+        savefile = filename_base.joinpath(file_start + string + ".img")
+        hdulist = _mosaic_facet_hdulist(img, header + add_header + skygrid_headers[i], i, emin, emax)
+        _write_mosaic_hdulist(hdulist, savefile, compression=compression, lossless=True)
+
+
+def _write_mosaic_hdulist(hdulist, filename, compression=None, lossless=True):
+    """
+    Writes the HDUList of a mosaic image, optionally as tile compressed image HDUs. A tile compressed file has an empty
+    primary HDU followed by one compressed image extension per image, which astropy and the HEASoft tools decompress
+    transparently (see _image_hdus).
+
+    :param hdulist: astropy HDUList object of the uncompressed image HDUs
+    :param filename: Path object of the file that is written, this is overwritten if it exists
+    :param compression: None (the default) or a string of the tile compression, "rice" or "gzip" (see
+        _compression_types)
+    :param lossless: Boolean True by default. The images are compressed without any loss, with GZIP_2, regardless of
+        the compression. Otherwise "rice" quantizes the images before they are compressed with RICE_1, using
+        subtractive dithering that keeps the zeros and NaNs of the images exact. Images with infinite values, such as
+        the standard deviation outside of the sky coverage, are still compressed losslessly since the quantization
+        would turn these into NaNs.
+    :return: None
+    """
+    if compression is None:
+        hdulist.writeto(str(filename), overwrite=True)
+        return
+
+    if compression not in _compression_types:
+        raise ValueError(
+            f"The compression {compression} is not valid. It needs to be one of: {list(_compression_types)}"
+        )
+
+    hdus = [fits.PrimaryHDU()]
+    for hdu in hdulist:
+        # the images are compressed from contiguous arrays, which the images of a single sky facet may not be
+        data = np.ascontiguousarray(hdu.data)
+        if lossless or compression == "gzip" or np.isinf(data).any():
+            kwargs = dict(compression_type="GZIP_2", quantize_level=0.0)
+        else:
+            kwargs = dict(
+                compression_type=_compression_types[compression],
+                quantize_method=SUBTRACTIVE_DITHER_2,
+                dither_seed=DITHER_SEED_CHECKSUM,
+            )
+        hdus.append(fits.CompImageHDU(data=data, header=hdu.header, **kwargs))
+
+    fits.HDUList(hdus).writeto(str(filename), overwrite=True)
+
+
+def _image_hdus(hdulist):
+    """
+    Gets the HDUs of a mosaic image file that hold the images. This is all of the HDUs of uncompressed files and all but
+    the empty primary HDU of tile compressed files.
+
+    :param hdulist: astropy HDUList object of the opened file
+    :return: list of the astropy HDU objects with the images
+    """
+    return [i for i in hdulist if i.header.get("NAXIS", 0) > 0]
+
+
+def _mosaic_hdu(data, header, index):
+    """
+    Creates the HDU of one image of a mosaic image file. The first image is saved in the primary HDU and any other
+    images, ie the other energy bins, are saved in image extensions.
+
+    :param data: numpy array of the image
+    :param header: astropy Header object of the image
+    :param index: int of the position of the image in the file
+    :return: astropy PrimaryHDU or ImageHDU object
+    """
+    if index == 0:
+        return fits.PrimaryHDU(data=data, header=header)
+    else:
+        return fits.ImageHDU(data=data, header=header)
 
-    # get the directory that the data directory is located in
-    direc = Path(Path(__file__).parent)
 
+def _mosaic_standard_header():
+    """
+    Creates the header with the standard keywords that are added to all of the intermediate mosaic images.
+
+    :return: astropy Header object
+    """
     # get the current date_time
     time_now = str(np.datetime64("now"))
 
@@ -868,74 +2671,171 @@ def write_mosaic(
     add_header["HDUCLASS"] = ("OGIP", " Conforms to OGIP/GSFC standards")
     add_header["HDUCLAS1"] = ("IMAGE", " Contains image data")
 
-    # get the type of image that we are saving to denote the name
-    hdu_comment = header.comments["HDUCLAS2"]
-    if "PCODE" in hdu_comment:
-        file_start = "pcode_"
-    elif "EXPMAP" in hdu_comment:
-        file_start = "expmap_"
-    elif "VARIANCE" in hdu_comment:
-        file_start = "var_"
-    elif "SKY_WT_FLUX" in hdu_comment:
-        file_start = "flux_"
+    return add_header
 
-    # read in the appropriate headers and create new headers and save files
-    for i in range(_nskyimg):
-        string = "c%d_%s" % (i, _proj)
-        ra_string = "ra_" + string + ".img"
 
-        ra_file = direc.joinpath("data").joinpath(
-            ra_string
-        )  # os.path.join(direc, "data", ra_string)
-        with fits.open(str(ra_file)) as file:
-            skygrid_header = file[0].header
+def _mosaic_facet_hdulist(img, total_header, facet, emin=_emin, emax=_emax):
+    """
+    Creates the HDUList of one sky facet of an intermediate mosaic image. The partial coding and exposure images have a
+    single HDU while the variance and sky flux images have one HDU per energy bin.
+
+    :param img: numpy array of the mosaic image with the sky facets along the third dimension and, for the variance and
+        sky flux images, the energy bins along the fourth dimension
+    :param total_header: astropy Header object with the image, standard, and skygrid facet keywords. This is modified.
+    :param facet: int of the sky facet that the HDUList is created for
+    :param emin: list of the lower energy values of each energy bin
+    :param emax: list of the upper energy values of each energy bin
+    :return: astropy HDUList object
+    """
+    string = "c%d_%s" % (facet, _proj)
+    total_header["BSKYPLAN"] = (string, "BAT mosaic ZEA sky plane ID (0-5)")
+
+    if img.ndim == 3:
+        # if this the pimg or eimg
+        return fits.HDUList([fits.PrimaryHDU(np.asarray(img[:, :, facet], dtype=np.float64), total_header)])
+
+    hdus = []
+    for j in range(len(emin)):
+        # if this is the variance or sky flux image need ot add energy related header keys
+        total_header["BENRGYBN"] = (
+            f"E_{int(emin[j]):03}_{int(emax[j]):03}",
+            "BAT mosaic energy bin (keV)",
+        )
+        total_header["E_MIN"] = (emin[j], " [keV] Lower energy bin edge")
+        total_header["E_MAX"] = (emax[j], " [keV] Upper energy bin edge")
+
+        data = np.asarray(img[:, :, facet, j], dtype=np.float64)
+        if j == 0:
+            total_header["EXTEND"] = ("T", "File contains extensions")
+            total_header["HDUNAME"] = (
+                f"E_{int(emin[j]):03}_{int(emax[j]):03}",
+                "BAT mosaic energy bin (keV)",
+            )
+            hdus.append(fits.PrimaryHDU(data, total_header))
+        else:
+            if j == 1:
+                total_header.remove("EXTEND")
+                total_header.remove("HDUNAME")
+            total_header["EXTNAME"] = (
+                f"E_{int(emin[j]):03}_{int(emax[j]):03}",
+                "BAT mosaic energy bin (keV)",
+            )
+            hdus.append(fits.ImageHDU(data, total_header))
 
-        total_header = header + add_header + skygrid_header
-        total_header["BSKYPLAN"] = (string, "BAT mosaic ZEA sky plane ID (0-5)")
+    return fits.HDUList(hdus)
 
-        # construct the name of the file that we will be saving
-        savefile = filename_base.joinpath(file_start + string + ".img")
 
-        if img.ndim == 3:
-            # if this the pimg or eimg
-            if i == 0:
-                fits.writeto(str(savefile), img[:, :, i], total_header)
-            else:
-                fits.append(str(savefile), img[:, :, i], total_header)
-        else:
-            for j in range(len(emin)):
-                # if this is the variance or sky flux image need ot add energy related header keys
-                total_header["BENRGYBN"] = (
-                    f"E_{int(emin[j]):03}_{int(emax[j]):03}",
-                    "BAT mosaic energy bin (keV)",
-                )
-                total_header["E_MIN"] = (emin[j], " [keV] Lower energy bin edge")
-                total_header["E_MAX"] = (emax[j], " [keV] Upper energy bin edge")
-
-                if j == 0:
-                    total_header["EXTEND"] = ("T", "File contains extensions")
-                    total_header["HDUNAME"] = (
-                        f"E_{int(emin[j]):03}_{int(emax[j]):03}",
-                        "BAT mosaic energy bin (keV)",
-                    )
-                    fits.writeto(str(savefile), img[:, :, i, j], total_header)
-                else:
-                    if j == 1:
-                        total_header.remove("EXTEND")
-                        total_header.remove("HDUNAME")
-                    total_header["EXTNAME"] = (
-                        f"E_{int(emin[j]):03}_{int(emax[j]):03}",
-                        "BAT mosaic energy bin (keV)",
-                    )
-                    fits.append(str(savefile), img[:, :, i, j], total_header)
+def _final_mosaic_hdulists(intermediate_hdulists):
+    """
+    Converts the intermediate mosaic images of one sky facet to the final images with physical units. The final images
+    are created in memory so each of them can be written with a single write.
+
+    :param intermediate_hdulists: dict of the astropy HDULists, or lists of image HDUs, of the facet's "expmap", "pcode",
+        "flux", and "var" intermediate images
+    :return: dict of the astropy HDULists of the facet's "flatexp", "exposure", "flux", "snr", and "var" final images
+    """
+
+    def final_hdu(hdu, data, index, cards=None):
+        # copy the header of the intermediate image, remove the keywords that only apply to the intermediate images
+        # and update the image specific keywords
+        header = hdu.header.copy()
+        for key in ["BLSTOBS", "BLSTOUTP", "BLSTPNT", "BMOSMON"]:
+            header.remove(key)
+        for key, value in (cards or {}).items():
+            header[key] = value
+        return _mosaic_hdu(data, header, index)
+
+    # the expmap and the pcode are only renamed
+    final_hdulists = dict(
+        flatexp=fits.HDUList([final_hdu(i, i.data, j) for j, i in enumerate(intermediate_hdulists["expmap"])]),
+        exposure=fits.HDUList([final_hdu(i, i.data, j) for j, i in enumerate(intermediate_hdulists["pcode"])]),
+        flux=fits.HDUList(),
+        snr=fits.HDUList(),
+        var=fits.HDUList(),
+    )
+
+    for j, (flux_hdu, var_hdu) in enumerate(zip(intermediate_hdulists["flux"], intermediate_hdulists["var"])):
+        # for the flux, need to do simg/vimg, for the variance need to convert from units of (1/cts/s)^2) to cts/s
+        # and the SNR is the flux divided by the converted variance, ie simg/sqrt(vimg)
+        flux = flux_hdu.data / var_hdu.data
+        std = 1 / np.sqrt(var_hdu.data)
+
+        final_hdulists["flux"].append(
+            final_hdu(
+                flux_hdu,
+                flux,
+                j,
+                {
+                    "BUNIT": ("count/s", " Flux level"),
+                    "HDUCLAS2": ("NET", " Contains net flux map <== FLUX"),
+                    "IMATYPE": ("INTENSITY", " Contains net flux map"),
+                },
+            )
+        )
+        final_hdulists["var"].append(
+            final_hdu(
+                var_hdu,
+                std,
+                j,
+                {
+                    "BUNIT": ("count/s", " Image variance flux level"),
+                    "HDUCLAS2": ("BKG_STDDEV", " Contains std. deviation map <== NOISE"),
+                    "HDUCLAS3": ("PREDICTED", " Predicted standard deviation"),
+                    "IMATYPE": ("ERROR", " Contains std. deviation map"),
+                },
+            )
+        )
+        final_hdulists["snr"].append(
+            final_hdu(
+                flux_hdu,
+                flux / std,
+                j,
+                {
+                    "BUNIT": ("sigma", " Image significance (sigma)"),
+                    "HDUCLAS2": ("SIGNIFICANCE", " Contains significance map <== SNR"),
+                    "IMATYPE": ("SIGNIFICANCE", " Contains significance map"),
+                },
+            )
+        )
 
+    return final_hdulists
 
-def finalize_mosaic(intermediate_mosaic_directory):
+
+def _write_final_mosaic(directory, facet, intermediate_hdulists, compression=None):
+    """
+    Writes the final mosaic images (swiftbat_flatexp, swiftbat_exposure, swiftbat_flux, swiftbat_snr and swiftbat_var)
+    of one sky facet from its intermediate images, which can already be in memory or be read from disk.
+
+    :param directory: Path object of the directory that the final images are saved to
+    :param facet: int of the sky facet
+    :param intermediate_hdulists: dict of the astropy HDULists, or lists of image HDUs, of the facet's "expmap",
+        "pcode", "flux", and "var" intermediate images
+    :param compression: None (the default) or a string of the tile compression of the final images, "rice" or "gzip"
+        (see _write_mosaic_hdulist). The exposure maps are always compressed losslessly since they are smooth and
+        are used to threshold the partial coding of the images.
+    :return: None
+    """
+    for name, hdulist in _final_mosaic_hdulists(intermediate_hdulists).items():
+        _write_mosaic_hdulist(
+            hdulist,
+            Path(directory).joinpath(f"swiftbat_{name}_c{facet}.img"),
+            compression=compression,
+            lossless=name in ["flatexp", "exposure"],
+        )
+
+
+def finalize_mosaic(intermediate_mosaic_directory, compression=None):
     """
     Converts the intermediate mosaic images, located in intermediate_mosaic_directory, to physical units and saves them.
+    Each intermediate image is read once and each final image is written once.
+
+    The mosaic functions of this module already write the final images when they write the intermediate images so this
+    only needs to be called for intermediate images that were created some other way.
 
     :param intermediate_mosaic_directory: Path object that points to the directory where the intermediate mosaic images
-        are located.
+        are located. These can be uncompressed or tile compressed.
+    :param compression: None (the default) or a string of the tile compression of the final images, "rice" or "gzip"
+        (see _write_mosaic_hdulist)
     :return: None
     """
     # takes the intermediate mosaic files and applies proper units
@@ -946,118 +2846,20 @@ def finalize_mosaic(intermediate_mosaic_directory):
     for i in range(_nskyimg):
         string = "c%d_%s" % (i, _proj)
 
-        # copy the expmap to the new name and remove a few header keywords
-        file_name = intermediate_mosaic_directory.joinpath(f"expmap_{string}.img")
-        output_name = intermediate_mosaic_directory.joinpath(
-            f"swiftbat_flatexp_c{i}.img"
-        )
-        shutil.copy(file_name, output_name)
-
-        with fits.open(output_name, mode="update") as file:
-            header = file[0].header
-            header.remove("BLSTOBS")
-            header.remove("BLSTOUTP")
-            header.remove("BLSTPNT")
-            header.remove("BMOSMON")
-            file.flush()
-
-        # do the same for the pcode file
-        file_name = intermediate_mosaic_directory.joinpath(f"pcode_{string}.img")
-        output_name = intermediate_mosaic_directory.joinpath(
-            f"swiftbat_exposure_c{i}.img"
-        )
-        shutil.copy(file_name, output_name)
-
-        with fits.open(output_name, mode="update") as file:
-            header = file[0].header
-            header.remove("BLSTOBS")
-            header.remove("BLSTOUTP")
-            header.remove("BLSTPNT")
-            header.remove("BMOSMON")
-            file.flush()
-
-        # for the flux, need to do simg/vimg and save this for each sky image and energy band
-        # and change some of the header keywords
-        flux_file_name = intermediate_mosaic_directory.joinpath(f"flux_{string}.img")
-        flux_output_name = intermediate_mosaic_directory.joinpath(
-            f"swiftbat_flux_c{i}.img"
-        )
-        shutil.copy(flux_file_name, flux_output_name)
-
-        # for the SNR, need to do simg/sqrt(vimg) and save this for each sky image and energy band
-        # and change some of the header keywords
-        snr_file_name = intermediate_mosaic_directory.joinpath(f"flux_{string}.img")
-        snr_output_name = intermediate_mosaic_directory.joinpath(
-            f"swiftbat_snr_c{i}.img"
-        )
-        shutil.copy(snr_file_name, snr_output_name)
-
-        # after calculating the flux and the SNR, for the variance, need to convert from units of (1/cts/s)^2) to cts/s
-        # and modify the header
-        var_file_name = intermediate_mosaic_directory.joinpath(f"var_{string}.img")
-        var_output_name = intermediate_mosaic_directory.joinpath(
-            f"swiftbat_var_c{i}.img"
-        )
-        shutil.copy(var_file_name, var_output_name)
-
-        # open all the files in update mode
-        flux_file = fits.open(str(flux_output_name), mode="update")
-        snr_file = fits.open(str(snr_output_name), mode="update")
-        var_file = fits.open(str(var_output_name), mode="update")
-
-        for j in range(len(flux_file)):
-            # make modifications for flux
-            flux_file[j].header.remove("BLSTOBS")
-            flux_file[j].header.remove("BLSTOUTP")
-            flux_file[j].header.remove("BLSTPNT")
-            flux_file[j].header.remove("BMOSMON")
-            flux_file[j].header["BUNIT"] = ("count/s", " Flux level")
-            flux_file[j].header["HDUCLAS2"] = ("NET", " Contains net flux map <== FLUX")
-            flux_file[j].header["IMATYPE"] = ("INTENSITY", " Contains net flux map")
-
-            flux_file[j].data = flux_file[j].data / var_file[j].data
-
-            flux_file.flush()
-
-            # make modifications for var
-            var_file[j].header.remove("BLSTOBS")
-            var_file[j].header.remove("BLSTOUTP")
-            var_file[j].header.remove("BLSTPNT")
-            var_file[j].header.remove("BMOSMON")
-            var_file[j].header["BUNIT"] = ("count/s", " Image variance flux level")
-            var_file[j].header["HDUCLAS2"] = (
-                "BKG_STDDEV",
-                " Contains std. deviation map <== NOISE",
-            )
-            var_file[j].header["HDUCLAS3"] = (
-                "PREDICTED",
-                " Predicted standard deviation",
+        intermediate_files = {
+            name: fits.open(str(intermediate_mosaic_directory.joinpath(f"{name}_{string}.img")))
+            for name in ["expmap", "pcode", "flux", "var"]
+        }
+        try:
+            _write_final_mosaic(
+                intermediate_mosaic_directory,
+                i,
+                {name: _image_hdus(file) for name, file in intermediate_files.items()},
+                compression=compression,
             )
-            var_file[j].header["IMATYPE"] = ("ERROR", " Contains std. deviation map")
-            var_file[j].data = 1 / np.sqrt(var_file[j].data)
-            var_file.flush()
-
-            # make modifications for SNR
-            snr_file[j].header.remove("BLSTOBS")
-            snr_file[j].header.remove("BLSTOUTP")
-            snr_file[j].header.remove("BLSTPNT")
-            snr_file[j].header.remove("BMOSMON")
-            snr_file[j].header["BUNIT"] = ("sigma", " Image significance (sigma)")
-            snr_file[j].header["HDUCLAS2"] = (
-                "SIGNIFICANCE",
-                " Contains significance map <== SNR",
-            )
-            snr_file[j].header["IMATYPE"] = (
-                "SIGNIFICANCE",
-                " Contains significance map",
-            )
-            # remember that the data in snr file is the old flux data, so we just overwrite it entirely
-            snr_file[j].data = flux_file[j].data / var_file[j].data
-            snr_file.flush()
-
-        flux_file.close()
-        snr_file.close()
-        var_file.close()
+        finally:
+            for file in intermediate_files.values():
+                file.close()
 
 
 def create_mosaics(
@@ -1068,6 +2870,20 @@ def create_mosaics(
     total_mosaic_savedir=None,
     recalc=False,
     verbose=True,
+    weight_cache_dir=None,
+    weight_cache_size=20,
+    accumulator_type="float64",
+    nprocs=1,
+    chunk_size=None,
+    outventory_index=None,
+    grid_set="standard",
+    prefetch_depth=2,
+    compression=None,
+    contribution_cache_dir=None,
+    contribution_cache_size=0,
+    energy_bands=None,
+    checkpoint_pointings=None,
+    checkpoint_seconds=None,
 ):
     """
     Creates the mosaiced images for specified time bins and a total mosaic image that is "time-integrated" across all
@@ -1081,11 +2897,66 @@ def create_mosaics(
         This will default to using the catalog file that is included with the BatAnalysis package.
     :param total_mosaic_savedir: Default None or a Path object that denotes the directory that the total
         "time-integrated" images will be saved to. The default is to place the total mosaic image in a directory called
-        "total_mosaic" located in the same directory as the outventory file.
+        "total_mosaic" (or "total_mosaic_<grid_set>" for grid sets other than "standard") located in the same directory
+        as the outventory file.
     :param recalc: Boolean False by default. If this calculation was done previously, do not try to load the results of
         prior calculations. Instead recalculate the mosaiced images. The default, will cause the function to try to load
         a save file to save on computational time.
     :param verbose: Boolean True by default. Tells the code to print progress/diagnostic information.
+    :param weight_cache_dir: Default None or a Path object of the directory where the interpolation weights of each
+        pointing are cached (see the InterpWeightCache class). The default is to use a directory called
+        "interp_weight_cache" located in the same directory as the outventory file.
+    :param weight_cache_size: float, default 20, of the maximum size of the interpolation weight cache in GB. Setting
+        this to 0 turns off the caching of the interpolation weights.
+    :param accumulator_type: string of the type of arrays that the mosaic images are summed into (see the
+        MosaicAccumulator class). This can be "float64" (the default), "float32" which uses half the memory, or "memmap"
+        which saves the arrays to disk in the directory of each time bin's mosaic images. "tiled" only allocates the
+        parts of the sky facets that the pointings of a time bin fall on, which saves memory for short time bins, and
+        saves the facets that have no pointings as compact images (see TiledArray). The total mosaic images are summed
+        into the same type of arrays, in the total mosaic directory, while the time bins are computed.
+    :param nprocs: int, default 1, of the number of processes that are used to sum the chunks of pointings (see
+        chunk_size) within each time bin.
+    :param chunk_size: Default None or an int of the number of pointings in each chunk that is summed separately and
+        then combined with a pairwise tree reduction (see _mosaic_loop). The default is to sum all the pointings of a
+        time bin in a single chunk.
+    :param outventory_index: Default None or an OutventoryIndex object of the outventory file. If this is passed in,
+        the observations of each time bin are selected from it instead of being read from the grouped outventory files,
+        which then do not need to be written by group_outventory.
+    :param grid_set: string, default "standard", of the name of the set of skygrids (see _skygrid_sets) that the mosaic
+        images are made on. The "quicklook" set has a 4 times coarser resolution than the "standard" set, which makes
+        the mosaic images much faster to calculate. The time bin directories of sets other than "standard" have the
+        name of the set appended to them.
+    :param prefetch_depth: int, default 2, of the number of pointings whose images are read in background threads
+        ahead of the pointing that is being reprojected (see PointingPrefetcher). Setting this to 0 turns off the
+        prefetching.
+    :param compression: None (the default) or a string of the tile compression of the mosaic images, "rice" or "gzip".
+        The intermediate images, which hold the summed images, are always compressed losslessly with GZIP_2. "rice"
+        compresses the final images with RICE_1 after quantizing them while "gzip" compresses them losslessly. None
+        saves uncompressed images.
+    :param contribution_cache_dir: Default None or a Path object of the directory where the reprojected contribution of
+        each pointing is cached (see the ContributionCache class). The default is to use a directory called
+        "contribution_cache" located in the same directory as the outventory file.
+    :param contribution_cache_size: float, default 0, of the maximum size of the cache of the reprojected contributions
+        of the pointings in GB. The default turns off this cache. When it is on, the pointings that have been mosaiced
+        before are summed from the cache without reading or reprojecting their images, which makes it quick to create
+        the mosaic images for a new set of time bins.
+    :param energy_bands: None or a list of ints of the indexes of the mosaic energy bins that are calculated, where 0-7
+        are the survey energy bands (14-20, 20-24, 24-35, 35-50, 50-75, 75-100, 100-150, and 150-195 keV) and 8 is the
+        total 14-195 keV band. The default is all of them. Only the survey energy bands that are needed are read from
+        the pointings' images and the variance and sky flux images only hold the requested energy bins, so the memory
+        and time that are needed scale with the number of energy bins. The total band is always combined from all of
+        the survey energy bands. The MosaicBatSurvey objects get the energy bins of the mosaic images from their
+        headers, but the spectra of the detected sources (see MosaicBatSurvey.calculate_pha) need all of the energy bins
+        and cant be created for mosaics with a subset of them.
+    :param checkpoint_pointings: Default None or an int of the number of pointings that are summed between checkpoints
+        of the partial sums of each time bin. The checkpoints are saved in the time bin directories (see the
+        MosaicCheckpoint class), so if the calculation is interrupted, calling this function again resumes the time bin
+        that was being calculated from its last checkpoint. The time bins that were completed are not calculated again.
+        This needs recalc=False since with recalc=True the previous checkpoints are removed and every time bin is
+        calculated from the start.
+    :param checkpoint_seconds: Default None or a float of the number of seconds between the checkpoints of each time
+        bin. A checkpoint is saved when either checkpoint_pointings or checkpoint_seconds is reached. The default of None
+        for both turns off the checkpoints.
     :return: a list of MosaicBatSurvey objects correponding to each time bin that was requested, and a single M
         osaicBatSurvey corresponding to the total mosaiced image across all time bins.
     """
@@ -1096,8 +2967,11 @@ def create_mosaics(
     outventory_file = Path(outventory_file)
 
     # get the corections map and the skygrids
-    corrections_map = read_correctionsmap()
-    ra_skygrid, dec_skygrid = read_skygrids()
+    corrections_map = read_correctionsmap(mmap=True)
+    ra_skygrid, dec_skygrid = read_skygrids(mmap=True, grid_set=grid_set)
+
+    # create the spatial index of the skygrid pixels once for all the time bins
+    skygrid_index = SkygridIndex(ra_skygrid, dec_skygrid)
 
     # get the correct catalog file
     if catalog_file is None:
@@ -1109,7 +2983,6 @@ def create_mosaics(
     if type(time_bins) is list:
         time_bins_is_list = True
 
-    intermediate_mosaic_dir_list = []
     all_mosaic_survey = []
 
     # get the number of iterations we need to do in teh loop below
@@ -1120,18 +2993,44 @@ def create_mosaics(
         # this accounts for having the list of just the starting bin edges or the end bin edges
         loop_iters = len(time_bins)
 
+    # see if the total mosaic has been created and saved (ie there is a .batsurvey file in that directory) if there
+    # isnt, or if we set recalc=True, then the images of each time bin are added to a running total as they are
+    # computed. The time bin directories are located in the same directory as the outventory file
+    if total_mosaic_savedir is None:
+        total_mosaic_savedir = outventory_file.parent.joinpath(_total_mosaic_dirname(grid_set))
+    else:
+        total_mosaic_savedir = Path(total_mosaic_savedir)
+
+    if not total_mosaic_savedir.joinpath("batsurvey.pickle").exists() or recalc:
+        dirtest(total_mosaic_savedir)
+        running_total = RunningTotalMosaic(
+            ra_skygrid.shape,
+            accumulator_type=accumulator_type,
+            directory=total_mosaic_savedir.joinpath(".accumulators"),
+            energy_bands=energy_bands,
+        )
+    else:
+        running_total = None
+
     # loop over the time bins
     for i in range(loop_iters):
         if not time_bins_is_list:
             start = time_bins[i]
             end = time_bins[i + 1]
+            edges = (start, end)
         else:
             start = time_bins[i][0, 0]
             end = time_bins[i][1, 0]
+            edges = (time_bins[i][0, :], time_bins[i][1, :])
 
         if verbose:
             print(f"Working on time bins from {start} to {end}.\n")
 
+        if outventory_index is not None:
+            grouped_outventory_data = outventory_index.time_bin(*edges)
+        else:
+            grouped_outventory_data = None
+
         mosaic_obj = _mosaic_loop(
             outventory_file,
             start,
@@ -1142,30 +3041,32 @@ def create_mosaics(
             survey_list,
             recalc=recalc,
             verbose=not verbose,
+            weight_cache_dir=weight_cache_dir,
+            weight_cache_size=weight_cache_size,
+            skygrid_index=skygrid_index,
+            accumulator_type=accumulator_type,
+            nprocs=nprocs,
+            chunk_size=chunk_size,
+            grouped_outventory_data=grouped_outventory_data,
+            grid_set=grid_set,
+            prefetch_depth=prefetch_depth,
+            compression=compression,
+            total_mosaic=running_total,
+            contribution_cache_dir=contribution_cache_dir,
+            contribution_cache_size=contribution_cache_size,
+            energy_bands=energy_bands,
+            checkpoint_pointings=checkpoint_pointings,
+            checkpoint_seconds=checkpoint_seconds,
         )
         if mosaic_obj is not None:
             mosaic_obj.detect_sources(catalog_file=catalog_file)
             all_mosaic_survey.append(mosaic_obj)
 
-    intermediate_mosaic_dir_list = [i.result_dir for i in all_mosaic_survey]
-
-    # see if the total mosaic has been created and saved (ie there is a .batsurvey file in that directory) if there
-    # isnt, then do the full calculation or if we set recalc=True then also do the full calculation
-    if total_mosaic_savedir is None:
-        total_mosaic_savedir = intermediate_mosaic_dir_list[0].parent.joinpath(
-            "total_mosaic"
-        )
-    else:
-        total_mosaic_savedir = Path(total_mosaic_savedir)
-
-    if not total_mosaic_savedir.joinpath("batsurvey.pickle").exists() or recalc:
-        # merge all the mosaics together to get the full 'time integrated' images and convert to final files with
-        # proper units
-        total_dir = merge_mosaics(
-            intermediate_mosaic_dir_list, savedir=total_mosaic_savedir
-        )
-        finalize_mosaic(total_dir)
-        total_mosaic = MosaicBatSurvey(total_dir)
+    if running_total is not None:
+        # write the full 'time integrated' images from the running total, along with the final files with proper units
+        running_total.write(total_mosaic_savedir, compression=compression)
+        running_total.close()
+        total_mosaic = MosaicBatSurvey(total_mosaic_savedir)
         total_mosaic.detect_sources(catalog_file=catalog_file)
         total_mosaic.save()
     else:
@@ -1174,49 +3075,966 @@ def create_mosaics(
     return all_mosaic_survey, total_mosaic
 
 
-def _mosaic_loop(
-    outventory_file,
-    start,
-    end,
+def _read_pointing_images(data_directory, pointing_id, ncleaniter, energy_bands=None):
+    """
+    Reads the partial coding map, sky flux images, variance images and header information of a BAT survey pointing.
+    The files are read into memory (not memory mapped) so all of the I/O happens in this function, which allows it to
+    be run in the background threads of a PointingPrefetcher. The variance images are only read if the exposure of the
+    pointing is over the minimum exposure. Only the survey energy bands that are needed for the requested mosaic energy
+    bins are read (see _pointing_energy_bands).
+
+    :param data_directory: Path object of the directory of the pointing
+    :param pointing_id: string of the pointing ID
+    :param ncleaniter: int of the number of cleaning iterations of the batsurvey analysis, which is in the file names
+    :param energy_bands: None or list of ints of the mosaic energy bins (see _energy_band_indices). Default is all of
+        them.
+    :return: dict with the images as numpy arrays and the header information of the pointing. The sky flux and variance
+        images have a shape of (n_energy, n, m) so the image of each energy band is contiguous in memory, and the
+        "bands" value is the list of the survey energy bands that their first dimension corresponds to.
+    """
+    pointing = dict()
+    read_bands = _pointing_energy_bands(_energy_band_indices(energy_bands))
+    pointing["bands"] = read_bands
+
+    # read the partial coding map, variance map, sky flux map for the pointing
+    pointing_pimg_str = data_directory.joinpath(
+        f"{pointing_id}_{ncleaniter}.img"
+    )
+    with fits.open(str(pointing_pimg_str), memmap=False) as file:
+        # read the partial coding map
+        pointing["pimg"] = file["BAT_PCODE_1"].data
+
+        # get the image size and create array to hold the sky flux at each channel that is needed
+        sz = pointing["pimg"].shape
+        pointing["simg"] = np.zeros((len(read_bands), sz[0], sz[1]))
+        for i, k in enumerate(read_bands):
+            pointing["simg"][i] = file[k].data
+
+        # get other header information
+        pcode_header = file["BAT_PCODE_1"].header
+        pointing["exposure"] = pcode_header["EXPOSURE"]
+        pointing["tstart"] = pcode_header["TSTART"]
+        pointing["tstop"] = pcode_header["TSTOP"]
+        pointing["dateobs_start"] = pcode_header["DATE-OBS"]
+        pointing["dateobs_end"] = pcode_header["DATE-END"]
+
+        # save the header for use later
+        pointing["header"] = file[0].header
+
+    # make sure that the exposure is over the minimum limit
+    if pointing["exposure"] >= _minexpo:
+        # read in the variance images at each energy that is needed
+        pointing["vimg"] = np.zeros_like(pointing["simg"])
+        pointing_vimg_str = data_directory.joinpath(
+            f"{pointing_id}_{ncleaniter}.var"
+        )
+        with fits.open(str(pointing_vimg_str), memmap=False) as file:
+            for i, k in enumerate(read_bands):
+                pointing["vimg"][i] = file[k].data
+
+    return pointing
+
+
+class PointingPrefetcher(object):
+    """
+    Reads the images of a sequence of BAT survey pointings in background threads, ahead of when they are needed. At
+    most depth pointings are read ahead of the pointing that is being used, so the memory that the prefetched images
+    take up is bounded. Iterating over the object returns the result of read_func for each set of arguments, in order.
+
+    Attributes
+    ---------------
+    read_func : function
+        The function that reads the images of a pointing (eg _read_pointing_images)
+    args_list : list of tuples
+        The arguments passed to read_func for each pointing
+    depth : int
+        The maximum number of pointings that are read ahead. If this is 0, the pointings are read when they are needed.
+    stats : dict
+        The diagnostics of the reads: the number of pointings, the number of bytes and the time spent reading them in
+        the threads, the time that was spent waiting for reads to finish, and the number of pointings that had already
+        been read (the queue depth) each time that a pointing was needed
+
+    Methods
+    ---------------
+    summary():
+        Returns a string with the read throughput and the mean queue depth
+    """
+
+    def __init__(self, read_func, args_list, depth=2):
+        """
+        Initializer method for the PointingPrefetcher object.
+
+        :param read_func: function that reads the images of a pointing and returns a dict of numpy arrays and values
+        :param args_list: list of tuples of the arguments of read_func for each pointing
+        :param depth: int, default 2, of the maximum number of pointings that are read ahead
+        """
+        self.read_func = read_func
+        self.args_list = list(args_list)
+        self.depth = max(0, int(depth))
+
+        self.stats = dict(npointings=0, nbytes=0, read_time=0.0, wait_time=0.0, queue_depths=[])
+
+    def _timed_read(self, args):
+        """
+        Reads the images of a pointing and measures how long it takes and how much data was read.
+
+        :param args: tuple of the arguments of read_func
+        :return: the result of read_func, the number of bytes of the arrays that were read and the time it took
+        """
+        t_start = time.perf_counter()
+        result = self.read_func(*args)
+        read_time = time.perf_counter() - t_start
+
+        nbytes = sum(i.nbytes for i in result.values() if isinstance(i, np.ndarray))
+
+        return result, nbytes, read_time
+
+    def _record(self, nbytes, read_time, wait_time):
+        self.stats["npointings"] += 1
+        self.stats["nbytes"] += nbytes
+        self.stats["read_time"] += read_time
+        self.stats["wait_time"] += wait_time
+
+    def __iter__(self):
+        if self.depth == 0:
+            for args in self.args_list:
+                result, nbytes, read_time = self._timed_read(args)
+                self._record(nbytes, read_time, read_time)
+                self.stats["queue_depths"].append(0)
+                yield result
+            return
+
+        with ThreadPoolExecutor(max_workers=self.depth) as executor:
+            args_iter = iter(self.args_list)
+            pending = deque(executor.submit(self._timed_read, args) for args in islice(args_iter, self.depth))
+
+            while len(pending) > 0:
+                future = pending.popleft()
+
+                # the number of pointings that are ready when the next one is needed
+                self.stats["queue_depths"].append(int(future.done()) + sum(i.done() for i in pending))
+
+                t_start = time.perf_counter()
+                result, nbytes, read_time = future.result()
+                self._record(nbytes, read_time, time.perf_counter() - t_start)
+
+                # start reading the next pointing before the current one is used so depth reads are always in flight
+                for args in islice(args_iter, 1):
+                    pending.append(executor.submit(self._timed_read, args))
+
+                yield result
+
+    def summary(self):
+        """
+        Creates a summary of the diagnostics of the reads.
+
+        :return: string with the amount of data that was read, the read throughput, the time spent waiting for reads and
+            the mean queue depth
+        """
+        stats = self.stats
+        nbytes = stats["nbytes"] / 1024**2
+        throughput = nbytes / stats["read_time"] if stats["read_time"] > 0 else np.inf
+        mean_depth = np.mean(stats["queue_depths"]) if len(stats["queue_depths"]) > 0 else 0
+
+        return (
+            f"Read {stats['npointings']} pointings ({nbytes:.1f} MB) at {throughput:.1f} MB/s, waited "
+            f"{stats['wait_time']:.2f} s for reads, mean prefetch queue depth {mean_depth:.2f}/{self.depth}\n"
+        )
+
+
+class PointingWorkspace(object):
+    """
+    Holds the image sized arrays that _pointing_contribution uses to correct and combine the images of the BAT survey
+    pointings. The arrays are allocated for the first pointing and reused for each of the following pointings that a
+    process reprojects, so a pointing only needs a few images worth of memory on top of its own images instead of a
+    number of temporary image cubes.
+
+    Attributes
+    ---------------
+    arrays : dict
+        The arrays, keyed by name
+
+    Methods
+    ---------------
+    get(name, shape, dtype=np.float64):
+        Returns the array with the name, which is allocated if it does not exist or has a different shape or dtype
+    """
+
+    def __init__(self):
+        """
+        Initializer method for the PointingWorkspace object.
+        """
+        self.arrays = dict()
+
+    def get(self, name, shape, dtype=np.float64):
+        """
+        Gets one of the arrays of the workspace. The values of the array are left over from the last time that it was
+        used.
+
+        :param name: string of the name of the array
+        :param shape: tuple of the shape of the array
+        :param dtype: numpy dtype of the array, float64 by default
+        :return: numpy array
+        """
+        array = self.arrays.get(name)
+        if array is None or array.shape != tuple(shape) or array.dtype != dtype:
+            array = np.empty(shape, dtype=dtype)
+            self.arrays[name] = array
+
+        return array
+
+
+def _quality_mask(simg, vimg, pcode_mask, out, scratch):
+    """
+    Creates the quality map of the sky flux and variance images of one energy band of a BAT survey pointing, which is
+    True where the partial coding is over the threshold and the variance is positive and both images are finite.
+
+    :param simg: numpy array of the off-axis corrected sky flux image
+    :param vimg: numpy array of the off-axis corrected variance image
+    :param pcode_mask: boolean numpy array of where the partial coding of the pointing is over _pcodethresh
+    :param out: boolean numpy array that the quality map is saved in
+    :param scratch: boolean numpy array of the same shape that is overwritten
+    :return: out
+    """
+    np.greater(vimg, 0, out=out)
+    out &= pcode_mask
+    np.isfinite(simg, out=scratch)
+    out &= scratch
+    np.isfinite(vimg, out=scratch)
+    out &= scratch
+
+    return out
+
+
+def _total_band_image(images, out, scratch, square=False):
+    """
+    Sums the images of the 8 survey energy bands, or their squares, to create the image of the total 14-195 keV band.
+    The images are added in the same pairwise order that np.sum uses when it sums over the energy dimension of a
+    (n, m, n_energy) array, which is how the total band images were previously calculated, so the results are identical.
+
+    :param images: numpy array of the images of the 8 survey energy bands with a shape of (8, n, m)
+    :param out: numpy array of shape (n, m) that the total band image is saved in
+    :param scratch: list of 3 numpy arrays of shape (n, m) that are overwritten
+    :param square: Boolean False by default. Set to True to sum the squares of the images.
+    :return: out
+    """
+
+    def add_pair(k, pair_out, pair_scratch):
+        if square:
+            np.square(images[k], out=pair_out)
+            np.square(images[k + 1], out=pair_scratch)
+            pair_out += pair_scratch
+        else:
+            np.add(images[k], images[k + 1], out=pair_out)
+
+    # ((0 + 1) + (2 + 3)) + ((4 + 5) + (6 + 7))
+    add_pair(0, out, scratch[2])
+    add_pair(2, scratch[0], scratch[2])
+    out += scratch[0]
+    add_pair(4, scratch[0], scratch[2])
+    add_pair(6, scratch[1], scratch[2])
+    scratch[0] += scratch[1]
+    out += scratch[0]
+
+    return out
+
+
+def _pointing_contribution(
+    pointing,
     corrections_map,
     ra_skygrid,
     dec_skygrid,
-    survey_list,
-    recalc=False,
-    verbose=True,
+    weight_cache=None,
+    skygrid_index=None,
+    energy_bands=None,
+    workspace=None,
 ):
     """
-    The loop that computes the mosaiced images for a time bin of interest. It sums up all the BAT survey observations
-    where:
-     the partial coding images are multiplied by the exposure time of each image and summed
-     the exposure images are directly summed
-     the flux images are weighted by the inverse variance of the image and summed
-     and the inverse variance images are summed together.
-    Then, these intermediate images are converted to physical units where:
-     the flux is multiplied by the summed inverse variance image
-     the inverse variance image is converted back to normal variance.
+    Calculates the contribution of a BAT survey pointing to the mosaic images by correcting the pointing's images for
+    off axis effects and reprojecting them onto the skygrid pixels that the pointing falls on.
 
-    :param outventory_file: Path object that provides the full outventory file of the BAT survey observations that will
-        be used to calculate the mosaiced images.
-    :param start: astropy Time of the start time of the time bin that survey observations need to be made to be included
-        in that time bin's mosaiced image.
-    :param end: astropy Time of the end time of the time bin that survey observations need to be made to be included
-        in that time bin's mosaiced image.
+    The images are processed one energy band at a time with in place operations on the arrays of a PointingWorkspace.
+    The exposure, partial coding, weighted sky flux and inverse variance images are copied into the columns of a block of
+    _reproject_block_size images as they are created and each full block is reprojected with a single sparse matrix
+    product, so only a few images are stacked at once instead of all of them.
+
+    :param pointing: dict with the images and header information of the pointing (see _read_pointing_images). The sky
+        flux and variance images are corrected for the off-axis effects in place.
     :param corrections_map: numpy array with the energy dependent off-axis corrections map
     :param ra_skygrid: numpy array of the skygrid facets' RA values in degrees
     :param dec_skygrid:numpy array of the skygrid facets' DEC values in degrees
-    :param survey_list: list of BAT survey objects that should have been used to create the full outventory file passed
-        into the outventory_file parameter.
-    :param recalc: Boolean False by default. If this calculation was done previously, do not try to load the results of
-        prior calculations. Instead recalculate the mosaiced images. The default, will cause the function to try to load
-        a save file to save on computational time.
-    :param verbose: Boolean True by default. Tells the code to print progress/diagnostic information.
-    :return: a MosaicBatSurvey object correponding to the time bin that was requested
+    :param weight_cache: Default None or an InterpWeightCache object of the cached interpolation weights
+    :param skygrid_index: Default None or a SkygridIndex object of the ra_skygrid/dec_skygrid arrays
+    :param energy_bands: None or list of ints of the mosaic energy bins (see _energy_band_indices) that the contribution
+        is calculated for. Default is all of them. The pointing needs to have been read with the same energy bins.
+    :param workspace: Default None or a PointingWorkspace object whose arrays are used for the calculations. The default
+        is to create one for this pointing, passing in the same object for each pointing avoids allocating the arrays
+        again.
+    :return: dict with the exposure, start/stop times of the pointing along with the skygrid pixel indices (in the
+        format returned by np.where) and the array of reprojected values of these pixels, whose columns are the exposure,
+        the partial coding, the sky flux for each energy and then the inverse variance for each energy. The pixel
+        indices and values are None if the exposure of the pointing is under the minimum exposure.
     """
+    energy_bands = _energy_band_indices(energy_bands)
+    nbands = len(energy_bands)
+
+    if workspace is None:
+        workspace = PointingWorkspace()
+
+    # get the partial coding map, sky flux map and other header information for the pointing
+    pointing_pimg = pointing["pimg"]
+    pointing_simg = pointing["simg"]
+    pointing_exposure = pointing["exposure"]
+    pointing_pimg_header = pointing["header"]
+
+    contribution = dict(
+        exposure=pointing["exposure"],
+        tstart=pointing["tstart"],
+        tstop=pointing["tstop"],
+        dateobs_start=pointing["dateobs_start"],
+        dateobs_end=pointing["dateobs_end"],
+        pixel_idx=None,
+        values=None,
+    )
 
-    if verbose:
-        print(f"Working on time bins from {start} to {end}.\n")
+    # make sure that the exposure is over the minimum limit, the variance images are only read if it is
+    if pointing_exposure >= _minexpo:
+        pointing_vimg = pointing["vimg"]
+        read_bands = pointing["bands"]
+        shape = pointing_pimg.shape
+
+        # the image sized arrays that are reused for each pointing
+        image, scratch0, scratch1, scratch2, total_simg, total_vimg = [
+            workspace.get(i, shape)
+            for i in ["image", "scratch0", "scratch1", "scratch2", "total_simg", "total_vimg"]
+        ]
+        block = workspace.get("block", (pointing_pimg.size, _reproject_block_size))
+        pcode_mask, quality_mask, mask_scratch = [
+            workspace.get(i, shape, dtype=bool) for i in ["pcode_mask", "quality_mask", "mask_scratch"]
+        ]
+
+        # correct for off axis effects, only the survey energy bands that were read are needed
+        for i, k in enumerate(read_bands):
+            np.copyto(image, corrections_map[:, :, k])
+            pointing_vimg[i] /= image
+            pointing_simg[i] /= image
+
+        # need to compute the x/y position for each RA/DEC point in the sky map using the new
+        # file for the pointing of interest and the interpolation weights, these may have been
+        # calculated for this pointing before so see if they are in the cache
+        pixel_idx, vtx, wts = _pointing_interp_weights(
+            ra_skygrid,
+            dec_skygrid,
+            pointing_pimg_header,
+            pointing_pimg.shape,
+            weight_cache=weight_cache,
+            skygrid_index=skygrid_index,
+        )
+
+        # tried if method here works
+        # https://stackoverflow.com/questions/51858194/storing-the-weights-used-by-scipy-griddata-for-re-use/51937990#51937990
+        # found that it took 3247.2622033880034 s versus 722.239518339 s
+        # the sparse matrix below holds the same weights as the interpolate function so it conducts
+        # the same interpolation for each of the images
+        operator = reprojection_operator(vtx, wts, pointing_pimg.size)
+
+        # the columns of the reprojected values are: exposure, partial coding, the sky flux for each energy and then
+        # the inverse variance for each energy
+        interp_values = np.empty((operator.shape[0], 2 + 2 * nbands))
+
+        # the images are added to the block along with the columns of interp_values that they are reprojected into,
+        # the block is reprojected once it is full and after the last image
+        block_columns = []
+
+        def reproject_block():
+            if len(block_columns) > 0:
+                interp_values[:, block_columns] = operator @ block[:, : len(block_columns)]
+                block_columns.clear()
+
+        def reproject(values, column):
+            block[:, len(block_columns)] = values.ravel()
+            block_columns.append(column)
+            if len(block_columns) == _reproject_block_size:
+                reproject_block()
+
+        # the quality map is constructed for each energy and for the total energy images, the images of a pixel are
+        # set to zero when it is bad so any nan values in the images do not mess up the interpolation
+        np.greater(pointing_pimg, _pcodethresh, out=pcode_mask)
+
+        # need to verify that the eimg and pimg maps are energy independent, in idl code only does this
+        # for te first energy iteration
+        _quality_mask(pointing_simg[0], pointing_vimg[0], pcode_mask, quality_mask, mask_scratch)
+        np.logical_not(quality_mask, out=mask_scratch)
+
+        image.fill(pointing_exposure)
+        np.copyto(image, 0, where=mask_scratch)
+        reproject(image, 0)  # Exposure map
+
+        np.multiply(pointing_pimg, pointing_exposure, out=image, dtype=np.float64)
+        np.copyto(image, 0, where=mask_scratch)
+        reproject(image, 1)  # partial coding map
+
+        for i, band in enumerate(energy_bands):
+            if band == _nebands:
+                # construct the total energy images for variance and flux from all of the survey energy bands
+                _total_band_image(pointing_vimg, total_vimg, [scratch0, scratch1, scratch2], square=True)
+                np.sqrt(total_vimg, out=total_vimg)
+                _total_band_image(pointing_simg, total_simg, [scratch0, scratch1, scratch2])
+                band_simg, band_vimg = total_simg, total_vimg
+            else:
+                band_simg = pointing_simg[read_bands.index(band)]
+                band_vimg = pointing_vimg[read_bands.index(band)]
+
+            _quality_mask(band_simg, band_vimg, pcode_mask, quality_mask, mask_scratch)
+            np.logical_not(quality_mask, out=mask_scratch)
+
+            # Convert to 1 / variance
+            np.add(band_vimg, 1e-10, out=image)
+            np.square(image, out=image)
+            np.divide(1.0, image, out=image, where=quality_mask)
+            np.copyto(image, 0, where=mask_scratch)
+
+            # variance weighted sky flux
+            np.multiply(band_simg, image, out=scratch0, where=quality_mask)
+            np.copyto(scratch0, 0, where=mask_scratch)
+
+            reproject(scratch0, 2 + i)
+            reproject(image, 2 + nbands + i)
+
+        reproject_block()
+
+        contribution["pixel_idx"] = pixel_idx
+        contribution["values"] = interp_values
+
+    return contribution
+
+
+class MosaicCheckpoint(object):
+    """
+    Periodically saves the partial sums of the pointings of a time bin, ie the arrays of a MosaicAccumulator object, along
+    with the pointings that have been processed, so a calculation that is interrupted can be resumed from the last
+    checkpoint instead of starting over. The checkpoints are written to a temporary file that then replaces the
+    previous checkpoint, so the checkpoint file is always complete even if the process is killed while it is written.
+
+    Attributes
+    ---------------
+    filename : Path
+        The checkpoint file
+    every_pointings : None or int
+        The number of pointings that are processed between checkpoints
+    every_seconds : None or float
+        The number of seconds between checkpoints
+    fingerprint : None or string
+        The hash of the inputs of the calculation: the pointings that are summed and the paths, sizes and modification
+        times of their image files, the energy bins, the mosaic constants, and samplings of the skygrid and the
+        corrections map (the same inputs as the keys of the ContributionCache). A checkpoint is only resumed if it has
+        the same fingerprint.
+    processed : list
+        The (OBS_ID, IMAGE_ID) pairs of the pointings that have been processed
+    nsaved : int
+        The number of checkpoints that have been saved
+
+    Methods
+    ---------------
+    resume(accumulator, pointings, corrections_map, ra_skygrid, dec_skygrid):
+        Loads the last checkpoint into a MosaicAccumulator object and returns the information of the summed pointings
+    update(accumulator, pointing_info, pointing):
+        Records that a pointing has been processed and saves a checkpoint if one is due
+    save(accumulator, pointing_info):
+        Saves a checkpoint
+    remove():
+        Removes the checkpoint file
+    """
+
+    # the values of the pointing information that are paths
+    _path_keys = ["merged_pointing_dir", "data_directories"]
+
+    def __init__(self, filename, every_pointings=None, every_seconds=None):
+        """
+        Initializer method for the MosaicCheckpoint object.
+
+        :param filename: Path object of the checkpoint file
+        :param every_pointings: None or int of the number of pointings that are processed between checkpoints
+        :param every_seconds: None or float of the number of seconds between checkpoints. A checkpoint is saved when
+            either of every_pointings or every_seconds is reached.
+        """
+        if every_pointings is None and every_seconds is None:
+            raise ValueError("Either every_pointings or every_seconds needs to be set to save checkpoints.")
+
+        self.filename = Path(filename)
+        self.every_pointings = every_pointings
+        self.every_seconds = every_seconds
+        self.fingerprint = None
+        self.processed = []
+        self.nsaved = 0
+
+        self._nprocessed = 0
+        self._last_save = time.monotonic()
+
+    @staticmethod
+    def _fingerprint(accumulator, pointings, corrections_map, ra_skygrid, dec_skygrid):
+        """
+        Creates the fingerprint of a calculation.
+
+        :param accumulator: MosaicAccumulator object that the pointings are summed into
+        :param pointings: list of the (OBS_ID, IMAGE_ID, data directory, number of cleaning iterations) of the pointings
+            that are summed, in order
+        :param corrections_map: numpy array with the energy dependent off-axis corrections map
+        :param ra_skygrid: numpy array of the skygrid facets' RA values in degrees
+        :param dec_skygrid: numpy array of the skygrid facets' DEC values in degrees
+        :return: string of the hash
+        """
+        hash_obj = hashlib.sha1()
+        hash_obj.update(f"{accumulator.skygrid_shape};".encode())
+        _hash_mosaic_inputs(hash_obj, corrections_map, ra_skygrid, dec_skygrid, energy_bands=accumulator.energy_bands)
+        for obsid, pointing_id, data_directory, ncleaniter in pointings:
+            hash_obj.update(f"{obsid}/{pointing_id};".encode())
+            _hash_pointing_files(hash_obj, data_directory, pointing_id, ncleaniter)
+
+        return hash_obj.hexdigest()
+
+    def resume(self, accumulator, pointings, corrections_map, ra_skygrid, dec_skygrid):
+        """
+        Loads the last checkpoint of the calculation, if there is one with the same fingerprint, into a MosaicAccumulator
+        object. The processed attribute is set to the pointings that were processed before the checkpoint.
+
+        :param accumulator: MosaicAccumulator object that the pointings are summed into, its arrays are replaced
+        :param pointings: list of the (OBS_ID, IMAGE_ID, data directory, number of cleaning iterations) of all the
+            pointings that are summed, in order
+        :param corrections_map: numpy array with the energy dependent off-axis corrections map
+        :param ra_skygrid: numpy array of the skygrid facets' RA values in degrees
+        :param dec_skygrid: numpy array of the skygrid facets' DEC values in degrees
+        :return: None if there is no checkpoint to resume, otherwise the dict of lists with the exposures, start/stop
+            times and directories of each pointing that was summed before the checkpoint (see _accumulate_pointings)
+        """
+        self.fingerprint = self._fingerprint(accumulator, pointings, corrections_map, ra_skygrid, dec_skygrid)
+        self.processed = []
+        self._nprocessed = 0
+        self._last_save = time.monotonic()
+
+        if not self.filename.exists():
+            return None
+
+        try:
+            with np.load(self.filename, allow_pickle=False) as state:
+                info = json.loads(str(state["checkpoint_info"]))
+                if info["fingerprint"] != self.fingerprint:
+                    return None
+                accumulator.load_state({i: state[i] for i in state.files if i != "checkpoint_info"})
+        except (OSError, ValueError, KeyError, zipfile.BadZipFile):
+            # a checkpoint that cant be read is ignored
+            return None
+
+        self.processed = [tuple(i) for i in info["processed"]]
+        pointing_info = info["pointing_info"]
+        for key in self._path_keys:
+            pointing_info[key] = [Path(i) for i in pointing_info[key]]
+
+        return pointing_info
+
+    def update(self, accumulator, pointing_info, pointing):
+        """
+        Records that a pointing has been processed and saves a checkpoint if every_pointings pointings have been
+        processed or every_seconds seconds have passed since the last checkpoint.
+
+        :param accumulator: MosaicAccumulator object that the pointings are summed into
+        :param pointing_info: dict of lists with the information of the pointings that have been summed
+        :param pointing: tuple of the (OBS_ID, IMAGE_ID) of the pointing
+        :return: None
+        """
+        self.processed.append(tuple(pointing))
+        self._nprocessed += 1
+
+        if (self.every_pointings is not None and self._nprocessed >= self.every_pointings) or (
+            self.every_seconds is not None and time.monotonic() - self._last_save >= self.every_seconds
+        ):
+            self.save(accumulator, pointing_info)
+
+    def save(self, accumulator, pointing_info):
+        """
+        Saves a checkpoint with the arrays of the MosaicAccumulator object, the processed pointings and the information
+        of the summed pointings.
+
+        :param accumulator: MosaicAccumulator object that the pointings are summed into
+        :param pointing_info: dict of lists with the information of the pointings that have been summed
+        :return: None
+        """
+        info = dict(
+            fingerprint=self.fingerprint,
+            processed=[[str(i) for i in j] for j in self.processed],
+            pointing_info={
+                key: [str(i) if key in self._path_keys else i for i in value] for key, value in pointing_info.items()
+            },
+        )
+
+        # write to a temporary file and then move it so the checkpoint file is never partially written
+        self.filename.parent.mkdir(parents=True, exist_ok=True)
+        tmp_filename = self.filename.with_name(f"{self.filename.stem}.{os.getpid()}.tmp.npz")
+        with open(tmp_filename, "wb") as file:
+            np.savez(file, checkpoint_info=np.array(json.dumps(info)), **accumulator.state())
+            file.flush()
+            os.fsync(file.fileno())
+        os.replace(tmp_filename, self.filename)
+
+        self.nsaved += 1
+        self._nprocessed = 0
+        self._last_save = time.monotonic()
+
+    def remove(self):
+        """
+        Removes the checkpoint file, once the images of the time bin have been written.
+
+        :return: None
+        """
+        self.filename.unlink(missing_ok=True)
+
+
+def _accumulate_pointings(
+    rows,
+    grouped_outventory_data,
+    chi_mask,
+    survey_list,
+    corrections_map,
+    ra_skygrid,
+    dec_skygrid,
+    accumulator,
+    weight_cache=None,
+    skygrid_index=None,
+    verbose=True,
+    prefetch_depth=2,
+    contribution_cache=None,
+    checkpoint=None,
+):
+    """
+    Reprojects the BAT survey pointings of a time bin onto the skygrid and sums them into the arrays of a
+    MosaicAccumulator object. The pointings are added in the order that they are listed in rows. The images of the
+    next pointings are read in background threads while a pointing is reprojected (see the PointingPrefetcher class).
+
+    :param rows: list or numpy array of the row indexes of the pointings in grouped_outventory_data that will be summed
+    :param grouped_outventory_data: the fits table data of the grouped outventory file of the time bin
+    :param chi_mask: numpy array of which pointings have good image statistics (see compute_statistics_map)
+    :param survey_list: list of BAT survey objects that should have been used to create the full outventory file
+    :param corrections_map: numpy array with the energy dependent off-axis corrections map
+    :param ra_skygrid: numpy array of the skygrid facets' RA values in degrees
+    :param dec_skygrid:numpy array of the skygrid facets' DEC values in degrees
+    :param accumulator: MosaicAccumulator object that the reprojected pointings are added to, only the energy bins of
+        the accumulator are read from the pointings' images
+    :param weight_cache: Default None or an InterpWeightCache object of the cached interpolation weights
+    :param skygrid_index: Default None or a SkygridIndex object of the ra_skygrid/dec_skygrid arrays
+    :param verbose: Boolean True by default. Tells the code to print progress/diagnostic information, including the
+        read throughput and queue depth of the prefetched pointing images.
+    :param prefetch_depth: int, default 2, of the number of pointings whose images are read ahead of the pointing that
+        is being reprojected. Setting this to 0 reads the images of each pointing when it is needed.
+    :param contribution_cache: Default None or a ContributionCache object. The pointings whose contributions are
+        cached are summed from the cache, without reading their images, and the contributions of the other pointings
+        are saved to the cache.
+    :param checkpoint: Default None or a MosaicCheckpoint object. If there is a checkpoint of the same pointings, the
+        accumulator is loaded from it and only the pointings that were not processed before the checkpoint are summed.
+        Checkpoints are then saved while the pointings are summed.
+    :return: dict of lists with the exposures, start/stop times and directories of each pointing that was summed
+    """
+    # loop over the survey list to get the observation IDs for reference later
+    survey_obids = [i.obs_id for i in survey_list]
+
+    # this holds the information of the pointings that are included in the mosaic
+    pointing_info = dict(
+        exposure=[],
+        tstart=[],
+        tstop=[],
+        dateobs_start=[],
+        dateobs_end=[],
+        merged_pointing_dir=[],
+        obsids=[],
+        data_directories=[],
+    )
+
+    # find the pointings with good image statistics that will be added and the files that need to be read for them
+    pointings = []
+    for j in rows:
+        obsid = grouped_outventory_data["OBS_ID"][j]
+        pointing_id = grouped_outventory_data["IMAGE_ID"][j]
+
+        # test that we have good image statistics
+        if (
+            (chi_mask[j] == 0)
+            or (grouped_outventory_data["NBATDETS"][j] <= 0)
+            or (grouped_outventory_data["IMAGE_STATUS"][j] == False)
+            or (grouped_outventory_data["EXPOSURE"][j] <= 0)
+        ):
+            if verbose:
+                print(
+                    "Bad image Statistics. Skipping observation ID/Pointing: %s/%s\n"
+                    % (obsid, pointing_id)
+                )
+        else:
+            # get the inde of the appropriate survey object in the list
+            surveylist_idx = survey_obids.index(obsid)
+
+            # need to also make sure that the pointing ID is actually valid and it has all the files necessary
+            pointing_id_number = pointing_id.split("_")[-1]
+            if pointing_id_number in survey_list[surveylist_idx].pointing_ids:
+                # get the directory of the observation ID where the survey result lives
+                batsurvey_result_dir = survey_list[surveylist_idx].result_dir
+
+                data_directory = batsurvey_result_dir.joinpath(
+                    pointing_id
+                )
 
+                ncleaniter = survey_list[surveylist_idx].batsurvey_result.params[
+                    "ncleaniter"
+                ]
+
+                pointings.append((obsid, pointing_id, batsurvey_result_dir, data_directory, ncleaniter))
+
+    # resume from the last checkpoint, the pointings that were processed before it dont need to be summed again
+    if checkpoint is not None:
+        checkpoint_info = checkpoint.resume(
+            accumulator,
+            [(i[0], i[1], i[3], i[4]) for i in pointings],
+            corrections_map,
+            ra_skygrid,
+            dec_skygrid,
+        )
+        if checkpoint_info is not None:
+            pointing_info = checkpoint_info
+            processed = set(checkpoint.processed)
+            pointings = [i for i in pointings if (i[0], i[1]) not in processed]
+            if verbose:
+                print(f"Resumed from the checkpoint {checkpoint.filename} with {len(processed)} processed pointings\n")
+
+    # the pointings whose contributions have been cached dont need their images to be read
+    if contribution_cache is not None:
+        keys = [
+            contribution_cache.key(
+                data_directory,
+                pointing_id,
+                ncleaniter,
+                corrections_map,
+                ra_skygrid,
+                dec_skygrid,
+                energy_bands=accumulator.energy_bands,
+            )
+            for obsid, pointing_id, _, data_directory, ncleaniter in pointings
+        ]
+        is_cached = [contribution_cache.contains(i) for i in keys]
+    else:
+        keys = [None] * len(pointings)
+        is_cached = [False] * len(pointings)
+
+    # the images of the next pointings are read in background threads while the current pointing is reprojected
+    prefetcher = PointingPrefetcher(
+        _read_pointing_images,
+        [
+            (data_directory, pointing_id, ncleaniter, accumulator.energy_bands)
+            for (obsid, pointing_id, _, data_directory, ncleaniter), cached in zip(pointings, is_cached)
+            if not cached
+        ],
+        depth=prefetch_depth,
+    )
+    prefetched_pointings = iter(prefetcher)
+    ncached = 0
+
+    # the arrays that the images of each pointing are corrected and combined in are only allocated once
+    workspace = PointingWorkspace()
+    for (obsid, pointing_id, batsurvey_result_dir, data_directory, ncleaniter), key, cached in zip(
+        pointings, keys, is_cached
+    ):
+        if verbose:
+            print(
+                "Good image Statistics. Working on observation ID/Pointing: %s/%s\n"
+                % (obsid, pointing_id)
+            )
+
+        contribution = contribution_cache.get(key) if cached else None
+        if contribution is not None:
+            ncached += 1
+        else:
+            if cached:
+                # the entry was removed from the cache after it was checked so the images need to be read here
+                pointing = _read_pointing_images(data_directory, pointing_id, ncleaniter, accumulator.energy_bands)
+            else:
+                pointing = next(prefetched_pointings)
+
+            contribution = _pointing_contribution(
+                pointing,
+                corrections_map,
+                ra_skygrid,
+                dec_skygrid,
+                weight_cache=weight_cache,
+                skygrid_index=skygrid_index,
+                energy_bands=accumulator.energy_bands,
+                workspace=workspace,
+            )
+            if contribution_cache is not None:
+                contribution_cache.put(key, contribution, ra_skygrid.shape)
+
+        # the pointing is only included if its exposure is over the minimum limit
+        if contribution["pixel_idx"] is not None:
+            pixel_idx = contribution["pixel_idx"]
+            interp_values = contribution["values"]
+            nbands = accumulator.nbands
+
+            accumulator.eimg[pixel_idx] += interp_values[:, 0]
+            accumulator.pimg[pixel_idx] += interp_values[:, 1]
+            accumulator.simg[pixel_idx] += interp_values[:, 2 : 2 + nbands]
+            accumulator.vimg[pixel_idx] += interp_values[:, 2 + nbands :]
+
+            # keep track of exposure and times
+            pointing_info["exposure"].append(contribution["exposure"])
+            pointing_info["tstart"].append(contribution["tstart"])
+            pointing_info["tstop"].append(contribution["tstop"])
+            pointing_info["dateobs_start"].append(contribution["dateobs_start"])
+            pointing_info["dateobs_end"].append(contribution["dateobs_end"])
+            pointing_info["merged_pointing_dir"].append(batsurvey_result_dir)
+            pointing_info["obsids"].append(obsid)
+            pointing_info["data_directories"].append(data_directory)
+
+        if checkpoint is not None:
+            checkpoint.update(accumulator, pointing_info, (obsid, pointing_id))
+
+    if verbose and prefetcher.stats["npointings"] > 0:
+        print(prefetcher.summary())
+    if verbose and ncached > 0:
+        print(f"Summed the cached contributions of {ncached} pointings\n")
+
+    return pointing_info
+
+
+def _mosaic_chunk(
+    rows,
+    grouped_outventory_data,
+    chi_mask,
+    survey_list,
+    corrections_map,
+    ra_skygrid,
+    dec_skygrid,
+    partial_dir,
+    weight_cache=None,
+    skygrid_index=None,
+    verbose=True,
+    prefetch_depth=2,
+    contribution_cache=None,
+    energy_bands=None,
+    checkpoint=None,
+):
+    """
+    Sums a chunk of the pointings of a time bin into memory mapped partial mosaic arrays that are saved in partial_dir.
+    This is run by the worker processes of _mosaic_loop, the partial arrays are combined with
+    _reduce_partial_accumulators.
+
+    :param rows: list or numpy array of the row indexes of the pointings in grouped_outventory_data that will be summed
+    :param grouped_outventory_data: the fits table data of the grouped outventory file of the time bin
+    :param chi_mask: numpy array of which pointings have good image statistics (see compute_statistics_map)
+    :param survey_list: list of BAT survey objects that should have been used to create the full outventory file
+    :param corrections_map: numpy array with the energy dependent off-axis corrections map
+    :param ra_skygrid: numpy array of the skygrid facets' RA values in degrees
+    :param dec_skygrid:numpy array of the skygrid facets' DEC values in degrees
+    :param partial_dir: Path object of the directory where the partial mosaic arrays are saved
+    :param weight_cache: Default None or an InterpWeightCache object of the cached interpolation weights
+    :param skygrid_index: Default None or a SkygridIndex object of the ra_skygrid/dec_skygrid arrays
+    :param verbose: Boolean True by default. Tells the code to print progress/diagnostic information.
+    :param prefetch_depth: int, default 2, of the number of pointings whose images are read ahead (see
+        PointingPrefetcher)
+    :param contribution_cache: Default None or a ContributionCache object of the cached contributions of the pointings
+    :param energy_bands: None or list of ints of the mosaic energy bins (see _energy_band_indices). Default is all of
+        them.
+    :param checkpoint: Default None or a MosaicCheckpoint object of the chunk (see _accumulate_pointings)
+    :return: dict of lists with the exposures, start/stop times and directories of each pointing that was summed
+    """
+    accumulator = MosaicAccumulator(
+        ra_skygrid.shape, energy_bands=energy_bands, backend="memmap", directory=partial_dir
+    )
+
+    pointing_info = _accumulate_pointings(
+        rows,
+        grouped_outventory_data,
+        chi_mask,
+        survey_list,
+        corrections_map,
+        ra_skygrid,
+        dec_skygrid,
+        accumulator,
+        weight_cache=weight_cache,
+        skygrid_index=skygrid_index,
+        verbose=verbose,
+        prefetch_depth=prefetch_depth,
+        contribution_cache=contribution_cache,
+        checkpoint=checkpoint,
+    )
+
+    accumulator.flush()
+
+    return pointing_info
+
+
+def _add_partial_accumulators(skygrid_shape, partial_dir, other_partial_dir):
+    """
+    Adds the partial mosaic arrays saved in other_partial_dir to the ones saved in partial_dir. The files in
+    other_partial_dir are removed afterwards.
+
+    :param skygrid_shape: tuple of the shape of the skygrid (n, m, n_facets)
+    :param partial_dir: Path object of the directory with the partial mosaic arrays that are added to
+    :param other_partial_dir: Path object of the directory with the partial mosaic arrays that will be added
+    :return: None
+    """
+    accumulator = MosaicAccumulator(skygrid_shape, backend="memmap", directory=partial_dir, mode="r+")
+    other_accumulator = MosaicAccumulator(skygrid_shape, backend="memmap", directory=other_partial_dir, mode="r+")
+
+    accumulator.add(other_accumulator)
+    accumulator.flush()
+    other_accumulator.close()
+
+
+def _reduce_partial_accumulators(skygrid_shape, partial_dirs, nprocs=1):
+    """
+    Combines the partial mosaic arrays with a pairwise tree reduction. At each level of the tree, the partial arrays of
+    neighboring chunks are added together so the order of the additions only depends on the number of chunks and not
+    on the number of processes that are used.
+
+    :param skygrid_shape: tuple of the shape of the skygrid (n, m, n_facets)
+    :param partial_dirs: list of Path objects of the directories with the partial mosaic arrays of each chunk, in the
+        order of the chunks
+    :param nprocs: int of the number of processes used to add the partial arrays at each level of the tree
+    :return: Path object of the directory with the combined partial mosaic arrays
+    """
+    partial_dirs = list(partial_dirs)
+    while len(partial_dirs) > 1:
+        # the loky backend is requested explicitly, otherwise joblib falls back to threads when this is called within a
+        # joblib worker (eg by batmosaic_analysis)
+        Parallel(n_jobs=nprocs, backend="loky")(
+            delayed(_add_partial_accumulators)(skygrid_shape, partial_dirs[i], partial_dirs[i + 1])
+            for i in range(0, len(partial_dirs) - 1, 2)
+        )
+        # an odd chunk at the end gets carried to the next level of the tree
+        partial_dirs = partial_dirs[::2]
+
+    return partial_dirs[0]
+
+
+def _total_mosaic_dirname(grid_set="standard"):
+    """
+    Gets the name of the default directory of the total mosaic images of a set of skygrids.
+
+    :param grid_set: string, default "standard", of the name of the set of skygrids that the mosaic images are made on
+    :return: string of the directory name
+    """
+    if grid_set == "standard":
+        return "total_mosaic"
+
+    return f"total_mosaic_{grid_set}"
+
+
+def _time_bin_paths(outventory_file, start, grid_set="standard"):
+    """
+    Gets the grouped outventory file of a time bin and the directory where the mosaic images of the time bin are saved.
+
+    :param outventory_file: Path object of the full outventory file
+    :param start: astropy Time of the start time of the time bin
+    :param grid_set: string, default "standard", of the name of the set of skygrids that the mosaic images are made on.
+        The name of the set is appended to the directory name of the time bin for sets other than "standard", so mosaics
+        made on different skygrids are kept separate.
+    :return: Path objects of the grouped outventory file and the directory of the time bin's mosaic images
+    """
     # get the name of the file with binned outventory info and where its saved
     savedir = outventory_file.parent.joinpath(
         "grouped_outventory"
@@ -1239,14 +4057,396 @@ def _mosaic_loop(
             f"mosaic_{start.mjd}"
         )
 
+    if grid_set != "standard":
+        img_dir = img_dir.with_name(f"{img_dir.name}_{grid_set}")
+
+    return output_file, img_dir
+
+
+def _read_ledger(img_dir):
+    """
+    Reads the ledger of the (OBS_ID, IMAGE_ID) pairs of the pointings that have been summed into the mosaic images of a
+    time bin.
+
+    :param img_dir: Path object of the directory of the time bin's mosaic images
+    :return: list of (OBS_ID, IMAGE_ID) tuples in the order that the pointings were summed. This is empty if there is
+        no ledger file.
+    """
+    ledger_file = Path(img_dir).joinpath(_ledger_file)
+    if not ledger_file.exists():
+        return []
+
+    with fits.open(str(ledger_file)) as file:
+        return list(zip(file[1].data["OBS_ID"], file[1].data["IMAGE_ID"]))
+
+
+def _write_ledger(img_dir, obsids, pointing_ids):
+    """
+    Saves the ledger of the (OBS_ID, IMAGE_ID) pairs of the pointings that have been summed into the mosaic images of a
+    time bin.
+
+    :param img_dir: Path object of the directory of the time bin's mosaic images
+    :param obsids: list of the observation IDs of the pointings, in the order that they were summed
+    :param pointing_ids: list of the pointing IDs of the pointings, in the order that they were summed
+    :return: None
+    """
+    ledger = Table(
+        [np.array(obsids, dtype=str), np.array(pointing_ids, dtype=str)],
+        names=("OBS_ID", "IMAGE_ID"),
+    )
+    ledger.write(Path(img_dir).joinpath(_ledger_file), format="fits", overwrite=True)
+
+
+def _read_facet_manifest(img_dir):
+    """
+    Reads the manifest of the sky facets of a time bin that no pointings were added to.
+
+    :param img_dir: Path object of the directory of the time bin's mosaic images
+    :return: list of the indices of the empty sky facets. This is empty if there is no manifest file.
+    """
+    manifest_file = Path(img_dir).joinpath(_facet_manifest_file)
+    if not manifest_file.exists():
+        return []
+
+    with fits.open(str(manifest_file)) as file:
+        return [int(i) for i, empty in zip(file[1].data["FACET"], file[1].data["EMPTY"]) if empty]
+
+
+def _write_facet_manifest(img_dir, empty_facets):
+    """
+    Saves the manifest of the sky facets of a time bin that no pointings were added to. The images of these facets are
+    all zeros and are saved as compact compressed images. If there are no empty facets, any previous manifest file is
+    removed.
+
+    :param img_dir: Path object of the directory of the time bin's mosaic images
+    :param empty_facets: list of the indices of the empty sky facets
+    :return: None
+    """
+    manifest_file = Path(img_dir).joinpath(_facet_manifest_file)
+    if len(empty_facets) == 0:
+        manifest_file.unlink(missing_ok=True)
+        return
+
+    manifest = Table(
+        [np.arange(_nskyimg), np.isin(np.arange(_nskyimg), empty_facets)],
+        names=("FACET", "EMPTY"),
+    )
+    manifest.write(manifest_file, format="fits", overwrite=True)
+
+
+def _mosaic_model_header(start, end, pointing_info):
+    """
+    Creates the header keywords that are shared by all the intermediate mosaic images of a time bin.
+
+    :param start: astropy Time of the start time of the time bin
+    :param end: astropy Time of the end time of the time bin
+    :param pointing_info: dict of lists with the exposures, start/stop times and directories of each pointing that was
+        summed (see _accumulate_pointings)
+    :return: astropy Header object
+    """
+    total_binned_exposure = 0  # tally up the total exposure
+    for k in pointing_info["exposure"]:
+        total_binned_exposure += k
+    total_tstart = pointing_info["tstart"]
+    total_tstop = pointing_info["tstop"]
+    total_dateobs_start = pointing_info["dateobs_start"]
+    total_dateobs_end = pointing_info["dateobs_end"]
+    merged_pointing_dir = pointing_info["merged_pointing_dir"]
+    obsids = pointing_info["obsids"]
+    data_directories = pointing_info["data_directories"]
+
+    # create a model header
+    model_hdr = fits.Header()
+    model_hdr["BSURSEQ"] = (
+        "8b",
+        " BAT survey sequence id",
+    )  # was 8b in most recent survey mosaics
+    model_hdr["BSURVER"] = (
+        hsp.__version__,
+        " BAT survey processing version",
+    )  # was 6.16 in  hsp version 0.1.22
+    model_hdr["BMOSVER"] = (
+        "py" + pkg_resources.require("BatAnalysis")[0].version,
+        " BAT mosaic processing version",
+    )
+    model_hdr["BMOSMON"] = (
+        str(start.datetime64.astype("datetime64[D]")),
+        " BAT mosaic processing date",
+    )
+
+    model_hdr["BLSTOUTP"] = (
+        str(merged_pointing_dir[-1]),
+        " BAT archive for last pointing written to mosaic file",
+    )
+    model_hdr["BLSTOBS"] = (
+        obsids[-1],
+        " BAT observation for last pointing written to mosaic file",
+    )
+    model_hdr["BLSTPNT"] = (
+        data_directories[-1].name,
+        " BAT last pointing written to mosaic file",
+    )
+    model_hdr["TSTART"] = (np.min(total_tstart), " start time of image")
+    model_hdr["TSTOP"] = (np.max(total_tstop), " stop time of image")
+    model_hdr["TELAPSE"] = (
+        np.max(total_tstop) - np.min(total_tstart),
+        "  elapsed time of image (= TSTOP-TSTART)",
+    )
+    model_hdr["DATE-OBS"] = (
+        total_dateobs_start[np.argmin(total_tstart)],
+        "  TSTART, expressed in UTC",
+    )
+    model_hdr["DATE-END"] = (
+        total_dateobs_end[np.argmax(total_tstop)],
+        "  TSTOP, expressed in UTC",
+    )
+
+    model_hdr["EXPOSURE"] = (
+        total_binned_exposure,
+        "[sec.] Sum of pointing exposures used",
+    )
+
+    # Add info about the user specified TBIN that was used to create the mosaic
+    start_met = sbu.datetime2met(start.datetime)
+
+    end_met = sbu.datetime2met(end.datetime)
+
+    model_hdr["S_TBIN"] = (start_met, "Mosaicing Start of Time Bin (MET)")
+    model_hdr["E_TBIN"] = (end_met, "Mosaicing End of Time Bin (MET)")
+
+    return model_hdr
+
+
+def _write_intermediate_mosaic(
+    accumulator, model_hdr, img_dir, grid_set="standard", finalize=True, compression=None
+):
+    """
+    Writes out the intermediate mosaic images of a time bin that are held in a MosaicAccumulator object. These images
+    are the persisted accumulators that merge_mosaics and update_mosaic use. The images of each sky facet are built
+    in memory and, by default, the final images are created from them so each file is written once and nothing has to
+    be read back from disk.
+
+    :param accumulator: MosaicAccumulator object with the summed images
+    :param model_hdr: astropy Header object with the keywords shared by all the images (see _mosaic_model_header)
+    :param img_dir: Path object of the directory of the time bin's mosaic images
+    :param grid_set: string, default "standard", of the name of the set of skygrids that the images were made on
+    :param finalize: Boolean True by default. Also write the final images with physical units (see finalize_mosaic).
+    :param compression: None (the default) or a string of the tile compression of the images, "rice" or "gzip" (see
+        _write_mosaic_hdulist). The intermediate images are always compressed losslessly.
+    :return: None
+    """
+    img_dir = Path(img_dir)
+    images = {}
+
+    # the sky facets that no pointings were added to are saved as compact, losslessly compressed, images and they are
+    # listed in the facet manifest so their images dont need to be read when they are summed
+    empty_facets = accumulator.empty_facets()
+    _write_facet_manifest(img_dir, empty_facets)
+
+    # add/modify extra stuff for pcoding*exp image
+    model_hdr["HDUCLAS2"] = (
+        "VIGNETTING",
+        " Contains partial coding map <== PCODE*EXP",
+    )
+    model_hdr["IMATYPE"] = ("EXPOSURE", " Contains partial coding map ")
+    model_hdr["BUNIT"] = ("s ", " Exposure map")
+    images["pcode"] = (accumulator.pimg, model_hdr.copy())
+
+    # add/modify extra stuff for exposure image
+    model_hdr["HDUCLAS2"] = ("FLAT_EXP", " Contains exposure map <== EXPMAP")
+    model_hdr["IMATYPE"] = ("EXPOSURE", " Contains partial coding map ")
+    model_hdr["BUNIT"] = ("s ", " Exposure map")
+    images["expmap"] = (accumulator.eimg, model_hdr.copy())
+
+    # add/modify extra stuff for variance image
+    model_hdr["HDUCLAS2"] = (
+        "VAR_WEIGHTS",
+        " Contains sum of weights <== 1/VARIANCE",
+    )
+    model_hdr["IMATYPE"] = ("VARIANCE", " Contains sum of weights")
+    model_hdr["BUNIT"] = (
+        "1/(counts/sec)^2",
+        " Physical units for sum-of-weights image",
+    )
+    images["var"] = (accumulator.vimg, model_hdr.copy())
+
+    # add/modify extra stuff for sky flux image
+    model_hdr["HDUCLAS2"] = (
+        "SKY_WT_FLUX",
+        " Contains var. weighted sky flux <== SKY_WT_FLUX",
+    )
+    model_hdr["IMATYPE"] = ("INTENSITY", " Contains sky flux flux map")
+    model_hdr["BUNIT"] = (
+        "1/(counts/sec)",
+        " Physical units for weighted-flux image",
+    )
+    images["flux"] = (accumulator.simg, model_hdr.copy())
+
+    add_header = _mosaic_standard_header()
+    skygrid_headers = _get_skygrid_store(grid_set=grid_set).headers
+
+    # the variance and sky flux images only have the energy bins that were accumulated
+    emin = [_emin[k] for k in accumulator.energy_bands]
+    emax = [_emax[k] for k in accumulator.energy_bands]
+
+    # only one facet's images are held in memory at a time
+    for i in range(_nskyimg):
+        string = "c%d_%s" % (i, _proj)
+        facet_compression = "gzip" if i in empty_facets else compression
+        hdulists = {}
+        for name, (img, header) in images.items():
+            hdulists[name] = _mosaic_facet_hdulist(img, header + add_header + skygrid_headers[i], i, emin, emax)
+            _write_mosaic_hdulist(
+                hdulists[name], img_dir.joinpath(f"{name}_{string}.img"), compression=facet_compression, lossless=True
+            )
+
+        if finalize:
+            _write_final_mosaic(img_dir, i, hdulists, compression=facet_compression)
+
+
+def _mosaic_loop(
+    outventory_file,
+    start,
+    end,
+    corrections_map,
+    ra_skygrid,
+    dec_skygrid,
+    survey_list,
+    recalc=False,
+    verbose=True,
+    weight_cache_dir=None,
+    weight_cache_size=20,
+    skygrid_index=None,
+    accumulator_type="float64",
+    nprocs=1,
+    chunk_size=None,
+    grouped_outventory_data=None,
+    grid_set="standard",
+    prefetch_depth=2,
+    compression=None,
+    total_mosaic=None,
+    contribution_cache_dir=None,
+    contribution_cache_size=0,
+    energy_bands=None,
+    checkpoint_pointings=None,
+    checkpoint_seconds=None,
+):
+    """
+    The loop that computes the mosaiced images for a time bin of interest. It sums up all the BAT survey observations
+    where:
+     the partial coding images are multiplied by the exposure time of each image and summed
+     the exposure images are directly summed
+     the flux images are weighted by the inverse variance of the image and summed
+     and the inverse variance images are summed together.
+    Then, these intermediate images are converted to physical units where:
+     the flux is multiplied by the summed inverse variance image
+     the inverse variance image is converted back to normal variance.
+
+    :param outventory_file: Path object that provides the full outventory file of the BAT survey observations that will
+        be used to calculate the mosaiced images.
+    :param start: astropy Time of the start time of the time bin that survey observations need to be made to be included
+        in that time bin's mosaiced image.
+    :param end: astropy Time of the end time of the time bin that survey observations need to be made to be included
+        in that time bin's mosaiced image.
+    :param corrections_map: numpy array with the energy dependent off-axis corrections map
+    :param ra_skygrid: numpy array of the skygrid facets' RA values in degrees
+    :param dec_skygrid:numpy array of the skygrid facets' DEC values in degrees
+    :param survey_list: list of BAT survey objects that should have been used to create the full outventory file passed
+        into the outventory_file parameter.
+    :param recalc: Boolean False by default. If this calculation was done previously, do not try to load the results of
+        prior calculations. Instead recalculate the mosaiced images. The default, will cause the function to try to load
+        a save file to save on computational time.
+    :param verbose: Boolean True by default. Tells the code to print progress/diagnostic information.
+    :param weight_cache_dir: Default None or a Path object of the directory where the interpolation weights of each
+        pointing are cached (see the InterpWeightCache class). The default is to use a directory called
+        "interp_weight_cache" located in the same directory as the outventory file.
+    :param weight_cache_size: float, default 20, of the maximum size of the interpolation weight cache in GB. Setting
+        this to 0 turns off the caching of the interpolation weights.
+    :param skygrid_index: Default None or a SkygridIndex object of the ra_skygrid/dec_skygrid arrays. This is used to
+        only project the skygrid pixels that are near each pointing. The default is to create it in this function.
+    :param accumulator_type: string of the type of arrays that the mosaic images are summed into (see the
+        MosaicAccumulator class). This can be "float64" (the default), "float32" which uses half the memory, "memmap"
+        which saves the arrays to disk in the directory of the time bin's mosaic images, or "tiled" which only allocates
+        the parts of the skygrid that the pointings fall on (see create_mosaics).
+    :param nprocs: int, default 1, of the number of processes that are used to sum the chunks of pointings (see
+        chunk_size) of the time bin.
+    :param chunk_size: Default None or an int of the number of pointings in each chunk. Each chunk of pointings is summed
+        separately, in parallel if nprocs>1, and then the chunks are combined with a pairwise tree reduction. The
+        results only depend on chunk_size and are identical for any value of nprocs. The default is to sum all the
+        pointings of the time bin in a single chunk.
+    :param grouped_outventory_data: Default None or the astropy FITS_rec of the outventory rows of the time bin, from
+        the time_bin method of an OutventoryIndex object. The default is to read the grouped outventory file of the time
+        bin that was created by group_outventory.
+    :param grid_set: string, default "standard", of the name of the set of skygrids (see _skygrid_sets) that
+        ra_skygrid/dec_skygrid belong to. The images of sets other than "standard" are saved in a directory with the
+        name of the set appended to the time bin's directory name.
+    :param prefetch_depth: int, default 2, of the number of pointings whose images are read in background threads
+        ahead of the pointing that is being reprojected (see PointingPrefetcher). Setting this to 0 turns off the
+        prefetching.
+    :param compression: None (the default) or a string of the tile compression of the mosaic images, "rice" or "gzip"
+        (see create_mosaics).
+    :param total_mosaic: Default None or a RunningTotalMosaic object that the time bin's images are added to. The images
+        are added from memory if they are computed, otherwise they are read from the time bin's intermediate mosaic
+        images.
+    :param contribution_cache_dir: Default None or a Path object of the directory where the reprojected contribution of
+        each pointing is cached (see create_mosaics).
+    :param contribution_cache_size: float, default 0, of the maximum size of the cache of the reprojected contributions
+        of the pointings in GB (see create_mosaics). The default turns off this cache.
+    :param energy_bands: None or list of ints of the indexes of the mosaic energy bins that are calculated (see
+        create_mosaics). Default is all of them.
+    :param checkpoint_pointings: Default None or an int of the number of pointings that are summed between the
+        checkpoints of the partial sums of the time bin (see the MosaicCheckpoint class). The checkpoints are saved in
+        the time bin's directory and when the time bin is calculated again after being interrupted, with recalc=False,
+        the calculation is resumed from the last checkpoint. With recalc=True any previous checkpoints are removed and
+        the time bin is calculated from the start. The checkpoints are removed once the mosaic images have been written.
+    :param checkpoint_seconds: Default None or a float of the number of seconds between the checkpoints of the partial
+        sums of the time bin. A checkpoint is saved when either checkpoint_pointings or checkpoint_seconds is reached.
+        The default of None for both turns off the checkpoints.
+    :return: a MosaicBatSurvey object correponding to the time bin that was requested
+    """
+
+    if verbose:
+        print(f"Working on time bins from {start} to {end}.\n")
+
+    # get the name of the file with binned outventory info and the directory of the time bin where the images will be
+    # saved
+    output_file, img_dir = _time_bin_paths(outventory_file, start, grid_set=grid_set)
+
     # see if there is a .batsurvey file, if it doesnt exist or if we want to recalc things then go through the full loop
     if not img_dir.joinpath("batsurvey.pickle").exists() or recalc:
-        # loop over the survey list to get the observation IDs for reference later
-        survey_obids = [i.obs_id for i in survey_list]
+        # the directories of the standard skygrids are created by group_outventory, the others are created here
+        if grid_set != "standard":
+            dirtest(img_dir)
+
+        # the checkpoints of a previous calculation of the time bin are not resumed when it is recalculated
+        if recalc:
+            for checkpoint_file in img_dir.glob("mosaic_checkpoint*.npz"):
+                checkpoint_file.unlink(missing_ok=True)
+
+        # set up the cache of the interpolation weights for each pointing
+        if weight_cache_size > 0:
+            if weight_cache_dir is None:
+                weight_cache_dir = outventory_file.parent.joinpath("interp_weight_cache")
+            weight_cache = InterpWeightCache(weight_cache_dir, max_size=weight_cache_size)
+        else:
+            weight_cache = None
+
+        # set up the cache of the reprojected contributions of each pointing
+        if contribution_cache_size > 0:
+            if contribution_cache_dir is None:
+                contribution_cache_dir = outventory_file.parent.joinpath("contribution_cache")
+            contribution_cache = ContributionCache(contribution_cache_dir, max_size=contribution_cache_size)
+        else:
+            contribution_cache = None
+
+        # create the spatial index of the skygrid pixels if needed
+        if skygrid_index is None:
+            skygrid_index = SkygridIndex(ra_skygrid, dec_skygrid)
 
         # read the fits file for the date/time of interest
-        with fits.open(str(output_file)) as file:
-            grouped_outventory_data = file[1].data
+        if grouped_outventory_data is None:
+            with fits.open(str(output_file)) as file:
+                grouped_outventory_data = file[1].data
 
         # if there are survey observations within the time bin of interest do all this stuff
         if grouped_outventory_data["NBATDETS"].size > 0:
@@ -1260,371 +4460,689 @@ def _mosaic_loop(
                 grouped_outventory_data["TSTART"],
             )
 
-            # create the arays that will hold the binned data
-            eimg = np.zeros_like(
-                ra_skygrid
-            )  # exposure map, has the same dimensions as the skygrid
-            pimg = np.zeros_like(ra_skygrid)  # Partial coding map
-            nx, ny, nz = ra_skygrid.shape
-            vimg = np.zeros(
-                (nx, ny, nz, _nebands + 1)
-            )  # Variance map, size of skygrid with extra enegy dimension (+1 for total 14-195 band)
-            simg = np.zeros_like(vimg)  # Sky flux  image
+            # create the arays that will hold the binned data, the exposure map and partial coding map have the same
+            # dimensions as the skygrid, the variance map and sky flux image are the size of skygrid with extra enegy
+            # dimension for the requested energy bins (by default all of them including the total 14-195 band)
+            accumulator = MosaicAccumulator(
+                ra_skygrid.shape,
+                energy_bands=energy_bands,
+                backend=accumulator_type,
+                directory=img_dir.joinpath(".accumulators"),
+            )
 
-        total_binned_exposure = 0  # tally up the total exposure
-        total_tstart = []
-        total_tstop = []
-        total_dateobs_start = []
-        total_dateobs_end = []
-        total_headers = []
-
-        # this holds the merged files in the next loop
-        merged_pointing_dir = []
-        obsids = []
-        data_directories = []
-
-        # loop over the observation IDs and the pointings that are outlined in the
-        for j in range(grouped_outventory_data["NBATDETS"].size):
-            obsid = grouped_outventory_data["OBS_ID"][j]
-            pointing_id = grouped_outventory_data["IMAGE_ID"][j]
-
-            # test that we have good image statistics
-            if (
-                (chi_mask[j] == 0)
-                or (grouped_outventory_data["NBATDETS"][j] <= 0)
-                or (grouped_outventory_data["IMAGE_STATUS"][j] == False)
-                or (grouped_outventory_data["EXPOSURE"][j] <= 0)
-            ):
-                if verbose:
-                    print(
-                        "Bad image Statistics. Skipping observation ID/Pointing: %s/%s\n"
-                        % (obsid, pointing_id)
-                    )
+            # split the pointings into chunks that are summed separately and then combined with a tree reduction,
+            # the chunks dont depend on nprocs so the results are the same for any number of processes
+            rows = np.arange(grouped_outventory_data["NBATDETS"].size)
+            if chunk_size is None or chunk_size >= rows.size:
+                chunks = [rows]
             else:
-                if verbose:
-                    print(
-                        "Good image Statistics. Working on observation ID/Pointing: %s/%s\n"
-                        % (obsid, pointing_id)
+                chunks = [rows[k : k + chunk_size] for k in range(0, rows.size, chunk_size)]
+
+            # each chunk has its own checkpoints since the chunks are summed separately
+            if checkpoint_pointings is not None or checkpoint_seconds is not None:
+                checkpoints = [
+                    MosaicCheckpoint(
+                        img_dir.joinpath(_checkpoint_file if len(chunks) == 1 else f"mosaic_checkpoint_chunk_{k}.npz"),
+                        every_pointings=checkpoint_pointings,
+                        every_seconds=checkpoint_seconds,
                     )
-
-                # get the inde of the appropriate survey object in the list
-                surveylist_idx = survey_obids.index(obsid)
-
-                # need to also make sure that the pointing ID is actually valid and it has all the files necessary
-                pointing_id_number = pointing_id.split("_")[-1]
-                if pointing_id_number in survey_list[surveylist_idx].pointing_ids:
-                    # get the directory of the observation ID where the survey result lives
-                    batsurvey_result_dir = survey_list[surveylist_idx].result_dir
-
-                    data_directory = batsurvey_result_dir.joinpath(
-                        pointing_id
+                    for k in range(len(chunks))
+                ]
+            else:
+                checkpoints = [None] * len(chunks)
+
+            if len(chunks) == 1:
+                pointing_info = _accumulate_pointings(
+                    rows,
+                    grouped_outventory_data,
+                    chi_mask,
+                    survey_list,
+                    corrections_map,
+                    ra_skygrid,
+                    dec_skygrid,
+                    accumulator,
+                    weight_cache=weight_cache,
+                    skygrid_index=skygrid_index,
+                    verbose=verbose,
+                    prefetch_depth=prefetch_depth,
+                    contribution_cache=contribution_cache,
+                    checkpoint=checkpoints[0],
+                )
+            else:
+                partial_dirs = [img_dir.joinpath(f".accumulator_chunk_{k}") for k in range(len(chunks))]
+                # the chunks are summed in separate processes even when the time bins themselves are calculated in
+                # joblib workers, where joblib would otherwise fall back to threads that are limited by the GIL
+                all_pointing_info = Parallel(n_jobs=nprocs, backend="loky")(
+                    delayed(_mosaic_chunk)(
+                        chunk,
+                        grouped_outventory_data,
+                        chi_mask,
+                        survey_list,
+                        corrections_map,
+                        ra_skygrid,
+                        dec_skygrid,
+                        partial_dir,
+                        weight_cache=weight_cache,
+                        skygrid_index=skygrid_index,
+                        verbose=verbose,
+                        prefetch_depth=prefetch_depth,
+                        contribution_cache=contribution_cache,
+                        energy_bands=energy_bands,
+                        checkpoint=checkpoint,
                     )
+                    for chunk, partial_dir, checkpoint in zip(chunks, partial_dirs, checkpoints)
+                )
 
-                    ncleaniter = survey_list[surveylist_idx].batsurvey_result.params[
-                        "ncleaniter"
-                    ]
+                reduced_dir = _reduce_partial_accumulators(ra_skygrid.shape, partial_dirs, nprocs=nprocs)
+                partial_accumulator = MosaicAccumulator(
+                    ra_skygrid.shape, backend="memmap", directory=reduced_dir, mode="r+"
+                )
+                accumulator.add(partial_accumulator)
+                partial_accumulator.close()
 
-                    # read the partial coding map, variance map, sky flux map for the pointing
-                    pointing_pimg_str = data_directory.joinpath(
-                        f"{pointing_id}_{ncleaniter}.img"
-                    )
-                    with fits.open(str(pointing_pimg_str)) as file:
-                        # read the partial coding map
-                        pointing_pimg = file["BAT_PCODE_1"].data
-
-                        # get the image size and create array to hold the sky flux at each channel
-                        sz = pointing_pimg.shape
-                        pointing_simg = np.zeros(
-                            (sz[0], sz[1], _nebands + 1)
-                        )  # plus 1 for the total energy
-                        for k in range(_nebands):
-                            pointing_simg[:, :, k] = file[k].data
-
-                        # get other header information
-                        survey_ver = file["BAT_PCODE_1"].header["BSURVER"]
-                        # survey_eq=file['BAT_PCODE_1'].header['BSURSEQ'] #not in there? it is 8b in the headers on the machines
-                        pointing_exposure = file["BAT_PCODE_1"].header["EXPOSURE"]
-                        pointing_tstart = file["BAT_PCODE_1"].header["TSTART"]
-                        pointing_tstop = file["BAT_PCODE_1"].header["TSTOP"]
-                        pointing_dateobs_start = file["BAT_PCODE_1"].header["DATE-OBS"]
-                        pointing_dateobs_end = file["BAT_PCODE_1"].header["DATE-END"]
-
-                        # save the header for use later
-                        pointing_pimg_header = file[0].header
-
-                    # make sure that the exposure is over the minimum limit
-                    if pointing_exposure >= _minexpo:
-                        # read in the variance images at each energy
-                        pointing_vimg = np.zeros_like(pointing_simg)
-                        pointing_vimg_str = data_directory.joinpath(
-                            f"{pointing_id}_{ncleaniter}.var"
-                        )
-                        with fits.open(str(pointing_vimg_str)) as file:
-                            for k in range(_nebands):
-                                pointing_vimg[:, :, k] = file[k].data
-
-                        # correct for off axis effects
-                        pointing_vimg_corr = np.zeros_like(pointing_vimg)
-                        pointing_simg_corr = np.zeros_like(pointing_vimg)
-                        pointing_vimg_corr[:, :, :-1] = (
-                            pointing_vimg[:, :, :-1] / corrections_map
-                        )
-                        pointing_simg_corr[:, :, :-1] = (
-                            pointing_simg[:, :, :-1] / corrections_map
-                        )
+                # combine the pointing information in the same order as the pointings
+                pointing_info = {
+                    key: [k for info in all_pointing_info for k in info[key]] for key in all_pointing_info[0]
+                }
 
-                        # construct the total energy images for variance and flux, the zeros in last array dont affect
-                        # calculations of the total values
-                        pointing_vimg_corr[:, :, -1] = np.sqrt(
-                            np.sum(pointing_vimg_corr**2, axis=2)
-                        )
-                        pointing_simg_corr[:, :, -1] = pointing_simg_corr.sum(axis=2)
-
-                        # construct the quality map for each energy and for the total energy images
-                        energy_quality_mask = np.zeros_like(pointing_vimg_corr)
-                        good_idx = np.where(
-                            (
-                                np.repeat(
-                                    pointing_pimg[:, :, np.newaxis],
-                                    pointing_vimg_corr.shape[-1],
-                                    axis=2,
-                                )
-                                > _pcodethresh
-                            )
-                            & (pointing_vimg_corr > 0)
-                            & np.isfinite(pointing_simg_corr)
-                            & np.isfinite(pointing_vimg_corr)
-                        )
-                        energy_quality_mask[good_idx] = 1
-
-                        # make the intermediate maps for each energy and for the total energy
-                        interm_pointing_eimg = (
-                            energy_quality_mask * pointing_exposure
-                        )  # Exposure map
-                        interm_pointing_pimg = (
-                            pointing_pimg[:, :, np.newaxis]
-                            * energy_quality_mask
-                            * pointing_exposure
-                        )  # partial coding map
-                        interm_pointing_vimg = (
-                            energy_quality_mask / (pointing_vimg_corr + 1e-10) ** 2
-                        )  # Convert to 1 / variance
-                        interm_pointing_simg = (
-                            pointing_simg_corr
-                            * energy_quality_mask
-                            * interm_pointing_vimg
-                        )  # variance weighted sky flux
-
-                        # need to compute the x/y position for each RA/DEC point in the sky map using the new
-                        # file for the pointing of interest
-                        pixel_x, pixel_y = convert_radec2xy(
-                            ra_skygrid, dec_skygrid, pointing_pimg_header
-                        )
+            merged_pointing_dir = pointing_info["merged_pointing_dir"]
+            obsids = pointing_info["obsids"]
+            data_directories = pointing_info["data_directories"]
 
-                        # get the good values, in the idl file the shape of pointing_pimg is reversed, not sure if
-                        # this is correct here.
-                        pixel_idx = np.where(
-                            (pixel_y <= pointing_pimg.shape[0])
-                            & (pixel_x <= pointing_pimg.shape[1])
-                            & (pixel_x >= -1)
-                            & (pixel_y >= -1)
-                            & np.isfinite(pixel_x)
-                            & np.isfinite(pixel_y)
-                        )
-                        chosen_pixel_x = pixel_x[pixel_idx]
-                        chosen_pixel_y = pixel_y[pixel_idx]
-
-                        # need to interpolate the survey sky image onto the all sky image
-                        # need to verify that the eimg and pimg maps are energy independent, in idl code only does this
-                        # for te first energy iteration
-                        grid_x, grid_y = np.mgrid[
-                            0 : pointing_pimg.shape[0], 0 : pointing_pimg.shape[1]
-                        ]
-                        points = np.array([grid_x.flatten(), grid_y.flatten()])
-                        values = interm_pointing_eimg[:, :, 0]
-                        values[np.isnan(values)] = 0
-
-                        # before had: #np.array([chosen_pixel_x, chosen_pixel_y]) for the below line but the results
-                        # werent consistent with the idl code results. changing the x and y pixel coordinates here works
-                        interp_at_points = np.array([chosen_pixel_y, chosen_pixel_x])
-
-                        # see if thie other method works,
-                        # https://stackoverflow.com/questions/20915502/speedup-scipy-griddata-for-multiple-interpolations-between-two-irregular-grids
-                        vtx, wts = interp_weights(points.T, interp_at_points.T)
-                        test = interpolate(values.flatten(), vtx, wts, fill_value=0)
-                        eimg[
-                            pixel_idx
-                        ] += test  # new interpolate dir, took 722.239518339 s
-
-                        # tried if method here works
-                        # https://stackoverflow.com/questions/51858194/storing-the-weights-used-by-scipy-griddata-for-re-use/51937990#51937990
-                        # found that it took 3247.2622033880034 s versus 722.239518339 s
-
-                        values = interm_pointing_pimg[:, :, 0]
-                        values[
-                            np.isnan(values)
-                        ] = 0  # if there are nan values in the images, this can mess up the interpolation
-
-                        test = interpolate(values.flatten(), vtx, wts, fill_value=0)
-                        pimg[pixel_idx] += test
-
-
-                        for k in range(_nebands + 1):
-                            values = interm_pointing_simg[:, :, k]
-                            values[np.isnan(values)] = 0
-
-                            test = interpolate(values.flatten(), vtx, wts, fill_value=0)
-                            simg[:, :, :, k][pixel_idx] += test  # new interpolate dir
-
-                            values = interm_pointing_vimg[:, :, k]
-                            values[np.isnan(values)] = 0
-
-                            test = interpolate(values.flatten(), vtx, wts, fill_value=0)
-                            vimg[:, :, :, k][pixel_idx] += test  # new interpolate dir
-
-
-                        # keep track of exposure and times
-                        total_binned_exposure += pointing_exposure
-                        total_tstart.append(pointing_tstart)
-                        total_tstop.append(pointing_tstop)
-                        total_dateobs_start.append(pointing_dateobs_start)
-                        total_dateobs_end.append(pointing_dateobs_end)
-                        merged_pointing_dir.append(batsurvey_result_dir)
-                        obsids.append(obsid)
-                        data_directories.append(data_directory)
+            # nothing will be written if there were no good pointings
+            if len(merged_pointing_dir) == 0:
+                accumulator.close()
+        else:
+            merged_pointing_dir = []
+            checkpoints = []
 
         # only do this stuff if there were files that needed to be mosaiced
         # if there were no files that were mosaiced for the time interval dont copy any of the template fits files
         # to save space, also dont include these time bins in the total mosaic calculation
         if len(merged_pointing_dir) > 0:
 
-            # need to write the outputs after combining datasets that fall within a time bin
-            # create a model header
-            model_hdr = fits.Header()
-            model_hdr["BSURSEQ"] = (
-                "8b",
-                " BAT survey sequence id",
-            )  # was 8b in most recent survey mosaics
-            model_hdr["BSURVER"] = (
-                hsp.__version__,
-                " BAT survey processing version",
-            )  # was 6.16 in  hsp version 0.1.22
-            model_hdr["BMOSVER"] = (
-                "py" + pkg_resources.require("BatAnalysis")[0].version,
-                " BAT mosaic processing version",
-            )
-            model_hdr["BMOSMON"] = (
-                str(start.datetime64.astype("datetime64[D]")),
-                " BAT mosaic processing date",
+            # need to write the outputs after combining datasets that fall within a time bin along with the ledger of
+            # the pointings that were included. The final files with proper units are written at the same time
+            model_hdr = _mosaic_model_header(start, end, pointing_info)
+            _write_intermediate_mosaic(
+                accumulator, model_hdr, img_dir, grid_set=grid_set, compression=compression
             )
+            _write_ledger(img_dir, obsids, [k.name for k in data_directories])
 
-            model_hdr["BLSTOUTP"] = (
-                str(merged_pointing_dir[-1]),
-                " BAT archive for last pointing written to mosaic file",
-            )
-            model_hdr["BLSTOBS"] = (
-                obsids[-1],
-                " BAT observation for last pointing written to mosaic file",
-            )
-            model_hdr["BLSTPNT"] = (
-                data_directories[-1].name,
-                " BAT last pointing written to mosaic file",
-            )
-            model_hdr["TSTART"] = (np.min(total_tstart), " start time of image")
-            model_hdr["TSTOP"] = (np.max(total_tstop), " stop time of image")
-            model_hdr["TELAPSE"] = (
-                np.max(total_tstop) - np.min(total_tstart),
-                "  elapsed time of image (= TSTOP-TSTART)",
-            )
-            model_hdr["DATE-OBS"] = (
-                total_dateobs_start[np.argmin(total_tstart)],
-                "  TSTART, expressed in UTC",
-            )
-            model_hdr["DATE-END"] = (
-                total_dateobs_end[np.argmax(total_tstop)],
-                "  TSTOP, expressed in UTC",
-            )
-
-            model_hdr["EXPOSURE"] = (
-                total_binned_exposure,
-                "[sec.] Sum of pointing exposures used",
-            )
-
-            # Add info about the user specified TBIN that was used to create the mosaic
-            start_met = sbu.datetime2met(start.datetime)
-
-            end_met = sbu.datetime2met(end.datetime)
+            # add the images to the running total before the arrays are removed, so the total mosaic images dont need
+            # to read them back from disk
+            if total_mosaic is not None:
+                total_mosaic.add(accumulator, model_hdr, img_dir)
 
-            model_hdr["S_TBIN"] = (start_met, "Mosaicing Start of Time Bin (MET)")
-            model_hdr["E_TBIN"] = (end_met, "Mosaicing End of Time Bin (MET)")
-
-            # add/modify extra stuff for pcoding*exp image
-            model_hdr["HDUCLAS2"] = (
-                "VIGNETTING",
-                " Contains partial coding map <== PCODE*EXP",
-            )
-            model_hdr["IMATYPE"] = ("EXPOSURE", " Contains partial coding map ")
-            model_hdr["BUNIT"] = ("s ", " Exposure map")
-            write_mosaic(pimg, model_hdr, img_dir)
-
-            # add/modify extra stuff for exposure image
-            model_hdr["HDUCLAS2"] = ("FLAT_EXP", " Contains exposure map <== EXPMAP")
-            model_hdr["IMATYPE"] = ("EXPOSURE", " Contains partial coding map ")
-            model_hdr["BUNIT"] = ("s ", " Exposure map")
-            write_mosaic(eimg, model_hdr, img_dir)
-
-            # add/modify extra stuff for variance image
-            model_hdr["HDUCLAS2"] = (
-                "VAR_WEIGHTS",
-                " Contains sum of weights <== 1/VARIANCE",
-            )
-            model_hdr["IMATYPE"] = ("VARIANCE", " Contains sum of weights")
-            model_hdr["BUNIT"] = (
-                "1/(counts/sec)^2",
-                " Physical units for sum-of-weights image",
-            )
-            write_mosaic(vimg, model_hdr, img_dir)
-
-            # add/modify extra stuff for sky flux image
-            model_hdr["HDUCLAS2"] = (
-                "SKY_WT_FLUX",
-                " Contains var. weighted sky flux <== SKY_WT_FLUX",
-            )
-            model_hdr["IMATYPE"] = ("INTENSITY", " Contains sky flux flux map")
-            model_hdr["BUNIT"] = (
-                "1/(counts/sec)",
-                " Physical units for weighted-flux image",
-            )
-            write_mosaic(simg, model_hdr, img_dir)
+            # the intermediate images have been saved so we dont need the arrays anymore
+            accumulator.close()
+            if verbose:
+                print(f"Peak memory usage: {_peak_memory_usage():.2f} GB\n")
 
             # in idl code the mosaic_wrt_outventory routine is called but this seems to reproduce the table that we call
             # in the beginning of this function to determine which pointings to merge. NEED TO DETERMINE IF THIS IS CORRECT
             # AND NECESSARY
 
-            # Convert intermediate files to final files with proper units
-            finalize_mosaic(img_dir)
-
             # create a mosaic survey object to hold all the information and allow the user to
             mosaic_survey = MosaicBatSurvey(img_dir)
             mosaic_survey.save()
         else:
             mosaic_survey = None
+
+        # the time bin is complete so its checkpoints are not needed anymore
+        for checkpoint in checkpoints:
+            if checkpoint is not None:
+                checkpoint.remove()
     else:
         # otherwise load the .batsurvey file
         mosaic_survey = MosaicBatSurvey(img_dir)
+        if total_mosaic is not None:
+            total_mosaic.add_intermediate_mosaic(img_dir)
+
+    return mosaic_survey
+
+
+def _mosaic_energy_bands(intermediate_mosaic_directory):
+    """
+    Finds the energy bins of the intermediate mosaic images of a time bin from the E_MIN/E_MAX values of the headers of
+    the variance image of the first sky facet.
+
+    :param intermediate_mosaic_directory: Path object of the directory with the intermediate mosaic images
+    :return: sorted list of ints of the indexes of the mosaic energy bins (see _energy_band_indices)
+    """
+    vimg_file = Path(intermediate_mosaic_directory).joinpath(f"var_c0_{_proj}.img")
+    with fits.open(str(vimg_file)) as file:
+        edges = [(i.header.get("E_MIN"), i.header.get("E_MAX")) for i in _image_hdus(file)]
+
+    return [k for k, i in enumerate(zip(_emin, _emax)) if i in edges]
+
+
+def _add_intermediate_mosaic(intermediate_mosaic_directory, accumulator):
+    """
+    Reads the intermediate mosaic images of a time bin and adds them to the arrays of a MosaicAccumulator object. Only
+    the energy bins of the accumulator are read, which need to be in the time bin's images.
+
+    :param intermediate_mosaic_directory: Path object of the directory with the intermediate mosaic images
+    :param accumulator: MosaicAccumulator object that the images are added to
+    :return: astropy Header object of the partial coding image of the first sky facet
+    """
+    intermediate_mosaic_directory = Path(intermediate_mosaic_directory)
+
+    # the images of the sky facets that no pointings were added to are all zeros so they dont need to be added
+    empty_facets = _read_facet_manifest(intermediate_mosaic_directory)
+
+    # loop over each sky facet
+    for j in range(accumulator.skygrid_shape[-1]):
+        string = "c%d_%s" % (j, _proj)
+
+        # open the pimg and add it to the array and save the header with the exposure and other info
+        pimg_file = intermediate_mosaic_directory.joinpath(
+            "pcode_" + string + ".img"
+        )
+        with fits.open(str(pimg_file)) as file:
+            # read the partial coding map, the images may be tile compressed in which case they are in the extensions
+            hdu = _image_hdus(file)[0]
+            if j == 0:
+                header = hdu.header
+            if j in empty_facets:
+                continue
+            accumulator.pimg[:, :, j] += hdu.data
+
+        # open the eimg and add it to the array
+        eimg_file = intermediate_mosaic_directory.joinpath(
+            "expmap_" + string + ".img"
+        )
+        with fits.open(str(eimg_file)) as file:
+            # read the flat exposure map
+            accumulator.eimg[:, :, j] += _image_hdus(file)[0].data
+
+        # open the vimg and flux files
+        simg_file_name = intermediate_mosaic_directory.joinpath(
+            "flux_" + string + ".img"
+        )
+        vimg_file_name = intermediate_mosaic_directory.joinpath(
+            "var_" + string + ".img"
+        )
+
+        simg_file = fits.open(str(simg_file_name))
+        vimg_file = fits.open(str(vimg_file_name))
+        simg_hdus = _energy_band_hdus(simg_file, accumulator.energy_bands)
+        vimg_hdus = _energy_band_hdus(vimg_file, accumulator.energy_bands)
+
+        # loop over the enegy bands for variance and flux
+        for k in range(accumulator.nbands):
+            # add the fluxes and the variances
+            accumulator.vimg[:, :, j, k] += vimg_hdus[k].data
+            accumulator.simg[:, :, j, k] += simg_hdus[k].data
+
+        simg_file.close()
+        vimg_file.close()
+
+    return header
+
+
+def update_mosaic(
+    outventory_file,
+    start,
+    end,
+    survey_list,
+    catalog_file=None,
+    corrections_map=None,
+    ra_skygrid=None,
+    dec_skygrid=None,
+    verbose=True,
+    weight_cache_dir=None,
+    weight_cache_size=20,
+    skygrid_index=None,
+    accumulator_type="float64",
+    grouped_outventory_data=None,
+    grid_set="standard",
+    prefetch_depth=2,
+    compression=None,
+    contribution_cache_dir=None,
+    contribution_cache_size=0,
+    energy_bands=None,
+):
+    """
+    Adds new BAT survey pointings to the mosaic images of a time bin that was previously calculated, without
+    recalculating the pointings that were already included. The pointings that have been summed into a time bin are
+    kept in a ledger of (OBS_ID, IMAGE_ID) pairs within the time bin's directory. The pointings in the time bin's
+    grouped outventory file that are not in the ledger are reprojected and added to the intermediate mosaic images, and
+    then the final mosaic images and the MosaicBatSurvey object of the time bin are recreated.
+
+    The outventory file and the grouped outventory files need to be recreated with merge_outventory and group_outventory
+    after the new survey observations have been analyzed. If the time bin has not been calculated before, all of its
+    pointings are mosaiced.
+
+    :param outventory_file: Path object that provides the full outventory file of the BAT survey observations
+    :param start: astropy Time of the start time of the time bin
+    :param end: astropy Time of the end time of the time bin
+    :param survey_list: list of BAT survey objects that should have been used to create the full outventory file passed
+        into the outventory_file parameter, including the new survey observations.
+    :param catalog_file: A Path object of the catalog file that should be used to identify sources in the mosaic images.
+        This will default to using the catalog file that is included with the BatAnalysis package. Sources are only
+        detected again if they had been detected in the time bin's previous mosaic images.
+    :param corrections_map: Default None or a numpy array with the energy dependent off-axis corrections map. The
+        default is to read it with read_correctionsmap.
+    :param ra_skygrid: Default None or a numpy array of the skygrid facets' RA values in degrees. The default is to
+        read it with read_skygrids.
+    :param dec_skygrid: Default None or a numpy array of the skygrid facets' DEC values in degrees. The default is to
+        read it with read_skygrids.
+    :param verbose: Boolean True by default. Tells the code to print progress/diagnostic information.
+    :param weight_cache_dir: Default None or a Path object of the directory where the interpolation weights of each
+        pointing are cached (see the InterpWeightCache class). The default is to use a directory called
+        "interp_weight_cache" located in the same directory as the outventory file.
+    :param weight_cache_size: float, default 20, of the maximum size of the interpolation weight cache in GB. Setting
+        this to 0 turns off the caching of the interpolation weights.
+    :param skygrid_index: Default None or a SkygridIndex object of the ra_skygrid/dec_skygrid arrays. The default is to
+        create it in this function.
+    :param accumulator_type: string of the type of arrays that the mosaic images are summed into (see the
+        MosaicAccumulator class). This can be "float64" (the default), "float32" which uses half the memory, "memmap"
+        which saves the arrays to disk in the directory of the time bin's mosaic images, or "tiled" which only allocates
+        the parts of the skygrid that the pointings fall on (see create_mosaics).
+    :param grouped_outventory_data: Default None or the astropy FITS_rec of the outventory rows of the time bin, from
+        the time_bin method of an OutventoryIndex object. The default is to read the grouped outventory file of the time
+        bin that was created by group_outventory.
+    :param grid_set: string, default "standard", of the name of the set of skygrids (see _skygrid_sets) that the time
+        bin's mosaic images are made on.
+    :param prefetch_depth: int, default 2, of the number of pointings whose images are read ahead of the pointing that
+        is being reprojected (see PointingPrefetcher).
+    :param compression: None (the default) or a string of the tile compression of the updated mosaic images, "rice" or
+        "gzip" (see create_mosaics). The previous mosaic images can be compressed with any of these.
+    :param contribution_cache_dir: Default None or a Path object of the directory where the reprojected contribution of
+        each pointing is cached (see create_mosaics).
+    :param contribution_cache_size: float, default 0, of the maximum size of the cache of the reprojected contributions
+        of the pointings in GB (see create_mosaics). The default turns off this cache.
+    :param energy_bands: None or list of ints of the indexes of the mosaic energy bins that are calculated (see
+        create_mosaics). The default is to use the energy bins of the time bin's previous mosaic images, or all of them
+        if the time bin has not been calculated before. The previous images are always updated with all of their
+        energy bins, so a ValueError is raised if the requested energy bins are not the same as the ones of the
+        previous images.
+    :return: a MosaicBatSurvey object correponding to the time bin or None if there are no pointings in the time bin
+    """
+    # make sure its a path object
+    outventory_file = Path(outventory_file)
+
+    # get the corections map and the skygrids
+    if corrections_map is None:
+        corrections_map = read_correctionsmap(mmap=True)
+    if ra_skygrid is None or dec_skygrid is None:
+        ra_skygrid, dec_skygrid = read_skygrids(mmap=True, grid_set=grid_set)
+
+    output_file, img_dir = _time_bin_paths(outventory_file, start, grid_set=grid_set)
+
+    # if the time bin hasnt been mosaiced, or it was mosaiced before the ledger existed, calculate everything
+    ledger = _read_ledger(img_dir)
+    if len(ledger) == 0 or not img_dir.joinpath(f"pcode_c0_{_proj}.img").exists():
+        dirtest(img_dir)
+        return _mosaic_loop(
+            outventory_file,
+            start,
+            end,
+            corrections_map,
+            ra_skygrid,
+            dec_skygrid,
+            survey_list,
+            recalc=True,
+            verbose=verbose,
+            weight_cache_dir=weight_cache_dir,
+            weight_cache_size=weight_cache_size,
+            skygrid_index=skygrid_index,
+            accumulator_type=accumulator_type,
+            grouped_outventory_data=grouped_outventory_data,
+            grid_set=grid_set,
+            prefetch_depth=prefetch_depth,
+            compression=compression,
+            contribution_cache_dir=contribution_cache_dir,
+            contribution_cache_size=contribution_cache_size,
+            energy_bands=energy_bands,
+        )
+
+    if verbose:
+        print(f"Updating the time bin from {start} to {end}.\n")
+
+    # the intermediate mosaic images are rewritten with the energy bins that are summed, so the new pointings need to be
+    # added to all of the energy bins of the previous images otherwise the sums of the other energy bins are lost
+    previous_energy_bands = _mosaic_energy_bands(img_dir)
+    if energy_bands is not None and _energy_band_indices(energy_bands) != previous_energy_bands:
+        raise ValueError(
+            f"The energy bins {_energy_band_indices(energy_bands)} are not the energy bins {previous_energy_bands} of "
+            f"the previous mosaic images of the time bin in {img_dir}. The time bin needs to be recalculated, eg "
+            "with create_mosaics, to change its energy bins."
+        )
+    energy_bands = previous_energy_bands
+
+    # read the fits file for the date/time of interest and find the pointings that are not in the ledger
+    if grouped_outventory_data is None:
+        with fits.open(str(output_file)) as file:
+            grouped_outventory_data = file[1].data
+
+    included_pointings = set(ledger)
+    rows = np.array(
+        [
+            j
+            for j, (obsid, pointing_id) in enumerate(
+                zip(grouped_outventory_data["OBS_ID"], grouped_outventory_data["IMAGE_ID"])
+            )
+            if (obsid, pointing_id) not in included_pointings
+        ],
+        dtype=int,
+    )
+
+    pointing_info = None
+    if rows.size > 0:
+        # set up the cache of the interpolation weights for each pointing
+        if weight_cache_size > 0:
+            if weight_cache_dir is None:
+                weight_cache_dir = outventory_file.parent.joinpath("interp_weight_cache")
+            weight_cache = InterpWeightCache(weight_cache_dir, max_size=weight_cache_size)
+        else:
+            weight_cache = None
+
+        # set up the cache of the reprojected contributions of each pointing
+        if contribution_cache_size > 0:
+            if contribution_cache_dir is None:
+                contribution_cache_dir = outventory_file.parent.joinpath("contribution_cache")
+            contribution_cache = ContributionCache(contribution_cache_dir, max_size=contribution_cache_size)
+        else:
+            contribution_cache = None
+
+        # create the spatial index of the skygrid pixels if needed
+        if skygrid_index is None:
+            skygrid_index = SkygridIndex(ra_skygrid, dec_skygrid)
+
+        # the statistics of the pointings are computed for the full time bin as in _mosaic_loop
+        chi_mask = compute_statistics_map(
+            grouped_outventory_data["CHI2"],
+            grouped_outventory_data["NBATDETS"],
+            grouped_outventory_data["RA_PNT"],
+            grouped_outventory_data["DEC_PNT"],
+            grouped_outventory_data["PA_PNT"],
+            grouped_outventory_data["TSTART"],
+        )
+
+        accumulator = MosaicAccumulator(
+            ra_skygrid.shape,
+            energy_bands=energy_bands,
+            backend=accumulator_type,
+            directory=img_dir.joinpath(".accumulators"),
+        )
+
+        # add the new pointings to the previous intermediate mosaic images
+        previous_header = _add_intermediate_mosaic(img_dir, accumulator)
+        pointing_info = _accumulate_pointings(
+            rows,
+            grouped_outventory_data,
+            chi_mask,
+            survey_list,
+            corrections_map,
+            ra_skygrid,
+            dec_skygrid,
+            accumulator,
+            weight_cache=weight_cache,
+            skygrid_index=skygrid_index,
+            verbose=verbose,
+            prefetch_depth=prefetch_depth,
+            contribution_cache=contribution_cache,
+        )
+
+        if len(pointing_info["obsids"]) > 0:
+            # the previous images are treated as a single pointing at the start of the list so the header values of
+            # the time bin include all the pointings
+            for key, header_key in zip(
+                ["exposure", "tstart", "tstop", "dateobs_start", "dateobs_end"],
+                ["EXPOSURE", "TSTART", "TSTOP", "DATE-OBS", "DATE-END"],
+            ):
+                pointing_info[key].insert(0, previous_header[header_key])
+
+            model_hdr = _mosaic_model_header(start, end, pointing_info)
+            _write_intermediate_mosaic(
+                accumulator, model_hdr, img_dir, grid_set=grid_set, compression=compression
+            )
+            ledger += [(i, j.name) for i, j in zip(pointing_info["obsids"], pointing_info["data_directories"])]
+            _write_ledger(img_dir, [i[0] for i in ledger], [i[1] for i in ledger])
+
+        accumulator.close()
+
+    if pointing_info is None or len(pointing_info["obsids"]) == 0:
+        if verbose:
+            print("There are no new pointings to add to the mosaic images of this time bin.\n")
+        return MosaicBatSurvey(img_dir)
+
+    # the final files with proper units were written with the intermediate files so just refresh the mosaic survey
+    # object
+    mosaic_survey = MosaicBatSurvey(img_dir, recalc=True)
+    if img_dir.joinpath("sources_tot.cat").exists():
+        mosaic_survey.detect_sources(catalog_file=catalog_file)
+    mosaic_survey.save()
 
     return mosaic_survey
 
 
-def merge_mosaics(intermediate_mosaic_dir_list, savedir=None):
+class RunningTotalMosaic(object):
+    """
+    Holds the running sum of the intermediate mosaic images of a number of time bins, along with the exposures and
+    start/stop times of the time bins, which are used to create the total "time-integrated" mosaic images. The images of
+    a time bin can be added from the MosaicAccumulator object that holds them as soon as the time bin is computed, so
+    the total mosaic images are created without reading the time bins' intermediate mosaic images back from disk.
+
+    Attributes
+    ---------------
+    accumulator : MosaicAccumulator
+        The summed images of all the time bins that have been added
+    time_bins : list
+        Dicts of the directory, exposure, start/stop times and time bin edges of each time bin that has been added
+
+    Methods
+    ---------------
+    add(accumulator, header, img_dir):
+        Adds the images of a time bin that are held in a MosaicAccumulator object
+    add_intermediate_mosaic(img_dir):
+        Adds the images of a time bin that are read from its intermediate mosaic images
+    merge(other):
+        Adds the images and time bins of another RunningTotalMosaic object
+    write(total_dir, compression=None, time_bin_edges=None):
+        Writes the intermediate and final total mosaic images
+    close():
+        Removes any memory mapped files of the summed images
+    """
+
+    # the header keywords of each time bin that are used to create the header of the total mosaic images
+    _header_keys = ["EXPOSURE", "TSTART", "TSTOP", "DATE-OBS", "DATE-END", "S_TBIN", "E_TBIN"]
+
+    def __init__(
+        self, skygrid_shape, accumulator_type="float64", directory=None, mode="w+", time_bins=None, energy_bands=None
+    ):
+        """
+        Initializer method for the RunningTotalMosaic object.
+
+        :param skygrid_shape: tuple of the shape of the skygrid (n, m, n_facets)
+        :param accumulator_type: string of the type of arrays that the images are summed into (see the
+            MosaicAccumulator class)
+        :param directory: None or a Path object to the directory where the memory mapped arrays are saved. This is
+            required if the accumulator_type is "memmap"
+        :param mode: string of how the memory mapped arrays are opened. The default "w+" creates new zero filled
+            arrays and "r+" opens the arrays that were previously saved in directory.
+        :param time_bins: None or a list of the time bins that have already been summed into the memory mapped arrays
+            that are opened with mode="r+" (see the time_bins attribute)
+        :param energy_bands: None or list of ints of the indexes of the mosaic energy bins that are summed (see
+            create_mosaics). Default is all of them. The time bins that are added need to have these energy bins.
+        """
+        self.accumulator = MosaicAccumulator(
+            skygrid_shape, energy_bands=energy_bands, backend=accumulator_type, directory=directory, mode=mode
+        )
+        self.time_bins = [] if time_bins is None else list(time_bins)
+
+    def _add_time_bin(self, header, img_dir):
+        """
+        Saves the directory and the exposure and time information of a time bin.
+
+        :param header: astropy Header object, or dict, with the EXPOSURE, TSTART, TSTOP, DATE-OBS, DATE-END, S_TBIN and
+            E_TBIN keywords of the time bin
+        :param img_dir: Path object of the directory of the time bin's mosaic images
+        :return: None
+        """
+        time_bin = {key: header[key] for key in self._header_keys}
+        time_bin["img_dir"] = Path(img_dir)
+        self.time_bins.append(time_bin)
+
+    def add(self, accumulator, header, img_dir):
+        """
+        Adds the images of a time bin that are held in a MosaicAccumulator object.
+
+        :param accumulator: MosaicAccumulator object with the summed images of the time bin
+        :param header: astropy Header object with the exposure and time keywords of the time bin (see
+            _mosaic_model_header)
+        :param img_dir: Path object of the directory where the time bin's mosaic images are saved
+        :return: None
+        """
+        self.accumulator.add(accumulator)
+        self._add_time_bin(header, img_dir)
+
+    def add_intermediate_mosaic(self, img_dir):
+        """
+        Adds the images of a time bin that are read from its intermediate mosaic images. This is used for time bins
+        that were computed previously.
+
+        :param img_dir: Path object of the directory with the time bin's intermediate mosaic images
+        :return: None
+        """
+        # all sky facets have the header info so we only need it from one sky facet
+        header = _add_intermediate_mosaic(img_dir, self.accumulator)
+        self._add_time_bin(header, img_dir)
+
+    def merge(self, other):
+        """
+        Adds the images and time bins of another RunningTotalMosaic object.
+
+        :param other: RunningTotalMosaic object with the same skygrid shape
+        :return: None
+        """
+        self.accumulator.add(other.accumulator)
+        self.time_bins += other.time_bins
+
+    def write(self, total_dir, compression=None, time_bin_edges=None):
+        """
+        Writes the intermediate and final total mosaic images. The headers of the intermediate mosaic images of the
+        earliest time bin are used as templates for the images, with the exposure and time values of all the time bins.
+        Only the headers of these files are read.
+
+        :param total_dir: Path object of the directory where the total mosaic images are saved
+        :param compression: None (the default) or a string of the tile compression of the images, "rice" or "gzip"
+            (see _write_mosaic_hdulist)
+        :param time_bin_edges: None (the default) or a tuple of the start and end MET of the time bin that the images
+            cover, which are saved in the S_TBIN and E_TBIN keywords. The default is to use the earliest start and the
+            latest end of the time bins that were added.
+        :return: None
+        """
+        if len(self.time_bins) == 0:
+            raise ValueError("There are no time bins with mosaic images to create the total mosaic images from.")
+
+        total_dir = Path(total_dir)
+        eimg = self.accumulator.eimg  # exposure map, has the same dimensions as the skygrid
+        pimg = self.accumulator.pimg  # Partial coding map
+        vimg = self.accumulator.vimg  # Variance map, size of skygrid with extra enegy dimension
+        simg = self.accumulator.simg  # Sky flux  image
+
+        total_tstart = [i["TSTART"] for i in self.time_bins]
+        total_tstop = [i["TSTOP"] for i in self.time_bins]
+        total_binned_exposure = 0  # tally up the total exposure
+        for i in self.time_bins:
+            total_binned_exposure += i["EXPOSURE"]
+
+        tmin = np.min(total_tstart)
+        tmax = np.max(total_tstop)
+        dt = np.max(total_tstop) - np.min(total_tstart)
+        obs_min = self.time_bins[np.argmin(total_tstart)]["DATE-OBS"]
+        obs_max = self.time_bins[np.argmax(total_tstop)]["DATE-END"]
+        if time_bin_edges is None:
+            user_tbin_start = np.min([i["S_TBIN"] for i in self.time_bins])
+            user_tbin_end = np.max([i["E_TBIN"] for i in self.time_bins])
+        else:
+            user_tbin_start, user_tbin_end = time_bin_edges
+
+        template_dir = min(self.time_bins, key=lambda i: i["S_TBIN"])["img_dir"]
+
+        # loop over each sky facet, the intermediate and final images are built in memory and each is written once
+        for j in range(self.accumulator.skygrid_shape[-1]):
+            string = "c%d_%s" % (j, _proj)
+
+            hdulists = {}
+            for name, img in zip(["expmap", "pcode", "var", "flux"], [eimg, pimg, vimg, simg]):
+                file_name = template_dir.joinpath(f"{name}_{string}.img")
+                hdus = []
+                with fits.open(str(file_name)) as file:
+                    # iterating over the energies for the variance and flux, the template time bin can have more energy
+                    # bins than the ones that were summed
+                    if img.ndim == 3:
+                        template_hdus = _image_hdus(file)
+                    else:
+                        template_hdus = _energy_band_hdus(file, self.accumulator.energy_bands)
+                    for k, hdu in enumerate(template_hdus):
+                        header = hdu.header.copy()
+                        header["TSTART"] = (tmin, " start time of image")
+                        header["TSTOP"] = (tmax, " stop time of image")
+                        header["TELAPSE"] = (dt, "  elapsed time of image (= TSTOP-TSTART)")
+                        header["DATE-OBS"] = (obs_min, "  TSTART, expressed in UTC")
+                        header["DATE-END"] = (obs_max, "  TSTOP, expressed in UTC")
+                        header["EXPOSURE"] = (
+                            total_binned_exposure,
+                            "[sec.] Sum of pointing exposures used",
+                        )
+                        header["S_TBIN"] = (user_tbin_start, "Mosaicing Start of Time Bin (MET)")
+                        header["E_TBIN"] = (user_tbin_end, "Mosaicing End of Time Bin (MET)")
+
+                        data = img[:, :, j] if img.ndim == 3 else img[:, :, j, k]
+                        hdus.append(_mosaic_hdu(np.asarray(data, dtype=np.float64), header, k))
+
+                hdulists[name] = fits.HDUList(hdus)
+                _write_mosaic_hdulist(
+                    hdulists[name], total_dir.joinpath(f"{name}_{string}.img"), compression=compression, lossless=True
+                )
+
+            # convert the intermediate files to final files with proper units
+            _write_final_mosaic(total_dir, j, hdulists, compression=compression)
+
+    def close(self):
+        """
+        Removes any memory mapped files of the summed images. The images cannot be used after this.
+
+        :return: None
+        """
+        self.accumulator.close()
+
+
+def merge_mosaics(
+    intermediate_mosaic_dir_list,
+    savedir=None,
+    accumulator_type="float64",
+    verbose=False,
+    grid_set="standard",
+    compression=None,
+    energy_bands=None,
+):
     """
     Merges the intermediate mosaic images from a number of previously calculated mosaic images for a set of time bins.
-    The intermediate mosaic images must exist for this function to work.
+    The intermediate mosaic images must exist for this function to work. create_mosaics and batmosaic_analysis sum the
+    images of each time bin into the total mosaic images as the time bins are computed (see RunningTotalMosaic) so this
+    only needs to be called to combine time bins that were computed separately.
 
     :param intermediate_mosaic_dir_list: A list of the directories with mosaic images that will be added together.
     :param savedir: None or a Path object. None creates a cirectory called "total_mosaic" in the parent directory of the
         directory given by intermediate_mosaic_dir_list[0]
-    :return: Path object of the directory that holds the resulting intermediate mosaic images
+    :param accumulator_type: string of the type of arrays that the mosaic images are summed into (see the
+        MosaicAccumulator class). This can be "float64" (the default), "float32" which uses half the memory, or "memmap"
+        which saves the arrays to disk in the savedir directory.
+    :param verbose: Boolean False by default. Tells the code to print progress/diagnostic information.
+    :param grid_set: string, default "standard", of the name of the set of skygrids (see _skygrid_sets) that the
+        mosaic images were made on. For sets other than "standard", the default savedir is called
+        "total_mosaic_<grid_set>".
+    :param compression: None (the default) or a string of the tile compression of the total mosaic images, "rice" or
+        "gzip" (see _write_mosaic_hdulist). The intermediate mosaic images that are merged can be compressed with any
+        of these.
+    :param energy_bands: None or list of ints of the indexes of the mosaic energy bins that are merged (see
+        create_mosaics). Default is all of them. All the mosaic images that are merged need to have these energy bins.
+    :return: Path object of the directory that holds the resulting intermediate and final mosaic images
     """
     # this goes through the various intermediate mosaic files and adds them up
 
@@ -1635,7 +5153,7 @@ def merge_mosaics(intermediate_mosaic_dir_list, savedir=None):
             0
         ].parent
         total_dir = savedir.joinpath(
-            "total_mosaic"
+            _total_mosaic_dirname(grid_set)
         )
     else:
         total_dir = savedir
@@ -1643,195 +5161,405 @@ def merge_mosaics(intermediate_mosaic_dir_list, savedir=None):
     dirtest(total_dir)
 
     # create the arrays that will hold all the data
-    ra_skygrid = read_skygrids()[0]
-    eimg = np.zeros_like(
-        ra_skygrid
-    )  # exposure map, has the same dimensions as the skygrid
-    pimg = np.zeros_like(ra_skygrid)  # Partial coding map
-    nx, ny, nz = ra_skygrid.shape
-    vimg = np.zeros(
-        (nx, ny, nz, _nebands + 1)
-    )  # Variance map, size of skygrid with extra enegy dimension (+1 for total 14-195 band)
-    simg = np.zeros_like(vimg)  # Sky flux  image
-    total_binned_exposure = 0  # tally up the total exposure
-    total_tstart = []
-    total_tstop = []
-    total_dateobs_start = []
-    total_dateobs_end = []
-    user_met_tbin_start = []
-    user_met_tbin_end = []
+    total_mosaic = RunningTotalMosaic(
+        _get_skygrid_store(grid_set=grid_set).shape,
+        accumulator_type=accumulator_type,
+        directory=total_dir.joinpath(".accumulators"),
+        energy_bands=energy_bands,
+    )
 
     # loop over the directories to read files and add them
     for i in intermediate_mosaic_dir_list:
-        # loop over each sky facet
-        for j in range(nz):
-            string = "c%d_%s" % (j, _proj)
+        total_mosaic.add_intermediate_mosaic(i)
 
-            # open the pimg and add it to the array and accumulate the exposure and other header info
-            pimg_file = i.joinpath(
-                "pcode_" + string + ".img"
-            )
-            with fits.open(str(pimg_file)) as file:
-                # read the partial coding map
-                pimg[:, :, j] += file[0].data
-                # for the first sky facet obtain this info. all sky facets have this info so we only need it from one
-                # sky facet
-                if j == 0:
-                    total_binned_exposure += file[0].header["EXPOSURE"]
-                    total_tstart.append(file[0].header["TSTART"])
-                    total_tstop.append(file[0].header["TSTOP"])
-                    total_dateobs_start.append(file[0].header["DATE-OBS"])
-                    total_dateobs_end.append(file[0].header["DATE-END"])
-                    user_met_tbin_start.append(file[0].header["S_TBIN"])
-                    user_met_tbin_end.append(file[0].header["E_TBIN"])
-
-            # open the eimg and add it to the array and accumulate the exposure
-            eimg_file = i.joinpath(
-                "expmap_" + string + ".img"
-            )
-            with fits.open(str(eimg_file)) as file:
-                # read the flat exposure map
-                eimg[:, :, j] += file[0].data
+    total_mosaic.write(total_dir, compression=compression)
 
-            # open the vimg and flux files
-            simg_file_name = i.joinpath(
-                "flux_" + string + ".img"
-            )
-            vimg_file_name = i.joinpath(
-                "var_" + string + ".img"
-            )
+    total_mosaic.close()
+    if verbose:
+        print(f"Peak memory usage: {_peak_memory_usage():.2f} GB\n")
 
-            simg_file = fits.open(str(simg_file_name))
-            vimg_file = fits.open(str(vimg_file_name))
+    return total_dir
 
-            # loop over the enegy bands for variance and flux
-            for k in range(vimg.shape[-1]):
-                # add the fluxes and the variances
-                vimg[:, :, j, k] += vimg_file[k].data
-                simg[:, :, j, k] += simg_file[k].data
 
-            simg_file.close()
-            vimg_file.close()
+def _pyramid_level_name(binning_timedelta):
+    """
+    Gets the name of a level of a time pyramid from the width of its time bins, such as "7D" for weekly time bins.
 
-    # after adding everything up, need to save the data to save time/effort just copy over some of the intermediate
-    # files from the 0th directory of the list that is passed in, into the total_mosaic directory and update these
-    # data/header values
+    :param binning_timedelta: numpy timedelta64 of the width of the time bins of the level
+    :return: string of the name of the level
+    """
+    binning_timedelta = np.timedelta64(binning_timedelta)
+    return f"{binning_timedelta.astype(int)}{np.datetime_data(binning_timedelta.dtype)[0]}"
 
-    tmin = np.min(total_tstart)
-    tmax = np.max(total_tstop)
-    dt = np.max(total_tstop) - np.min(total_tstart)
-    obs_min = total_dateobs_start[np.argmin(total_tstart)]
-    obs_max = total_dateobs_end[np.argmax(total_tstop)]
-    user_tbin_start = np.min(user_met_tbin_start)
-    user_tbin_end = np.max(user_met_tbin_end)
 
-    # loop over each sky facet
-    for j in range(nz):
-        string = "c%d_%s" % (j, _proj)
+def _pyramid_time_bins(start_datetime, end_datetime, binning_timedelta):
+    """
+    Calculates the time bin edges of a level of a time pyramid. Time bins in calendar units (months and years) start at
+    the beginning of the month/year of start_datetime, like the monthly time bins of group_outventory, so they line up
+    with finer time bins that start on a day boundary.
+
+    :param start_datetime: astropy Time of the start of the finest time bins of the pyramid
+    :param end_datetime: astropy Time of the end of the finest time bins of the pyramid
+    :param binning_timedelta: numpy timedelta64 of the width of the time bins of the level
+    :return: astropy Time array of the time bin edges
+    """
+    binning_timedelta = np.timedelta64(binning_timedelta)
+    unit = np.datetime_data(binning_timedelta.dtype)[0]
 
-        # do this for the exposure
-        file_name = intermediate_mosaic_dir_list[0].joinpath(f"expmap_{string}.img")
-        output_name = total_dir.joinpath(f"expmap_{string}.img")
-        shutil.copy(file_name, output_name)
-
-        with fits.open(str(output_name), mode="update") as file:
-            file[0].data = eimg[:, :, j]
-            header = file[0].header
-            header["TSTART"] = (tmin, " start time of image")
-            header["TSTOP"] = (tmax, " stop time of image")
-            header["TELAPSE"] = (dt, "  elapsed time of image (= TSTOP-TSTART)")
-            header["DATE-OBS"] = (obs_min, "  TSTART, expressed in UTC")
-            header["DATE-END"] = (obs_max, "  TSTOP, expressed in UTC")
-            header["EXPOSURE"] = (
-                total_binned_exposure,
-                "[sec.] Sum of pointing exposures used",
-            )
-            header["S_TBIN"] = (user_tbin_start, "Mosaicing Start of Time Bin (MET)")
-            header["E_TBIN"] = (user_tbin_end, "Mosaicing End of Time Bin (MET)")
-            file.flush()
+    if unit in ["Y", "M"]:
+        start = start_datetime.datetime64.astype(f"datetime64[{unit}]")
+        end = end_datetime.datetime64.astype(f"datetime64[{unit}]")
+        time_bins = np.arange(start, end + binning_timedelta, binning_timedelta)
+
+        # the last time bin needs to contain the end time
+        time_bins = np.append(time_bins, time_bins[-1] + binning_timedelta)
+    else:
+        time_bins = np.arange(
+            start_datetime.datetime64,
+            end_datetime.datetime64 + binning_timedelta,
+            binning_timedelta,
+        )
+
+    return Time(time_bins.astype("datetime64[s]"))
+
+
+def _pyramid_bin_dir(outventory_file, binning_timedelta, start, grid_set="standard"):
+    """
+    Gets the directory where the mosaic images of a time bin of a level of a time pyramid are saved. The time bins of
+    each level are kept in a directory called "pyramid_<level name>" located in the same directory as the outventory
+    file, since time bins of different levels can have the same start time.
+
+    :param outventory_file: Path object of the full outventory file
+    :param binning_timedelta: numpy timedelta64 of the width of the time bins of the level
+    :param start: astropy Time of the start time of the time bin
+    :param grid_set: string, default "standard", of the name of the set of skygrids that the mosaic images are made on
+        (see _time_bin_paths)
+    :return: Path object of the directory of the time bin's mosaic images
+    """
+    binning_timedelta = np.timedelta64(binning_timedelta)
+    level_dir = Path(outventory_file).parent.joinpath(f"pyramid_{_pyramid_level_name(binning_timedelta)}")
+
+    # time bins shorter than a day are named by their MJD, like group_outventory does
+    if np.datetime_data(binning_timedelta.dtype)[0] in ["Y", "M", "W", "D"]:
+        img_dir = level_dir.joinpath(f"mosaic_{start.datetime64.astype('datetime64[D]')}")
+    else:
+        img_dir = level_dir.joinpath(f"mosaic_{start.mjd}")
+
+    if grid_set != "standard":
+        img_dir = img_dir.with_name(f"{img_dir.name}_{grid_set}")
+
+    return img_dir
+
+
+def _pyramid_level_sources(time_bins, finer_levels):
+    """
+    Finds the time bins of a finer level of a time pyramid that are summed to create each time bin of a coarser level.
+    The coarsest of the finer levels whose time bins do not straddle any of the coarser time bin edges is used, so the
+    fewest intermediate mosaic images are read. For example, monthly time bins are summed from daily time bins rather
+    than weekly time bins, while yearly time bins are summed from the monthly time bins.
+
+    :param time_bins: astropy Time array of the time bin edges of the coarser level
+    :param finer_levels: list of the finer levels, ordered from the finest to the coarsest. Each level is a dict with
+        the "start" and "end" numpy datetime64 arrays and the "img_dir" list of the time bins that have mosaic images.
+    :return: list of the lists of the directories of the finer time bins that are summed into each coarser time bin
+    """
+    edges = time_bins.datetime64
+
+    for level in finer_levels[::-1]:
+        sources = []
+        for start, end in zip(edges[:-1], edges[1:]):
+            overlap = (level["start"] < end) & (level["end"] > start)
+            inside = (level["start"] >= start) & (level["end"] <= end)
+            if np.any(overlap & ~inside):
+                break
+            sources.append([level["img_dir"][k] for k in np.where(inside)[0]])
+        else:
+            return sources
+
+    raise ValueError(
+        "The time bins of the pyramid level do not line up with the time bins of any of the finer levels. Make sure "
+        "that the coarser time bin edges fall on the edges of the finest time bins."
+    )
 
-        # do this for the pcode
-        file_name = intermediate_mosaic_dir_list[0].joinpath(f"pcode_{string}.img")
-        output_name = total_dir.joinpath(f"pcode_{string}.img")
-        shutil.copy(file_name, output_name)
-
-        with fits.open(str(output_name), mode="update") as file:
-            file[0].data = pimg[:, :, j]
-            header = file[0].header
-            header["TSTART"] = (tmin, " start time of image")
-            header["TSTOP"] = (tmax, " stop time of image")
-            header["TELAPSE"] = (dt, "  elapsed time of image (= TSTOP-TSTART)")
-            header["DATE-OBS"] = (obs_min, "  TSTART, expressed in UTC")
-            header["DATE-END"] = (obs_max, "  TSTOP, expressed in UTC")
-            header["EXPOSURE"] = (
-                total_binned_exposure,
-                "[sec.] Sum of pointing exposures used",
-            )
-            header["S_TBIN"] = (user_tbin_start, "Mosaicing Start of Time Bin (MET)")
-            header["E_TBIN"] = (user_tbin_end, "Mosaicing End of Time Bin (MET)")
-            file.flush()
 
-        # copy files for the variability and flux
-        file_name = intermediate_mosaic_dir_list[0].joinpath(f"var_{string}.img")
-        var_output_name = total_dir.joinpath(f"var_{string}.img")
-        shutil.copy(file_name, var_output_name)
-
-        file_name = intermediate_mosaic_dir_list[0].joinpath(f"flux_{string}.img")
-        flux_output_name = total_dir.joinpath(f"flux_{string}.img")
-        shutil.copy(file_name, flux_output_name)
-
-        # open all the files in update mode
-        flux_file = fits.open(str(flux_output_name), mode="update")
-        var_file = fits.open(str(var_output_name), mode="update")
-
-        # iterating over the energies
-        for k in range(len(flux_file)):
-            # update the flux
-            flux_file[k].data = simg[:, :, j, k]
-            header = flux_file[k].header
-            header["TSTART"] = (tmin, " start time of image")
-            header["TSTOP"] = (tmax, " stop time of image")
-            header["TELAPSE"] = (dt, "  elapsed time of image (= TSTOP-TSTART)")
-            header["DATE-OBS"] = (obs_min, "  TSTART, expressed in UTC")
-            header["DATE-END"] = (obs_max, "  TSTOP, expressed in UTC")
-            header["EXPOSURE"] = (
-                total_binned_exposure,
-                "[sec.] Sum of pointing exposures used",
+def _merge_pyramid_bin(
+    fine_img_dirs,
+    img_dir,
+    start,
+    end,
+    skygrid_shape,
+    recalc=False,
+    accumulator_type="float64",
+    compression=None,
+    energy_bands=None,
+):
+    """
+    Creates the mosaic images of a time bin of a level of a time pyramid by summing the intermediate mosaic images of
+    the finer time bins that it contains, along with the ledger of the pointings that were included.
+
+    :param fine_img_dirs: list of Path objects of the directories of the finer time bins
+    :param img_dir: Path object of the directory where the mosaic images of the time bin are saved
+    :param start: astropy Time of the start time of the time bin
+    :param end: astropy Time of the end time of the time bin
+    :param skygrid_shape: tuple of the shape of the skygrid (n, m, n_facets)
+    :param recalc: Boolean False by default. If the time bin was created previously, the default loads it instead of
+        summing the finer time bins again.
+    :param accumulator_type: string of the type of arrays that the mosaic images are summed into (see the
+        MosaicAccumulator class)
+    :param compression: None (the default) or a string of the tile compression of the mosaic images, "rice" or "gzip"
+        (see _write_mosaic_hdulist)
+    :param energy_bands: None or list of ints of the indexes of the mosaic energy bins that are summed (see
+        create_mosaics). Default is all of them.
+    :return: a MosaicBatSurvey object correponding to the time bin
+    """
+    if img_dir.joinpath("batsurvey.pickle").exists() and not recalc:
+        return MosaicBatSurvey(img_dir)
+
+    dirtest(img_dir)
+
+    running_total = RunningTotalMosaic(
+        skygrid_shape,
+        accumulator_type=accumulator_type,
+        directory=img_dir.joinpath(".accumulators"),
+        energy_bands=energy_bands,
+    )
+    ledger = []
+    for i in fine_img_dirs:
+        running_total.add_intermediate_mosaic(i)
+        ledger += _read_ledger(i)
+
+    running_total.write(
+        img_dir,
+        compression=compression,
+        time_bin_edges=(sbu.datetime2met(start.datetime), sbu.datetime2met(end.datetime)),
+    )
+    running_total.close()
+    _write_ledger(img_dir, [i[0] for i in ledger], [i[1] for i in ledger])
+
+    mosaic_survey = MosaicBatSurvey(img_dir)
+    mosaic_survey.save()
+
+    return mosaic_survey
+
+
+def _mosaic_pyramid_levels(
+    outventory_file,
+    time_bins,
+    binning_timedeltas,
+    catalog_file=None,
+    recalc=False,
+    nprocs=1,
+    accumulator_type="float64",
+    grid_set="standard",
+    compression=None,
+    energy_bands=None,
+):
+    """
+    Creates the coarser levels of a time pyramid from the mosaic images of the finest time bins, which need to have
+    been calculated already. Each level is created from the finer levels, in order, so no pointing is reprojected again.
+
+    :param outventory_file: Path object of the full outventory file
+    :param time_bins: astropy Time array of the time bin edges of the finest level
+    :param binning_timedeltas: list of the numpy timedelta64 of the widths of the time bins of the coarser levels,
+        ordered from the finest to the coarsest
+    :param catalog_file: A Path object of the catalog file that should be used to identify sources in the mosaic images
+    :param recalc: Boolean False by default. Set to True to sum the finer time bins again for time bins that were
+        created previously.
+    :param nprocs: int, default 1, of the number of processes that are used to sum the time bins of each level
+    :param accumulator_type: string of the type of arrays that the mosaic images are summed into (see the
+        MosaicAccumulator class)
+    :param grid_set: string, default "standard", of the name of the set of skygrids that the mosaic images are made on
+    :param compression: None (the default) or a string of the tile compression of the mosaic images, "rice" or "gzip"
+        (see _write_mosaic_hdulist)
+    :param energy_bands: None or list of ints of the indexes of the mosaic energy bins that are summed (see
+        create_mosaics). Default is all of them.
+    :return: list with a list of MosaicBatSurvey objects of the time bins of each of the coarser levels
+    """
+    outventory_file = Path(outventory_file)
+    skygrid_shape = _get_skygrid_store(grid_set=grid_set).shape
+
+    # the finest level is made up of the time bins that have mosaic images
+    finest = [
+        (start, end, _time_bin_paths(outventory_file, start, grid_set=grid_set)[1])
+        for start, end in zip(time_bins[:-1], time_bins[1:])
+    ]
+    finest = [i for i in finest if i[2].joinpath("batsurvey.pickle").exists()]
+    levels = [
+        dict(
+            start=np.array([i[0].datetime64 for i in finest], dtype="datetime64[us]"),
+            end=np.array([i[1].datetime64 for i in finest], dtype="datetime64[us]"),
+            img_dir=[i[2] for i in finest],
+        )
+    ]
+
+    all_level_mosaics = []
+    for binning_timedelta in binning_timedeltas:
+        level_bins = _pyramid_time_bins(time_bins[0], time_bins[-1], binning_timedelta)
+        sources = _pyramid_level_sources(level_bins, levels)
+
+        # only the time bins that contain finer time bins with mosaic images are created
+        level = [
+            (start, end, _pyramid_bin_dir(outventory_file, binning_timedelta, start, grid_set=grid_set), source)
+            for start, end, source in zip(level_bins[:-1], level_bins[1:], sources)
+            if len(source) > 0
+        ]
+
+        level_mosaics = Parallel(n_jobs=nprocs)(
+            delayed(_merge_pyramid_bin)(
+                source,
+                img_dir,
+                start,
+                end,
+                skygrid_shape,
+                recalc=recalc,
+                accumulator_type=accumulator_type,
+                compression=compression,
+                energy_bands=energy_bands,
             )
-            header["S_TBIN"] = (user_tbin_start, "Mosaicing Start of Time Bin (MET)")
-            header["E_TBIN"] = (user_tbin_end, "Mosaicing End of Time Bin (MET)")
-            flux_file.flush()
-
-            # update the variance
-            var_file[k].data = vimg[:, :, j, k]
-            header = var_file[k].header
-            header["TSTART"] = (tmin, " start time of image")
-            header["TSTOP"] = (tmax, " stop time of image")
-            header["TELAPSE"] = (dt, "  elapsed time of image (= TSTOP-TSTART)")
-            header["DATE-OBS"] = (obs_min, "  TSTART, expressed in UTC")
-            header["DATE-END"] = (obs_max, "  TSTOP, expressed in UTC")
-            header["EXPOSURE"] = (
-                total_binned_exposure,
-                "[sec.] Sum of pointing exposures used",
+            for start, end, img_dir, source in level
+        )
+
+        # if batcelldetect hasnt been run yet do so
+        for i in level_mosaics:
+            if not i.result_dir.joinpath("sources_tot.cat").exists():
+                i.detect_sources(catalog_file=catalog_file)
+                i.save()
+
+        levels.append(
+            dict(
+                start=np.array([i[0].datetime64 for i in level], dtype="datetime64[us]"),
+                end=np.array([i[1].datetime64 for i in level], dtype="datetime64[us]"),
+                img_dir=[i[2] for i in level],
             )
-            header["S_TBIN"] = (user_tbin_start, "Mosaicing Start of Time Bin (MET)")
-            header["E_TBIN"] = (user_tbin_end, "Mosaicing End of Time Bin (MET)")
-            var_file.flush()
+        )
+        all_level_mosaics.append(level_mosaics)
 
-        flux_file.close()
-        var_file.close()
+    return all_level_mosaics
 
-    return total_dir
 
+def create_mosaic_pyramid(
+    outventory_file,
+    binning_timedeltas,
+    survey_list,
+    start_datetime=None,
+    end_datetime=None,
+    catalog_file=None,
+    total_mosaic_savedir=None,
+    recalc=False,
+    verbose=True,
+    weight_cache_dir=None,
+    weight_cache_size=20,
+    accumulator_type="float64",
+    nprocs=1,
+    chunk_size=None,
+    grid_set="standard",
+    prefetch_depth=2,
+    compression=None,
+    contribution_cache_dir=None,
+    contribution_cache_size=0,
+    energy_bands=None,
+    checkpoint_pointings=None,
+    checkpoint_seconds=None,
+):
+    """
+    Creates the mosaic images of a hierarchy of time bins, such as daily, weekly, monthly and yearly time bins, along
+    with the total mosaic image. Only the finest time bins are calculated from the BAT survey pointings, the time bins of
+    each coarser level are created by summing the intermediate mosaic images of the finer time bins that they contain
+    (in the same way as merge_mosaics), so each pointing is only reprojected once.
+
+    The finest time bins are created in the same way as with group_outventory and create_mosaics. The time bins of the
+    coarser levels are saved in directories called "pyramid_<level name>", such as "pyramid_7D" or "pyramid_1M",
+    located in the same directory as the outventory file. The edges of the coarser time bins need to fall on the edges
+    of the finest time bins, months and years start at the beginning of the month/year so they line up with daily time
+    bins.
+
+    :param outventory_file: Path object of the outventory file that contains all the BAT survey observations that will
+        be used to create the mosaiced images.
+    :param binning_timedeltas: list of the numpy timedelta64 of the widths of the time bins of each level, ordered from
+        the finest to the coarsest, e.g. [np.timedelta64(1, "D"), np.timedelta64(7, "D"), np.timedelta64(1, "M"),
+        np.timedelta64(1, "Y")]
+    :param survey_list: The list of BATSurvey objects that correpond to the observations listed in the outventory file
+    :param start_datetime: Default None or an astropy Time object of the start of the finest time bins (see
+        group_outventory)
+    :param end_datetime: Default None or an astropy Time object of the end of the finest time bins (see
+        group_outventory)
+    :param catalog_file: A Path object of the catalog file that should be used to identify sources in the mosaic images.
+        This will default to using the catalog file that is included with the BatAnalysis package.
+    :param total_mosaic_savedir: Default None or a Path object that denotes the directory that the total
+        "time-integrated" images will be saved to (see create_mosaics).
+    :param recalc: Boolean False by default. If this calculation was done previously, do not try to load the results of
+        prior calculations. Instead recalculate the mosaiced images of every level.
+    :param verbose: Boolean True by default. Tells the code to print progress/diagnostic information.
+    :param weight_cache_dir: Default None or a Path object of the directory where the interpolation weights of each
+        pointing are cached (see create_mosaics).
+    :param weight_cache_size: float, default 20, of the maximum size of the interpolation weight cache in GB.
+    :param accumulator_type: string of the type of arrays that the mosaic images are summed into (see create_mosaics)
+    :param nprocs: int, default 1, of the number of processes that are used to sum the chunks of pointings of the
+        finest time bins (see create_mosaics) and to sum the time bins of each coarser level.
+    :param chunk_size: Default None or an int of the number of pointings in each chunk (see create_mosaics)
+    :param grid_set: string, default "standard", of the name of the set of skygrids that the mosaic images are made on
+        (see create_mosaics)
+    :param prefetch_depth: int, default 2, of the number of pointings whose images are read in background threads
+        ahead of the pointing that is being reprojected (see PointingPrefetcher).
+    :param compression: None (the default) or a string of the tile compression of the mosaic images, "rice" or "gzip"
+        (see create_mosaics).
+    :param contribution_cache_dir: Default None or a Path object of the directory where the reprojected contribution of
+        each pointing is cached (see create_mosaics).
+    :param contribution_cache_size: float, default 0, of the maximum size of the cache of the reprojected contributions
+        of the pointings in GB (see create_mosaics). The default turns off this cache.
+    :param energy_bands: None or a list of ints of the indexes of the mosaic energy bins that are calculated for every
+        level (see create_mosaics). The default is all of them.
+    :param checkpoint_pointings: Default None or an int of the number of pointings that are summed between the
+        checkpoints of each of the finest time bins (see create_mosaics).
+    :param checkpoint_seconds: Default None or a float of the number of seconds between the checkpoints of each of the
+        finest time bins (see create_mosaics).
+    :return: a list with a list of MosaicBatSurvey objects of the time bins of each level in binning_timedeltas, and a
+        single MosaicBatSurvey corresponding to the total mosaiced image across all time bins.
+    """
+    outventory_file = Path(outventory_file)
+
+    time_bins = group_outventory(
+        outventory_file,
+        binning_timedeltas[0],
+        start_datetime=start_datetime,
+        end_datetime=end_datetime,
+        recalc=recalc,
+    )
 
-# Need to make sure that the sky facets have been created when this is imported
-# if this is the first time its imported need to create the default ones
-# if it's not the first time this module is imported (ie that batanalysis is imported) then dont redo this calculation
+    finest_mosaics, total_mosaic = create_mosaics(
+        outventory_file,
+        time_bins,
+        survey_list,
+        catalog_file=catalog_file,
+        total_mosaic_savedir=total_mosaic_savedir,
+        recalc=recalc,
+        verbose=verbose,
+        weight_cache_dir=weight_cache_dir,
+        weight_cache_size=weight_cache_size,
+        accumulator_type=accumulator_type,
+        nprocs=nprocs,
+        chunk_size=chunk_size,
+        grid_set=grid_set,
+        prefetch_depth=prefetch_depth,
+        compression=compression,
+        contribution_cache_dir=contribution_cache_dir,
+        contribution_cache_size=contribution_cache_size,
+        energy_bands=energy_bands,
+        checkpoint_pointings=checkpoint_pointings,
+        checkpoint_seconds=checkpoint_seconds,
+    )
+
+    all_level_mosaics = _mosaic_pyramid_levels(
+        outventory_file,
+        time_bins,
+        binning_timedeltas[1:],
+        catalog_file=catalog_file,
+        recalc=recalc,
+        nprocs=nprocs,
+        accumulator_type=accumulator_type,
+        grid_set=grid_set,
+        compression=compression,
+        energy_bands=energy_bands,
+    )
 
-package_data_dir = Path(__file__).parent.joinpath("data")
-files = sorted(package_data_dir.glob("*_ZEA.img"))
-# the 2*_nskyimg is for the fact that we need skyfacets for RA and for Dec
-if len(files) < 2 * _nskyimg:
-    print("Initalizing the BatAnalysis package")
-    make_skygrids()
-    print("Completed initalizing the package")
+    return [finest_mosaics] + all_level_mosaics, total_mosaic
@@ -21,9 +21,12 @@ from .batlib import (
 from .batlib import combine_survey_lc as serial_combine_survey_lc
 from .bat_survey import MosaicBatSurvey, BatSurvey
 from .mosaic import (
+    RunningTotalMosaic,
+    group_outventory,
     _mosaic_loop,
-    merge_mosaics,
-    finalize_mosaic,
+    _mosaic_pyramid_levels,
+    _time_bin_paths,
+    _total_mosaic_dirname,
     read_correctionsmap,
     read_skygrids,
 )
@@ -345,6 +348,61 @@ def batspectrum_analysis(
         return obs
 
 
+def _mosaic_time_bin_group(
+    outventory_file,
+    time_bins,
+    corrections_map,
+    ra_skygrid,
+    dec_skygrid,
+    survey_list,
+    partial_dir,
+    **kwargs,
+):
+    """
+    Calculates the mosaic images of a group of time bins in a single process and sums them into a running total that is
+    saved as memory mapped arrays. batmosaic_analysis combines the running totals of all the groups into the total
+    mosaic images so the intermediate mosaic images of the time bins do not need to be read back from disk.
+
+    :param outventory_file: Path object of the outventory file
+    :param time_bins: list of tuples of the start time, end time and the grouped outventory data (or None) of each time
+        bin in the group
+    :param corrections_map: numpy array with the energy dependent off-axis corrections map
+    :param ra_skygrid: numpy array of the skygrid facets' RA values in degrees
+    :param dec_skygrid: numpy array of the skygrid facets' DEC values in degrees
+    :param survey_list: list of BAT survey objects that should have been used to create the full outventory file
+    :param partial_dir: Path object of the directory where the running total of the group is saved
+    :param kwargs: the other parameters that are passed to _mosaic_loop
+    :return: list of the MosaicBatSurvey objects (or None) of each time bin and the list of the time bins that were
+        summed into the running total (see the RunningTotalMosaic class)
+    """
+    running_total = RunningTotalMosaic(
+        ra_skygrid.shape,
+        accumulator_type="memmap",
+        directory=partial_dir,
+        energy_bands=kwargs.get("energy_bands"),
+    )
+
+    all_mosaic_survey = [
+        _mosaic_loop(
+            outventory_file,
+            start,
+            end,
+            corrections_map,
+            ra_skygrid,
+            dec_skygrid,
+            survey_list,
+            grouped_outventory_data=data,
+            total_mosaic=running_total,
+            **kwargs,
+        )
+        for start, end, data in time_bins
+    ]
+
+    running_total.accumulator.flush()
+
+    return all_mosaic_survey, running_total.time_bins
+
+
 def batmosaic_analysis(
     batsurvey_obs_list,
     outventory_file,
@@ -354,6 +412,19 @@ def batmosaic_analysis(
     total_mosaic_savedir=None,
     recalc=False,
     nprocs=1,
+    weight_cache_dir=None,
+    weight_cache_size=20,
+    accumulator_type="float64",
+    chunk_size=None,
+    outventory_index=None,
+    grid_set="standard",
+    prefetch_depth=2,
+    compression=None,
+    contribution_cache_dir=None,
+    contribution_cache_size=0,
+    energy_bands=None,
+    checkpoint_pointings=None,
+    checkpoint_seconds=None,
 ):
     """
     Calculates the mosaic images in parallel.
@@ -370,12 +441,47 @@ def batmosaic_analysis(
         a single object.
     :param total_mosaic_savedir: Default None or a Path object that denotes the directory that the total
         "time-integrated" images will be saved to. The default is to place the total mosaic image in a directory
-        called "total_mosaic" located in the same directory as the outventory file.
+        called "total_mosaic" (or "total_mosaic_<grid_set>" for grid sets other than "standard") located in the same
+        directory as the outventory file.
     :param recalc: Boolean False by default. If this calculation was done previously, do not try to load the results of
         prior calculations. Instead recalculate the mosaiced images. The default, will cause the function to try to load
         a save file to save on computational time.
     :param nprocs: The number of processes that will be run simulaneously. This number should not be larger than the
         number of CPUs that a user has available to them.
+    :param weight_cache_dir: Default None or a Path object of the directory where the interpolation weights of each
+        pointing are cached (see the InterpWeightCache class). The default is to use a directory called
+        "interp_weight_cache" located in the same directory as the outventory file.
+    :param weight_cache_size: float, default 20, of the maximum size of the interpolation weight cache in GB. Setting
+        this to 0 turns off the caching of the interpolation weights.
+    :param accumulator_type: string of the type of arrays that the mosaic images are summed into (see the
+        MosaicAccumulator class). This can be "float64" (the default), "float32" which uses half the memory, or "memmap"
+        which saves the arrays to disk in the directory of each time bin's mosaic images. Using "float32" or "memmap"
+        reduces the memory that each process needs when nprocs>1, as does "tiled" for time bins with few pointings
+        (see create_mosaics).
+    :param chunk_size: Default None or an int of the number of pointings in each chunk of a time bin that is summed
+        separately and then combined with a pairwise tree reduction (see _mosaic_loop). When there are fewer time bins
+        than nprocs, the remaining processes are used to sum the chunks of each time bin. The results are identical for
+        any value of nprocs. The default is to sum all the pointings of a time bin in a single chunk.
+    :param outventory_index: Default None or an OutventoryIndex object of the outventory file. If this is passed in,
+        the observations of each time bin are selected from it instead of being read from the grouped outventory files,
+        which then do not need to be written by group_outventory.
+    :param grid_set: string, default "standard", of the name of the set of skygrids that the mosaic images are made on
+        (see create_mosaics). The "quicklook" set can be used to calculate low resolution mosaic images quickly.
+    :param prefetch_depth: int, default 2, of the number of pointings whose images are read in background threads
+        ahead of the pointing that is being reprojected in each process (see PointingPrefetcher).
+    :param compression: None (the default) or a string of the tile compression of the mosaic images, "rice" or "gzip"
+        (see create_mosaics).
+    :param contribution_cache_dir: Default None or a Path object of the directory where the reprojected contribution of
+        each pointing is cached (see create_mosaics).
+    :param contribution_cache_size: float, default 0, of the maximum size of the cache of the reprojected contributions
+        of the pointings in GB (see create_mosaics). The default turns off this cache.
+    :param energy_bands: None or a list of ints of the indexes of the mosaic energy bins that are calculated, where 0-7
+        are the survey energy bands and 8 is the total 14-195 keV band (see create_mosaics). The default is all of them.
+    :param checkpoint_pointings: Default None or an int of the number of pointings that are summed between checkpoints
+        of the partial sums of each time bin (see create_mosaics). To resume an interrupted calculation from the
+        checkpoints, call this function again with recalc=False since recalc=True clears the time bin directories.
+    :param checkpoint_seconds: Default None or a float of the number of seconds between the checkpoints of each time
+        bin (see create_mosaics).
     :return:
     """
 
@@ -384,9 +490,10 @@ def batmosaic_analysis(
     # make sure its a path object
     outventory_file = Path(outventory_file)
 
-    # get the corections map and the skygrids
-    corrections_map = read_correctionsmap()
-    ra_skygrid, dec_skygrid = read_skygrids()
+    # get the corections map and the skygrids, these are memory mapped so joblib passes each process a reference to the
+    # files instead of a copy of the arrays
+    corrections_map = read_correctionsmap(mmap=True)
+    ra_skygrid, dec_skygrid = read_skygrids(mmap=True, grid_set=grid_set)
 
     # determine format of the time_bins, ie an astropy Time array or a list of astropy Time arrays
     # no error checking here since it should be taken care of in group_outventory function
@@ -398,6 +505,7 @@ def batmosaic_analysis(
         # get the lower and upper time limits
         start_t = time_bins[:-1]
         end_t = time_bins[1:]
+        edges = list(zip(start_t, end_t))
     else:
         start = []
         end = []
@@ -407,34 +515,111 @@ def batmosaic_analysis(
 
         start_t = Time(start)
         end_t = Time(end)
+        edges = [(i[0, :], i[1, :]) for i in time_bins]
+
+    # get the outventory rows of each time bin if they are not going to be read from the grouped outventory files
+    if outventory_index is not None:
+        grouped_outventory_data = [outventory_index.time_bin(*i) for i in edges]
+    else:
+        grouped_outventory_data = [None] * len(edges)
 
     if recalc:
         # make sure that the time bins are cleared
         for i in start_t:
-            binned_savedir = outventory_file.parent.joinpath(
-                f"mosaic_{i.datetime64.astype('datetime64[D]')}"
-            )
-            if not binned_savedir.exists():
-                binned_savedir = outventory_file.parent.joinpath(
-                    f"mosaic_{i.mjd}"
-                )
-
+            binned_savedir = _time_bin_paths(outventory_file, i, grid_set=grid_set)[1]
             dirtest(binned_savedir)
 
-    all_mosaic_survey = Parallel(n_jobs=nprocs)(
-        delayed(_mosaic_loop)(
-            outventory_file,
-            start,
-            end,
-            corrections_map,
-            ra_skygrid,
-            dec_skygrid,
-            batsurvey_obs_list,
-            recalc=recalc,
-            verbose=True,
+    # see if the total mosaic has been created and saved (ie there is a .batsurvey file in that directory) if there
+    # isnt, or if we set recalc=True, then the images of each time bin are added to a running total as they are
+    # computed. The time bin directories are located in the same directory as the outventory file
+    if total_mosaic_savedir is None:
+        total_mosaic_savedir = outventory_file.parent.joinpath(_total_mosaic_dirname(grid_set))
+    else:
+        total_mosaic_savedir = Path(total_mosaic_savedir)
+
+    calc_total_mosaic = compute_total_mosaic and (
+        not total_mosaic_savedir.joinpath("batsurvey.pickle").exists() or recalc
+    )
+
+    # the processes that are not needed for the time bins are used to sum the pointings within each time bin
+    bin_nprocs = max(1, nprocs // len(start_t))
+
+    mosaic_kwargs = dict(
+        recalc=recalc,
+        verbose=True,
+        weight_cache_dir=weight_cache_dir,
+        weight_cache_size=weight_cache_size,
+        accumulator_type=accumulator_type,
+        nprocs=bin_nprocs,
+        chunk_size=chunk_size,
+        grid_set=grid_set,
+        prefetch_depth=prefetch_depth,
+        compression=compression,
+        contribution_cache_dir=contribution_cache_dir,
+        contribution_cache_size=contribution_cache_size,
+        energy_bands=energy_bands,
+        checkpoint_pointings=checkpoint_pointings,
+        checkpoint_seconds=checkpoint_seconds,
+    )
+    time_bin_list = list(zip(start_t, end_t, grouped_outventory_data))
+
+    if calc_total_mosaic:
+        dirtest(total_mosaic_savedir)
+
+        # each process calculates an interleaved group of the time bins and sums them into its own running total, the
+        # running totals of the groups are then added together here
+        ngroups = min(nprocs, len(time_bin_list))
+        partial_dirs = [total_mosaic_savedir.joinpath(f".accumulator_group_{i}") for i in range(ngroups)]
+        all_group_results = Parallel(n_jobs=nprocs)(
+            delayed(_mosaic_time_bin_group)(
+                outventory_file,
+                time_bin_list[i::ngroups],
+                corrections_map,
+                ra_skygrid,
+                dec_skygrid,
+                batsurvey_obs_list,
+                partial_dirs[i],
+                **mosaic_kwargs,
+            )
+            for i in range(ngroups)
         )
-        for start, end in zip(start_t, end_t)
-    )  # i in range(len(start_t)))
+
+        running_total = RunningTotalMosaic(
+            ra_skygrid.shape,
+            accumulator_type=accumulator_type,
+            directory=total_mosaic_savedir.joinpath(".accumulators"),
+            energy_bands=energy_bands,
+        )
+        all_mosaic_survey = [None] * len(time_bin_list)
+        for i, (group_mosaic_survey, group_time_bins) in enumerate(all_group_results):
+            # put the mosaic objects back in the order of the time bins
+            all_mosaic_survey[i::ngroups] = group_mosaic_survey
+
+            partial_total = RunningTotalMosaic(
+                ra_skygrid.shape,
+                accumulator_type="memmap",
+                directory=partial_dirs[i],
+                mode="r+",
+                time_bins=group_time_bins,
+                energy_bands=energy_bands,
+            )
+            running_total.merge(partial_total)
+            partial_total.close()
+    else:
+        all_mosaic_survey = Parallel(n_jobs=nprocs)(
+            delayed(_mosaic_loop)(
+                outventory_file,
+                start,
+                end,
+                corrections_map,
+                ra_skygrid,
+                dec_skygrid,
+                batsurvey_obs_list,
+                grouped_outventory_data=data,
+                **mosaic_kwargs,
+            )
+            for start, end, data in time_bin_list
+        )  # i in range(len(start_t)))
 
     final_mosaics = [i for i in all_mosaic_survey if i is not None]
 
@@ -444,28 +629,14 @@ def batmosaic_analysis(
             i.detect_sources(catalog_file=catalog_file)
             i.save()
 
-    intermediate_mosaic_dir_list = [i.result_dir for i in final_mosaics]
-
     if compute_total_mosaic:
-        # see if the total mosaic has been created and saved (ie there is a .batsurvey file in that directory) if there
-        # isnt, then do the full calculation or if we set recalc=True then also do the full calculation
-        if total_mosaic_savedir is None:
-            total_mosaic_savedir = intermediate_mosaic_dir_list[0].parent.joinpath(
-                "total_mosaic"
-            )
-        else:
-            total_mosaic_savedir = Path(total_mosaic_savedir)
+        if calc_total_mosaic:
+            # write the full 'time integrated' images from the running total, along with the final files with proper
+            # units
+            running_total.write(total_mosaic_savedir, compression=compression)
+            running_total.close()
 
-        if not total_mosaic_savedir.joinpath("batsurvey.pickle").exists() or recalc:
-            # merge all the mosaics together to get the full 'time integrated' images and convert to final files with
-            # proper units
-            total_dir = merge_mosaics(
-                intermediate_mosaic_dir_list, savedir=total_mosaic_savedir
-            )
-            finalize_mosaic(total_dir)
-            total_mosaic = MosaicBatSurvey(total_dir)
-        else:
-            total_mosaic = MosaicBatSurvey(total_mosaic_savedir)
+        total_mosaic = MosaicBatSurvey(total_mosaic_savedir)
 
         # if batcelldetect hasnt been run yet do so
         if not total_mosaic.result_dir.joinpath("sources_tot.cat").exists():
@@ -476,6 +647,139 @@ def batmosaic_analysis(
     else:
         return final_mosaics
 
+
+def batmosaic_pyramid_analysis(
+    batsurvey_obs_list,
+    outventory_file,
+    binning_timedeltas,
+    start_datetime=None,
+    end_datetime=None,
+    catalog_file=None,
+    compute_total_mosaic=True,
+    total_mosaic_savedir=None,
+    recalc=False,
+    nprocs=1,
+    weight_cache_dir=None,
+    weight_cache_size=20,
+    accumulator_type="float64",
+    chunk_size=None,
+    grid_set="standard",
+    prefetch_depth=2,
+    compression=None,
+    contribution_cache_dir=None,
+    contribution_cache_size=0,
+    energy_bands=None,
+    checkpoint_pointings=None,
+    checkpoint_seconds=None,
+):
+    """
+    Calculates the mosaic images of a hierarchy of time bins, such as daily, weekly, monthly and yearly time bins, in
+    parallel. The finest time bins are calculated from the BAT survey pointings with batmosaic_analysis and the time bins
+    of each coarser level are created by summing the finer time bins that they contain (see create_mosaic_pyramid).
+
+    :param batsurvey_obs_list: The list of BATSurvey objects that correpond to the observations listed in the
+        outventory file parameter
+    :param outventory_file: Path object of the outventory file that contains all the BAT survey observations that will
+        be used to create the mosaiced images.
+    :param binning_timedeltas: list of the numpy timedelta64 of the widths of the time bins of each level, ordered from
+        the finest to the coarsest, e.g. [np.timedelta64(1, "D"), np.timedelta64(7, "D"), np.timedelta64(1, "M"),
+        np.timedelta64(1, "Y")]
+    :param start_datetime: Default None or an astropy Time object of the start of the finest time bins (see
+        group_outventory)
+    :param end_datetime: Default None or an astropy Time object of the end of the finest time bins (see
+        group_outventory)
+    :param catalog_file: A Path object of the catalog file that should be used to identify sources in the mosaic images.
+        This will default to using the catalog file that is included with the BatAnalysis package.
+    :param compute_total_mosaic: Default True, set to False to skip the computation of the total mosaic and return
+        a single object.
+    :param total_mosaic_savedir: Default None or a Path object that denotes the directory that the total
+        "time-integrated" images will be saved to (see batmosaic_analysis).
+    :param recalc: Boolean False by default. If this calculation was done previously, do not try to load the results of
+        prior calculations. Instead recalculate the mosaiced images of every level.
+    :param nprocs: The number of processes that will be run simulaneously. This number should not be larger than the
+        number of CPUs that a user has available to them.
+    :param weight_cache_dir: Default None or a Path object of the directory where the interpolation weights of each
+        pointing are cached (see the InterpWeightCache class).
+    :param weight_cache_size: float, default 20, of the maximum size of the interpolation weight cache in GB.
+    :param accumulator_type: string of the type of arrays that the mosaic images are summed into (see
+        batmosaic_analysis)
+    :param chunk_size: Default None or an int of the number of pointings in each chunk of a time bin (see
+        batmosaic_analysis)
+    :param grid_set: string, default "standard", of the name of the set of skygrids that the mosaic images are made on
+        (see create_mosaics).
+    :param prefetch_depth: int, default 2, of the number of pointings whose images are read in background threads
+        ahead of the pointing that is being reprojected in each process (see PointingPrefetcher).
+    :param compression: None (the default) or a string of the tile compression of the mosaic images, "rice" or "gzip"
+        (see create_mosaics).
+    :param contribution_cache_dir: Default None or a Path object of the directory where the reprojected contribution of
+        each pointing is cached (see create_mosaics).
+    :param contribution_cache_size: float, default 0, of the maximum size of the cache of the reprojected contributions
+        of the pointings in GB (see create_mosaics). The default turns off this cache.
+    :param energy_bands: None or a list of ints of the indexes of the mosaic energy bins that are calculated for every
+        level (see create_mosaics). The default is all of them.
+    :param checkpoint_pointings: Default None or an int of the number of pointings that are summed between the
+        checkpoints of each of the finest time bins (see batmosaic_analysis).
+    :param checkpoint_seconds: Default None or a float of the number of seconds between the checkpoints of each of the
+        finest time bins (see batmosaic_analysis).
+    :return: a list with a list of MosaicBatSurvey objects of the time bins of each level in binning_timedeltas, and a
+        single MosaicBatSurvey of the total mosaic if compute_total_mosaic is True
+    """
+    # make sure its a path object
+    outventory_file = Path(outventory_file)
+
+    time_bins = group_outventory(
+        outventory_file,
+        binning_timedeltas[0],
+        start_datetime=start_datetime,
+        end_datetime=end_datetime,
+        recalc=recalc,
+    )
+
+    finest_results = batmosaic_analysis(
+        batsurvey_obs_list,
+        outventory_file,
+        time_bins,
+        catalog_file=catalog_file,
+        compute_total_mosaic=compute_total_mosaic,
+        total_mosaic_savedir=total_mosaic_savedir,
+        recalc=recalc,
+        nprocs=nprocs,
+        weight_cache_dir=weight_cache_dir,
+        weight_cache_size=weight_cache_size,
+        accumulator_type=accumulator_type,
+        chunk_size=chunk_size,
+        grid_set=grid_set,
+        prefetch_depth=prefetch_depth,
+        compression=compression,
+        contribution_cache_dir=contribution_cache_dir,
+        contribution_cache_size=contribution_cache_size,
+        energy_bands=energy_bands,
+        checkpoint_pointings=checkpoint_pointings,
+        checkpoint_seconds=checkpoint_seconds,
+    )
+    if compute_total_mosaic:
+        finest_mosaics, total_mosaic = finest_results
+    else:
+        finest_mosaics = finest_results
+
+    all_level_mosaics = _mosaic_pyramid_levels(
+        outventory_file,
+        time_bins,
+        binning_timedeltas[1:],
+        catalog_file=catalog_file,
+        recalc=recalc,
+        nprocs=nprocs,
+        accumulator_type=accumulator_type,
+        grid_set=grid_set,
+        compression=compression,
+        energy_bands=energy_bands,
+    )
+
+    if compute_total_mosaic:
+        return [finest_mosaics] + all_level_mosaics, total_mosaic
+    else:
+        return [finest_mosaics] + all_level_mosaics
+
 """
 def download_swiftdata(table,  reload=False,
                         bat=True, auxil=True, log=False, uvot=False, xrt=False,
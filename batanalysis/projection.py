@@ -0,0 +1,340 @@
+"""
+This file contains a vectorized implementation of the zenithal equal area (ZEA) and gnomonic (TAN) projections that are
+used by the BAT survey images and the mosaic skygrids. The pixel coordinates are converted to/from unit vectors with the
+rotation matrices of the projection so no astropy WCS or SkyCoord objects need to be created on the mosaic hot path.
+"""
+import numpy as np
+from astropy.coordinates import SkyCoord
+
+# the number of coordinates that are projected at a time, this limits the size of the temporary arrays
+_chunk_size = 1 << 20
+
+# the projections that are implemented
+_projections = ["ZEA", "TAN"]
+
+# keywords of distortions or projection parameters that are not implemented, headers with these keywords need to use
+# astropy WCS
+_unsupported_keywords = ["A_ORDER", "B_ORDER", "CPDIS1", "CPDIS2", "D2IMDIS1", "D2IMDIS2", "DP1", "DP2"]
+
+# the rotation matrix from galactic to FK5 (J2000) unit vectors, this is calculated the first time that it is needed
+_gal2fk5 = None
+
+
+def _galactic_to_fk5_matrix():
+    """
+    Gets the rotation matrix that converts galactic unit vectors to FK5 (J2000) unit vectors. The columns of the matrix
+    are the FK5 unit vectors of the galactic x, y, and z axes, as calculated by astropy.
+
+    :return: numpy array of the 3x3 rotation matrix
+    """
+    global _gal2fk5
+
+    if _gal2fk5 is None:
+        _gal2fk5 = SkyCoord(
+            l=[0.0, 90.0, 0.0], b=[0.0, 0.0, 90.0], frame="galactic", unit="deg"
+        ).fk5.cartesian.xyz.value
+
+    return _gal2fk5
+
+
+def _native2celestial_rotation(lon, lat, lonpole=180.0):
+    """
+    Creates the rotation matrices from the native spherical coordinates of zenithal projections to the celestial
+    coordinates of the projections.
+
+    :param lon: numpy array of the celestial longitudes of the reference points of the projections in degrees
+    :param lat: numpy array of the celestial latitudes of the reference points of the projections in degrees
+    :param lonpole: float or numpy array of the native longitudes of the celestial pole in degrees (LONPOLE)
+    :return: numpy array of the rotation matrices with a shape of (len(lon), 3, 3)
+    """
+    lon = np.deg2rad(np.atleast_1d(lon))
+    lat = np.deg2rad(np.atleast_1d(lat))
+    phi = np.deg2rad(180 - np.broadcast_to(lonpole, lon.shape))
+
+    zeros = np.zeros_like(lon)
+    ones = np.ones_like(lon)
+
+    def rot_z(angle):
+        return np.array(
+            [[np.cos(angle), -np.sin(angle), zeros], [np.sin(angle), np.cos(angle), zeros], [zeros, zeros, ones]]
+        )
+
+    # this rotates the native coordinates so the celestial pole is at the native longitude of LONPOLE, then rotates the
+    # native pole onto the reference point, about the y axis by 90-lat and then about the z axis by lon
+    rot_lat = np.array(
+        [[np.sin(lat), zeros, np.cos(lat)], [zeros, ones, zeros], [-np.cos(lat), zeros, np.sin(lat)]]
+    )
+
+    return np.einsum("ijn,jkn,kln->nil", rot_z(lon), rot_lat, rot_z(phi))
+
+
+class Projection(object):
+    """
+    A ZEA or TAN projection of an image, defined by the astrometric keywords of the image header. This reproduces the
+    pixel <-> world coordinate conversions of astropy's WCS.wcs_pix2world/wcs_world2pix for these projections.
+
+    Attributes
+    ---------------
+    projection : string
+        The projection code, either "ZEA" or "TAN"
+    frame : string
+        The coordinate frame of the header, either "equatorial" or "galactic"
+    crpix : numpy array
+        The reference pixel (1-based, as in the header)
+    crval : numpy array
+        The world coordinates of the reference pixel in degrees
+    lonpole : float
+        The native longitude of the celestial pole in degrees
+    linear : numpy array
+        The 2x2 matrix that converts pixel offsets from the reference pixel to intermediate world coordinates in
+        degrees, which includes CDELTi and PCi_j, CDi_j or CROTA2
+    rotation : numpy array
+        The 3x3 rotation matrix from native unit vectors to the unit vectors of the world coordinates. If fk5=True, the
+        world coordinates are FK5 for galactic headers
+
+    Methods
+    ---------------
+    supports(header):
+        Checks if the header can be handled by the Projection class
+    pix2vec(x, y, origin=0):
+        Converts pixel coordinates to world unit vectors
+    vec2pix(vec, origin=0):
+        Converts world unit vectors to pixel coordinates
+    pix2world(x, y, origin=0):
+        Converts pixel coordinates to world coordinates in degrees
+    world2pix(lon, lat, origin=0):
+        Converts world coordinates in degrees to pixel coordinates
+    """
+
+    def __init__(self, header, fk5=False):
+        """
+        Initializer method for the Projection object.
+
+        :param header: The astropy header with the astrometric keywords of the image
+        :param fk5: Boolean False by default. If True, the world coordinates of galactic headers are FK5 RA/DEC instead of
+            galactic longitude/latitude.
+        """
+        if not self.supports(header):
+            raise ValueError(
+                f"The header with CTYPE1={header.get('CTYPE1')} and CTYPE2={header.get('CTYPE2')} is not a supported "
+                f"projection. The supported projections are {_projections}."
+            )
+
+        ctype1 = header["CTYPE1"]
+        self.projection = ctype1[5:8]
+        if ctype1.startswith("GLON"):
+            self.frame = "galactic"
+        else:
+            self.frame = "equatorial"
+
+        self.crpix = np.array([header["CRPIX1"], header["CRPIX2"]], dtype=np.float64)
+        self.crval = np.array([header["CRVAL1"], header["CRVAL2"]], dtype=np.float64)
+
+        # the default LONPOLE of zenithal projections depends on if the reference point is the celestial pole
+        self.lonpole = float(header.get("LONPOLE", 0.0 if self.crval[1] >= 90 else 180.0))
+
+        # get the linear transformation from pixel offsets to intermediate world coordinates
+        if "CD1_1" in header:
+            self.linear = np.array(
+                [
+                    [header.get("CD1_1", 0.0), header.get("CD1_2", 0.0)],
+                    [header.get("CD2_1", 0.0), header.get("CD2_2", 0.0)],
+                ],
+                dtype=np.float64,
+            )
+        else:
+            cdelt = np.array([header.get("CDELT1", 1.0), header.get("CDELT2", 1.0)], dtype=np.float64)
+            if "CROTA2" in header and not any(f"PC{i}_{j}" in header for i in [1, 2] for j in [1, 2]):
+                crota = np.deg2rad(header["CROTA2"])
+                pc = np.array(
+                    [
+                        [np.cos(crota), -np.sin(crota) * cdelt[1] / cdelt[0]],
+                        [np.sin(crota) * cdelt[0] / cdelt[1], np.cos(crota)],
+                    ]
+                )
+            else:
+                pc = np.array(
+                    [
+                        [header.get("PC1_1", 1.0), header.get("PC1_2", 0.0)],
+                        [header.get("PC2_1", 0.0), header.get("PC2_2", 1.0)],
+                    ],
+                    dtype=np.float64,
+                )
+            self.linear = cdelt[:, np.newaxis] * pc
+        self._inverse_linear = np.linalg.inv(self.linear)
+
+        self.rotation = _native2celestial_rotation(self.crval[0], self.crval[1], self.lonpole)[0]
+        if fk5 and self.frame == "galactic":
+            self.rotation = _galactic_to_fk5_matrix() @ self.rotation
+            self._lon_reference = 0.0
+        else:
+            self._lon_reference = self.crval[0]
+
+    @staticmethod
+    def supports(header):
+        """
+        Checks if the header uses one of the projections that are implemented, without any distortions.
+
+        :param header: The astropy header with the astrometric keywords of the image
+        :return: Boolean that is True if the Projection class can be used for the header
+        """
+        ctype1 = str(header.get("CTYPE1", ""))
+        ctype2 = str(header.get("CTYPE2", ""))
+
+        if header.get("WCSAXES", header.get("NAXIS", 2)) != 2 or len(ctype1) != 8 or len(ctype2) != 8:
+            return False
+        if ctype1[5:8] not in _projections or ctype1[5:8] != ctype2[5:8]:
+            return False
+        if (ctype1[:4], ctype2[:4]) not in [("RA--", "DEC-"), ("GLON", "GLAT")]:
+            return False
+        if any(i in header for i in _unsupported_keywords) or any(
+            i.startswith("PV") or i.startswith("PS") for i in header.keys()
+        ):
+            return False
+
+        return True
+
+    def _native_vec(self, x, y):
+        """
+        Converts intermediate world coordinates, in degrees, to native unit vectors.
+
+        :param x: numpy array of the intermediate world x coordinates
+        :param y: numpy array of the intermediate world y coordinates
+        :return: numpy array of the native unit vectors with shape (len(x), 3)
+        """
+        # the native longitude is given by atan2(x, -y) and the native latitude depends on the distance from the
+        # reference point, r, so the unit vector is (-y*k, x*k, sin(theta)) where k=cos(theta)/r
+        x = np.deg2rad(x)
+        y = np.deg2rad(y)
+        r2 = x * x + y * y
+
+        if self.projection == "ZEA":
+            # r=2*sin((90-theta)/2) so sin(theta)=1-r^2/2 and k=sqrt(1-r^2/4), points beyond r=2 are not on the sky
+            s2 = r2 / 4
+            with np.errstate(invalid="ignore"):
+                k = np.sqrt(np.where(s2 <= 1, 1 - s2, np.nan))
+            z = 1 - 2 * s2
+        else:
+            # r=cot(theta) so the unit vector is proportional to (-y, x, 1)
+            k = 1 / np.sqrt(1 + r2)
+            z = k
+
+        return np.stack((-y * k, x * k, z), axis=-1)
+
+    def _native_xy(self, vec):
+        """
+        Converts native unit vectors to intermediate world coordinates in degrees.
+
+        :param vec: numpy array of the native unit vectors with shape (n, 3)
+        :return: numpy arrays of the intermediate world x and y coordinates
+        """
+        with np.errstate(invalid="ignore", divide="ignore"):
+            if self.projection == "ZEA":
+                k = np.sqrt(2 / (1 + vec[:, 2]))
+            else:
+                # points on the far hemisphere can not be projected
+                k = np.where(vec[:, 2] > 0, 1 / vec[:, 2], np.nan)
+
+        return np.rad2deg(vec[:, 1] * k), np.rad2deg(-vec[:, 0] * k)
+
+    def pix2vec(self, x, y, origin=0):
+        """
+        Converts pixel coordinates to world unit vectors.
+
+        :param x: numpy array of pixel x coordinates
+        :param y: numpy array of pixel y coordinates
+        :param origin: int, default 0, of the coordinate of the first pixel (0 or 1)
+        :return: numpy array of the unit vectors with shape (x.shape, 3)
+        """
+        x = np.asarray(x, dtype=np.float64)
+        y = np.asarray(y, dtype=np.float64)
+        flat_x = x.reshape(-1)
+        flat_y = y.reshape(-1)
+        vec = np.empty((flat_x.size, 3))
+
+        for i in range(0, flat_x.size, _chunk_size):
+            chunk = slice(i, i + _chunk_size)
+
+            # the offsets from the reference pixel, which is 1-based
+            dx = flat_x[chunk] + (1 - origin) - self.crpix[0]
+            dy = flat_y[chunk] + (1 - origin) - self.crpix[1]
+            native_x = self.linear[0, 0] * dx + self.linear[0, 1] * dy
+            native_y = self.linear[1, 0] * dx + self.linear[1, 1] * dy
+
+            vec[chunk] = self._native_vec(native_x, native_y) @ self.rotation.T
+
+        return vec.reshape(x.shape + (3,))
+
+    def vec2pix(self, vec, origin=0):
+        """
+        Converts world unit vectors to pixel coordinates.
+
+        :param vec: numpy array of the unit vectors with shape (..., 3)
+        :param origin: int, default 0, of the coordinate of the first pixel (0 or 1)
+        :return: numpy arrays of the pixel x and y coordinates with shape vec.shape[:-1]
+        """
+        vec = np.asarray(vec)
+        flat_vec = vec.reshape(-1, 3)
+        x = np.empty(flat_vec.shape[0])
+        y = np.empty(flat_vec.shape[0])
+
+        for i in range(0, flat_vec.shape[0], _chunk_size):
+            chunk = slice(i, i + _chunk_size)
+
+            native_x, native_y = self._native_xy(flat_vec[chunk] @ self.rotation)
+            x[chunk] = self._inverse_linear[0, 0] * native_x + self._inverse_linear[0, 1] * native_y
+            y[chunk] = self._inverse_linear[1, 0] * native_x + self._inverse_linear[1, 1] * native_y
+
+        x += self.crpix[0] - (1 - origin)
+        y += self.crpix[1] - (1 - origin)
+
+        return x.reshape(vec.shape[:-1]), y.reshape(vec.shape[:-1])
+
+    def pix2world(self, x, y, origin=0):
+        """
+        Converts pixel coordinates to world coordinates.
+
+        :param x: numpy array of pixel x coordinates
+        :param y: numpy array of pixel y coordinates
+        :param origin: int, default 0, of the coordinate of the first pixel (0 or 1)
+        :return: numpy arrays of the world longitude and latitude in degrees
+        """
+        vec = self.pix2vec(x, y, origin=origin)
+
+        lon = np.rad2deg(np.arctan2(vec[..., 1], vec[..., 0]))
+        lat = np.rad2deg(np.arctan2(vec[..., 2], np.hypot(vec[..., 0], vec[..., 1])))
+
+        # the longitudes are in [0, 360) for non-negative reference longitudes and (-360, 0] otherwise, as in wcslib
+        if self._lon_reference >= 0:
+            lon = np.where(lon < 0, lon + 360, lon)
+        else:
+            lon = np.where(lon > 0, lon - 360, lon)
+
+        return lon, lat
+
+    def world2pix(self, lon, lat, origin=0):
+        """
+        Converts world coordinates to pixel coordinates.
+
+        :param lon: numpy array of the world longitudes in degrees
+        :param lat: numpy array of the world latitudes in degrees
+        :param origin: int, default 0, of the coordinate of the first pixel (0 or 1)
+        :return: numpy arrays of the pixel x and y coordinates
+        """
+        lon = np.asarray(lon, dtype=np.float64)
+        lat = np.asarray(lat, dtype=np.float64)
+        flat_lon = np.deg2rad(lon.reshape(-1))
+        flat_lat = np.deg2rad(lat.reshape(-1))
+        x = np.empty(flat_lon.size)
+        y = np.empty(flat_lon.size)
+
+        for i in range(0, flat_lon.size, _chunk_size):
+            chunk = slice(i, i + _chunk_size)
+
+            cos_lat = np.cos(flat_lat[chunk])
+            vec = np.stack(
+                (cos_lat * np.cos(flat_lon[chunk]), cos_lat * np.sin(flat_lon[chunk]), np.sin(flat_lat[chunk])), axis=-1
+            )
+            x[chunk], y[chunk] = self.vec2pix(vec, origin=origin)
+
+        return x.reshape(lon.shape), y.reshape(lat.shape)
@@ -0,0 +1,86 @@
+"""
+Measures how long it takes to import BatAnalysis in a fresh python process, and how long it takes to create and load
+each set of skygrids the first time that they are needed compared to when they have already been cached.
+
+The import times are compared to a baseline import of numpy and astropy.io.fits, which BatAnalysis always needs, so the
+reported overhead is the time that BatAnalysis itself adds and does not depend as much on the speed of the machine.
+
+Usage:
+    python benchmarks/import_time.py [-n NUMBER_OF_REPEATS]
+"""
+import argparse
+import os
+import subprocess
+import sys
+import tempfile
+
+import numpy as np
+
+
+def time_in_subprocess(statement, setup="", env=None):
+    """
+    Times a statement in a new python process so none of the modules are already imported.
+
+    :param statement: string of the python code that is timed
+    :param setup: string of the python code that is run before the timed statement
+    :param env: dict of the environment variables of the process
+    :return: float of the time in seconds that it took to run the statement
+    """
+    code = (
+        "import time\n"
+        f"{setup}\n"
+        "t0 = time.perf_counter()\n"
+        f"{statement}\n"
+        "print(time.perf_counter() - t0)\n"
+    )
+    output = subprocess.run(
+        [sys.executable, "-c", code], env=env, check=True, capture_output=True, text=True
+    )
+    return float(output.stdout.strip().split("\n")[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("-n", type=int, default=5, help="number of times that each measurement is repeated")
+    args = parser.parse_args()
+
+    # the baseline that the import times are compared to
+    baseline_statement = "import numpy; import astropy.io.fits"
+    baseline = np.median([time_in_subprocess(baseline_statement) for i in range(args.n)])
+    print(f"{'baseline: ' + baseline_statement:<50s} median {baseline:.3f} s")
+
+    benchmarks = {
+        "import batanalysis": ("import batanalysis", ""),
+        "import batanalysis; batanalysis.BatSurvey": ("import batanalysis; batanalysis.BatSurvey", ""),
+        "import batanalysis.mosaic": ("import batanalysis.mosaic", ""),
+    }
+
+    for name, (statement, setup) in benchmarks.items():
+        times = [time_in_subprocess(statement, setup) for i in range(args.n)]
+        print(
+            f"{name:<50s} median {np.median(times):.3f} s, min {np.min(times):.3f} s, "
+            f"{np.median(times) - baseline:+.3f} s over the baseline"
+        )
+
+    # time creating the skygrids of each set in an empty cache directory, loading them the first time (which converts
+    # them to the memory mapped format) and then loading them once they have been cached
+    with tempfile.TemporaryDirectory() as cache_dir:
+        env = dict(os.environ, BATANALYSIS_CACHE_DIR=cache_dir)
+        for grid_set in ["quicklook", "standard"]:
+            setup = (
+                "import batanalysis.mosaic as m\n"
+                f"params = m._skygrid_sets[{grid_set!r}]\n"
+                "directory = m._skygrid_cache_dir().joinpath(m._skygrid_key(**params))"
+            )
+            make_time = time_in_subprocess("m.make_skygrids(**params, savedirectory=directory)", setup, env=env)
+            statement = "m._get_skygrid_store(directory).load()"
+            first = time_in_subprocess(statement, setup, env=env)
+            times = [time_in_subprocess(statement, setup, env=env) for i in range(args.n)]
+
+            print(f"{'make_skygrids, ' + grid_set:<50s} {make_time:.3f} s")
+            print(f"{'first skygrid load, ' + grid_set:<50s} {first:.3f} s")
+            print(f"{'cached skygrid load, ' + grid_set:<50s} median {np.median(times):.3f} s, min {np.min(times):.3f} s")
+
+
+if __name__ == "__main__":
+    main()